@@ -4,13 +4,22 @@ import ssl
 import socket
 import json
 import os
-import random
-import string
+import sys
+import time
 from hashlib import sha256
 from Crypto.Cipher import AES, PKCS1_OAEP
 from Crypto.PublicKey import RSA
 from Crypto.Random import get_random_bytes
 from Crypto.Util.number import bytes_to_long, long_to_bytes
+from hedging import LatencyTracker, HedgeBudget, hedged
+
+# The chunk cache is shared with cli/. Appended, so modules in this
+# directory still win over their cli/ namesakes.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "cli"))
+from chunk_cache import ChunkCache
+
+# Chunks fetched from peers are cached here instead of growing the DHT forever.
+chunk_cache = ChunkCache()
 
 
 def compress(data):
@@ -46,18 +55,24 @@ def decrypt_key_with_rsa(priv_key, enc_key):
   decrypted = pow(num, priv_key.e, priv_key.n)
   return long_to_bytes(decrypted)
 
-def request_chunk_from_peer(ip, port, chunk_hash):
+def request_chunk_from_peer(ip, port, chunk_hash, timeout=5.0):
   try:
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-      s.connect((ip, int(port)))
-      s.send(chunk_hash.encode())
-      return s.recv(65536)
+    with socket.create_connection((ip, int(port)), timeout=timeout) as s:
+      s.sendall(chunk_hash.encode())
+      # The peer sends the chunk and closes, so read until EOF.
+      data = b""
+      while True:
+        part = s.recv(65536)
+        if not part:
+          break
+        data += part
+      return data or None
   except Exception as e:
     print(f"❌ Failed to fetch {chunk_hash} from {ip}:{port} – {e}")
     return None
 
 def generate_dummy_data(size=128):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=size)).encode()
+    return os.urandom(size)
 
 def chunk_and_encrypt(filepath, add_decoys=True):
     with open(filepath, "rb") as f:
@@ -102,21 +117,54 @@ def chunk_and_encrypt(filepath, add_decoys=True):
 
     return key, manifest
 
-def decrypt_and_reconstruct(manifest, key, dht, output_path):
+def fetch_from_peers(peers, chunk_hash, tracker=None, budget=None):
+    # Try peers fastest-first; every outcome feeds back into the peer table so
+    # dead peers drop out of the ranking after one failed request. A peer that
+    # is slower than the observed p95 gets a hedged duplicate to the next one.
+    tried = set()
+
+    def attempt(addr):
+        start = time.perf_counter()
+        chunk_data = request_chunk_from_peer(addr[0], addr[1], chunk_hash, timeout=peers.timeout_for(addr))
+        if chunk_data:
+            peers.record_success(addr, time.perf_counter() - start)
+            return chunk_data
+        peers.record_failure(addr)
+        return None
+
+    def attempts():
+        while True:
+            # Re-rank before each attempt: other threads may have just found a
+            # peer dead, and it should be skipped here too.
+            candidates = [a for a in peers.ranked() if a not in tried]
+            if not candidates:
+                return
+            tried.add(candidates[0])
+            yield lambda addr=candidates[0]: attempt(addr)
+
+    if tracker is None:
+        for fetch in attempts():
+            chunk_data = fetch()
+            if chunk_data:
+                return chunk_data
+        return None
+    return hedged(attempts(), tracker, budget)
+
+def decrypt_and_reconstruct(manifest, key, dht, output_path, peers=None, hedge_ratio=0.1):
     import threading
-    from p2p_node import peer_node  # import here to avoid circular imports
     sub_chunks = {}
+    tracker = LatencyTracker()
+    budget = HedgeBudget(ratio=hedge_ratio)
+    started = time.perf_counter()
 
     def retrieve_and_decrypt(chunk_hash):
-        # Step 1: Try local DHT first
-        chunk_data = dht.retrieve(chunk_hash)
-        if not chunk_data:
+        # Step 1: Try local DHT first, then chunks previously fetched from peers
+        chunk_data = dht.retrieve(chunk_hash) or chunk_cache.get(chunk_hash)
+        if not chunk_data and peers is not None:
             # Step 2: Ask peers
-            for ip, port in peer_node.peers:
-                chunk_data = request_chunk_from_peer(ip, port, chunk_hash)
-                if chunk_data:
-                    dht.store(chunk_hash, chunk_data)  # cache it locally
-                    break
+            chunk_data = fetch_from_peers(peers, chunk_hash, tracker, budget)
+            if chunk_data:
+                chunk_cache.put(chunk_hash, chunk_data)  # cache it locally
 
         if not chunk_data:
             print(f"[!] Missing chunk: {chunk_hash}")
@@ -146,6 +194,11 @@ def decrypt_and_reconstruct(manifest, key, dht, output_path):
         for chunk_hash in manifest["chunks"]:
             f.write(sub_chunks[chunk_hash])
     print(f"✅ File reconstructed at: {output_path}")
+    if tracker.requests:
+        latency = tracker.summary()
+        print(f"⏱️ Peer chunk latency p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms, "
+              f"p99 {latency['p99'] * 1000:.1f} ms; total {time.perf_counter() - started:.2f}s")
+        print(f"🪁 Hedged requests: {budget.hedges} extra of {budget.primary} ({budget.wins} won)")
 
 def request_manifest_and_key(peer_ip, peer_port, filename):
     os.makedirs("manifest", exist_ok=True)
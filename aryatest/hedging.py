@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Attempts run here so a hedge can start while the first attempt is still blocked.
+pool = ThreadPoolExecutor(max_workers=128)
+
+
+class LatencyTracker:
+  """Latencies in seconds: a rolling window of single attempts, which sets
+  the hedge delay, and every end-to-end request for the summary."""
+
+  def __init__(self, window=1000, hedge_percentile=95, default_delay=0.1, min_samples=20):
+    self.lock = threading.Lock()
+    self.samples = deque(maxlen=window)
+    self.requests = []
+    self.hedge_percentile = hedge_percentile
+    self.default_delay = default_delay
+    self.min_samples = min_samples
+
+  def record(self, seconds):
+    with self.lock:
+      self.samples.append(seconds)
+
+  def record_request(self, seconds):
+    with self.lock:
+      self.requests.append(seconds)
+
+  def percentile(self, pct, samples=None):
+    with self.lock:
+      values = sorted(self.samples if samples is None else samples)
+    if not values:
+      return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+  def hedge_delay(self):
+    # Until there is enough history, hedge after a fixed delay.
+    if len(self.samples) < self.min_samples:
+      return self.default_delay
+    return self.percentile(self.hedge_percentile)
+
+  def summary(self):
+    return {f"p{pct}": self.percentile(pct, self.requests) for pct in (50, 95, 99)}
+
+
+class HedgeBudget:
+  """Caps duplicate requests at `ratio` of primary requests (0.1 = 10% extra load)."""
+
+  def __init__(self, ratio=0.1):
+    self.ratio = ratio
+    self.lock = threading.Lock()
+    self.primary = 0
+    self.hedges = 0
+    self.wins = 0
+
+  def start(self):
+    with self.lock:
+      self.primary += 1
+
+  def allow(self):
+    with self.lock:
+      if self.hedges + 1 > self.ratio * max(self.primary, 1):
+        return False
+      self.hedges += 1
+      return True
+
+  def refund(self):
+    with self.lock:
+      self.hedges -= 1
+
+  def won(self):
+    with self.lock:
+      self.wins += 1
+
+
+def hedged(attempts, tracker, budget):
+  """Run `attempts` (zero-arg callables, best first) with hedging.
+
+  The first attempt starts at once. If it has not answered by the tracker's
+  p95 latency and the budget allows, the next attempt is started as well and
+  whichever returns a result first wins. An attempt that returns None or
+  raises counts as failed, and the next one starts immediately. Losing
+  attempts finish in the background and are ignored. Returns None if every
+  attempt fails.
+  """
+  attempts = iter(attempts)
+  started = {}
+
+  def timed(attempt):
+    # Attempt latency counts from when it runs, not from when it was queued.
+    start = time.perf_counter()
+    result = attempt()
+    if result is not None:
+      tracker.record(time.perf_counter() - start)
+    return result
+
+  def launch():
+    attempt = next(attempts, None)
+    if attempt is None:
+      return False
+    started[pool.submit(timed, attempt)] = time.perf_counter()
+    return True
+
+  budget.start()
+  begin = time.perf_counter()
+  launch()
+  while started:
+    done, _ = wait(started, timeout=tracker.hedge_delay(), return_when=FIRST_COMPLETED)
+    for future in done:
+      launched = started.pop(future)
+      result = None if future.exception() else future.result()
+      if result is not None:
+        tracker.record_request(time.perf_counter() - begin)
+        if launched != min([launched] + list(started.values())):
+          budget.won()  # a hedge beat an earlier attempt
+        return result
+    if not done:
+      if budget.allow() and not launch():
+        budget.refund()  # nobody left to hedge to
+    elif not started:
+      launch()
+  return None
@@ -65,7 +65,7 @@ def download_file():
     aes_key = decrypt_key_with_rsa(pub_key, enc_key)
 
     output_path = os.path.join("output", "RECEIVED_" + manifest["filename"])
-    decrypt_and_reconstruct(manifest, aes_key, dht, output_path)
+    decrypt_and_reconstruct(manifest, aes_key, dht, output_path, peers=peer_node.peers)
 
 
 
@@ -76,7 +76,8 @@ def cli():
         print("2. Download file")
         print("3. Generate RSA Keypair")
         print("4. Connect to Peer")
-        print("5. Exit")
+        print("5. Show server and peer metrics")
+        print("6. Exit")
 
         choice = input("Choose an option: ").strip()
         if choice == "1":
@@ -90,6 +91,12 @@ def cli():
             port = input("Peer Port: ")
             peer_node.connect_to_peer(ip, port)
         elif choice == "5":
+            for name, value in peer_node.metrics().items():
+                print(f"  {name}: {value}")
+            for peer in peer_node.peers.snapshot():
+                print(f"  peer {peer['peer']}: rtt {peer['rtt_ms']} ms, "
+                      f"success {peer['success_rate']:.0%}, failures in a row {peer['failures']}")
+        elif choice == "6":
             break
         else:
             print("Invalid choice.")
@@ -1,49 +1,176 @@
 import threading
 import socket
+import queue
+import time
+import base64
+import logging
+from peer_table import PeerTable
+
+log = logging.getLogger(__name__)
 
 
 class DHT:
-    def __init__(self):
-        self.storage = {}
+    def __init__(self, storage=None):
+        # Any mutable mapping works: a dict, or a persistent store from cli/storage.py
+        self.storage = storage if storage is not None else {}
 
     def store(self, key, value):
         self.storage[key] = value
-        print(f"Stored: {key}")
+        log.debug(f"Stored: {key}")
 
     def retrieve(self, key):
         return self.storage.get(key)
+
+
+HASH_LENGTH = 64  # sha256 hex digest
+
+
+class TokenBucket:
+  """Allows `rate` requests per second with bursts of up to `burst`."""
+
+  def __init__(self, rate, burst):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.updated = time.monotonic()
+
+  def allow(self):
+    now = time.monotonic()
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+    if self.tokens >= 1:
+      self.tokens -= 1
+      return True
+    return False
+
+
 class PeerNode:
-  def __init__(self, dht, host='0.0.0.0', port=5000):
+  """Chunk server for other peers, safe to run as a popular seeder.
+
+  Accepted connections wait in a bounded queue served by a fixed pool of
+  `workers` threads. When the queue is full the accept loop waits up to
+  `admission_wait` seconds (further connections queue in the listen backlog)
+  and then rejects, instead of piling up threads. Each peer IP gets a token
+  bucket of `rate` requests/second with bursts of `burst`. `metrics()`
+  reports queue depth and rejections.
+  """
+
+  def __init__(self, dht, host='0.0.0.0', port=5000, workers=16, backlog=1024,
+               max_queue=256, admission_wait=0.5, rate=500.0, burst=2000,
+               client_timeout=5.0):
     self.dht = dht
-    self.peers = []
+    self.peers = PeerTable()
     self.host = host
     self.port = int(port)
+    self.backlog = backlog
+    self.admission_wait = admission_wait
+    self.rate = rate
+    self.burst = burst
+    self.client_timeout = client_timeout
+    self.queue = queue.Queue(maxsize=max_queue)
+    self.buckets = {}
+    self.stats = {
+      "accepted": 0, "served": 0, "not_found": 0, "errors": 0,
+      "rejected_busy": 0, "rejected_rate": 0, "max_queue_depth": 0,
+    }
+    self.stats_lock = threading.Lock()
+    self.server_socket = None
+    for _ in range(workers):
+      threading.Thread(target=self.worker, daemon=True).start()
     threading.Thread(target=self.run_server, daemon=True).start()
 
+  def count(self, name, n=1):
+    with self.stats_lock:
+      self.stats[name] += n
+
+  def metrics(self):
+    with self.stats_lock:
+      snapshot = dict(self.stats)
+    snapshot["queue_depth"] = self.queue.qsize()
+    snapshot["tracked_peers"] = len(self.buckets)
+    return snapshot
+
+  def admit(self, addr):
+    bucket = self.buckets.get(addr[0])
+    if bucket is None:
+      if len(self.buckets) > 10000:
+        # Forget peers whose buckets have refilled; they start fresh anyway.
+        now = time.monotonic()
+        self.buckets = {ip: b for ip, b in self.buckets.items()
+                        if b.tokens + (now - b.updated) * b.rate < b.burst}
+      bucket = self.buckets[addr[0]] = TokenBucket(self.rate, self.burst)
+    return bucket.allow()
+
   def run_server(self):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind((self.host, self.port))
-    server_socket.listen()
+    server_socket.listen(self.backlog)
+    self.server_socket = server_socket
     print(f"📡 PeerNode server listening on {self.host}:{self.port}")
 
     while True:
-      client_socket, addr = server_socket.accept()
-      threading.Thread(target=self.handle_client, args=(client_socket,), daemon=True).start()
+      try:
+        client_socket, addr = server_socket.accept()
+      except OSError:
+        break  # closed by stop()
+      if not self.admit(addr):
+        self.count("rejected_rate")
+        client_socket.close()
+        continue
+      try:
+        self.queue.put(client_socket, timeout=self.admission_wait)
+      except queue.Full:
+        self.count("rejected_busy")
+        client_socket.close()
+        continue
+      with self.stats_lock:
+        self.stats["accepted"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue.qsize())
+
+  def worker(self):
+    while True:
+      client_socket = self.queue.get()
+      self.handle_client(client_socket)
+
+  def read_hash(self, client_socket):
+    # A request is exactly one hex digest; read until we have all of it
+    # (or the client closes its side) rather than trusting a single recv.
+    data = b""
+    while len(data) < HASH_LENGTH:
+      part = client_socket.recv(HASH_LENGTH - len(data))
+      if not part:
+        break
+      data += part
+    return data.decode()
 
   def handle_client(self, client_socket):
     try:
-      chunk_hash = client_socket.recv(1024).decode()
+      client_socket.settimeout(self.client_timeout)
+      chunk_hash = self.read_hash(client_socket)
       chunk_data = self.dht.retrieve(chunk_hash)
       if chunk_data:
-        client_socket.send(chunk_data)
+        # Peers expect the raw ciphertext; the DHT holds it base64 encoded.
+        if isinstance(chunk_data, str):
+          chunk_data = base64.b64decode(chunk_data)
+        client_socket.sendall(chunk_data)
+        self.count("served")
       else:
-        client_socket.send(b'')  # Not found
+        self.count("not_found")  # Not found: close without a payload
     except Exception as e:
+      self.count("errors")
       print(f"❌ Error handling client: {e}")
     finally:
       client_socket.close()
 
-  def connect_to_peer(self, ip, port):
-    print(f"🔌 Connected to {ip}:{port}")
-    self.peers.append((ip, int(port)))
+  def stop(self):
+    if self.server_socket is not None:
+      self.server_socket.close()
 
+  def connect_to_peer(self, ip, port):
+    addr = self.peers.add(ip, port)
+    if self.peers.ping(addr):
+      print(f"🔌 Connected to {ip}:{port}")
+    else:
+      print(f"⚠️ {ip}:{port} is not answering yet; will keep trying")
+    self.peers.start_pinger()
@@ -0,0 +1,157 @@
+import random
+import socket
+import threading
+import time
+
+
+class PeerStats:
+  def __init__(self, ip, port):
+    self.ip = ip
+    self.port = int(port)
+    self.rtt = None             # EWMA of round-trip time, seconds
+    self.successes = 0
+    self.failures = 0
+    self.consecutive_failures = 0
+    self.last_seen = None
+    self.backoff_until = 0.0
+
+  @property
+  def addr(self):
+    return (self.ip, self.port)
+
+  def success_rate(self):
+    total = self.successes + self.failures
+    # Laplace smoothing: a new peer starts at 0.5 rather than 0 or 1.
+    return (self.successes + 1) / (total + 2)
+
+
+class PeerTable:
+  """Tracks peer health and ranks peers by expected latency.
+
+  Every request outcome updates a peer's RTT (EWMA with weight `alpha`),
+  success rate and last-seen time. A failure puts the peer in exponential
+  backoff (`base_backoff` doubling up to `max_backoff`) so later requests
+  skip it, and `max_failures` failures in a row evict it. `start_pinger()`
+  probes peers in the background so dead peers are found before a download
+  needs them.
+  """
+
+  def __init__(self, alpha=0.3, default_rtt=0.1, base_backoff=1.0, max_backoff=60.0,
+               max_failures=5, ping_timeout=1.0):
+    self.alpha = alpha
+    self.default_rtt = default_rtt
+    self.base_backoff = base_backoff
+    self.max_backoff = max_backoff
+    self.max_failures = max_failures
+    self.ping_timeout = ping_timeout
+    self.lock = threading.Lock()
+    self.peers = {}
+    self.evicted = 0
+    self._pinger = None
+
+  def add(self, ip, port):
+    addr = (ip, int(port))
+    with self.lock:
+      if addr not in self.peers:
+        self.peers[addr] = PeerStats(ip, port)
+    return addr
+
+  def remove(self, addr):
+    with self.lock:
+      self.peers.pop(tuple(addr), None)
+
+  def __iter__(self):
+    with self.lock:
+      return iter([p.addr for p in self.peers.values()])
+
+  def __len__(self):
+    with self.lock:
+      return len(self.peers)
+
+  def record_success(self, addr, rtt):
+    with self.lock:
+      peer = self.peers.get(addr)
+      if peer is None:
+        return
+      peer.rtt = rtt if peer.rtt is None else (1 - self.alpha) * peer.rtt + self.alpha * rtt
+      peer.successes += 1
+      peer.consecutive_failures = 0
+      peer.backoff_until = 0.0
+      peer.last_seen = time.time()
+
+  def record_failure(self, addr):
+    with self.lock:
+      peer = self.peers.get(addr)
+      if peer is None:
+        return
+      peer.failures += 1
+      peer.consecutive_failures += 1
+      if peer.consecutive_failures >= self.max_failures:
+        del self.peers[addr]
+        self.evicted += 1
+        print(f"🪦 Evicted unresponsive peer {addr[0]}:{addr[1]}")
+        return
+      backoff = min(self.max_backoff, self.base_backoff * 2 ** (peer.consecutive_failures - 1))
+      peer.backoff_until = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+
+  def expected_latency(self, peer):
+    # A peer that fails half the time costs roughly twice its RTT.
+    rtt = peer.rtt if peer.rtt is not None else self.default_rtt
+    return rtt / peer.success_rate()
+
+  def ranked(self):
+    """Peers not in backoff, best expected latency first."""
+    now = time.monotonic()
+    with self.lock:
+      usable = [p for p in self.peers.values() if p.backoff_until <= now]
+      usable.sort(key=self.expected_latency)
+      return [p.addr for p in usable]
+
+  def timeout_for(self, addr):
+    # Give up on a slow reply well before a full TCP timeout, but leave known
+    # peers plenty of headroom over their usual RTT.
+    with self.lock:
+      peer = self.peers.get(addr)
+      rtt = peer.rtt if peer is not None and peer.rtt is not None else self.default_rtt
+    return min(5.0, max(0.5, 8 * rtt))
+
+  def ping(self, addr):
+    # A full round trip, not just a TCP connect: ask for a hash nobody has and
+    # wait for the peer to answer by closing, so hung peers fail too.
+    start = time.perf_counter()
+    try:
+      with socket.create_connection(addr, timeout=self.ping_timeout) as s:
+        s.sendall(b"0" * 64)
+        while s.recv(65536):
+          pass
+    except OSError:
+      self.record_failure(addr)
+      return False
+    self.record_success(addr, time.perf_counter() - start)
+    return True
+
+  def ping_all(self):
+    threads = [threading.Thread(target=self.ping, args=(addr,), daemon=True) for addr in self]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+
+  def start_pinger(self, interval=10.0):
+    def loop():
+      while True:
+        self.ping_all()
+        time.sleep(interval)
+    if self._pinger is None:
+      self._pinger = threading.Thread(target=loop, daemon=True)
+      self._pinger.start()
+
+  def snapshot(self):
+    with self.lock:
+      return [{
+        "peer": f"{p.ip}:{p.port}",
+        "rtt_ms": round(p.rtt * 1000, 1) if p.rtt is not None else None,
+        "success_rate": round(p.success_rate(), 2),
+        "failures": p.consecutive_failures,
+        "last_seen": p.last_seen,
+      } for p in self.peers.values()]
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+from p2p_node_chunked import P2PNode
+from repair import RepairService
+
+
+async def run(args):
+    random.seed(args.seed)
+    nodes = await P2PNode.start_cluster(args.nodes, args.base_port, ksize=args.ksize)
+
+    keys = [f"chunk:repair_test:{i}" for i in range(args.keys)]
+    for key in keys:
+        await random.choice(nodes).node.set(key, os.urandom(args.value_size))
+    print(f"📦 Stored {len(keys)} keys of {args.value_size} B at {args.ksize} replicas on {args.nodes} nodes")
+
+    repairer = nodes[0]
+    service = RepairService(repairer, interval=args.interval, sample=args.sample,
+                            rate=args.rate_kb * 1024)
+    service.pin("repair_test", keys)
+    sweep = -(-len(keys) // args.sample)
+    baseline = [await service.run_once() for _ in range(sweep)]
+    print(f"🔎 Before failures: {sum(r['repaired'] for r in baseline)} of {len(keys)} keys under-replicated")
+
+    victims = random.sample(nodes[1:], args.kill)
+    for node in victims:
+        await node.stop()
+    print(f"💥 Stopped {args.kill} nodes: {', '.join(str(n.port) for n in victims)}")
+
+    killed = time.monotonic()
+    service.start()
+    # Repaired once a full sweep after the failures finds nothing to fix.
+    clean_rounds = 0
+    rounds_seen = service.stats["rounds"]
+    while clean_rounds < sweep and time.monotonic() - killed < args.max_seconds:
+        await asyncio.sleep(0.05)
+        if service.stats["rounds"] != rounds_seen:
+            rounds_seen = service.stats["rounds"]
+            last = service.stats["last_round"]
+            clean_rounds = clean_rounds + 1 if not last["repaired"] else 0
+    service.stop()
+    if clean_rounds < sweep:
+        print("⚠️ Gave up waiting for repair")
+
+    stats = service.stats
+    repaired_in = stats["last_repair"] - killed if stats["last_repair"] else 0.0
+    print(f"🩹 Time to repair: {repaired_in:.2f}s "
+          f"({stats['repaired']} replicas re-stored, {stats['repair_bytes'] // 1024} KB, "
+          f"{stats['lost']} keys lost)")
+    print(f"📈 Repair traffic capped at {args.rate_kb} KB/s; "
+          f"{stats['checked']} checks over {stats['rounds']} rounds")
+
+    for node in nodes:
+        if node not in victims:
+            await node.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill nodes in a local DHT and time the repair service")
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--ksize", type=int, default=3, help="replication factor")
+    parser.add_argument("--kill", type=int, default=2)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--value-size", type=int, default=4096)
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--rate-kb", type=int, default=1024)
+    parser.add_argument("--max-seconds", type=float, default=120.0)
+    parser.add_argument("--base-port", type=int, default=8600)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Crypto.PublicKey import RSA
+from encryption_utils import (
+    load_private_key, load_public_key, encrypt_key_with_rsa, decrypt_key_with_rsa,
+    chunk_and_encrypt, iter_decrypted
+)
+from erasure import chunk_keys, encode_manifest, wrap_dht
+from bundle import chunk_and_encrypt_dir, extract_bundle, is_bundle
+from manifest_format import open_manifest, save_manifest
+from p2p_node import DHT
+from peer_client import PORT, ConnectionPool, SocketDHT
+from peer_server import ChunkServer
+from profiling import add_arguments, profiled
+from storage import open_store
+import metrics
+
+# Non-interactive CLI for scripted bulk transfers.
+#
+#   python batch.py keygen --out-dir keys/
+#   python batch.py upload 'photos/**/*.jpg' --pubkey keys/my_public.pem --out-dir manifests/
+#   python batch.py serve 'manifests/*.p2pm'
+#   python batch.py download 'manifests/*.p2pm' --key keys/my_private.pem --server 10.0.0.5
+#   python batch.py upload photos/ --pubkey keys/my_public.pem       # one bundle manifest
+#   python batch.py download photos_manifest.p2pm --file 2023/a.jpg --key ... --server ...
+#
+# Paths may be globs, or @FILE for a list with one path per line (@- reads
+# stdin). A directory named on the command line is uploaded as one bundle
+# (see bundle.py); --file picks single files out of a bundle on download.
+# Files are processed --jobs at a time. Downloads share one pool of
+# chunk-fetch threads and one pool of kept-alive connections to the server.
+# A JSON summary with per-file throughput goes to stdout (or --summary FILE);
+# progress goes to stderr. The exit status is 1 if any file failed.
+
+
+def expand(patterns):
+    paths = []
+    for pattern in patterns:
+        if pattern.startswith("@"):
+            with (sys.stdin if pattern == "@-" else open(pattern[1:])) as f:
+                paths.extend(line.strip() for line in f if line.strip())
+            continue
+        matches = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(matches if matches else [pattern])  # a missing path is reported per file
+    seen = set()
+    unique = []
+    for path in paths:
+        if path not in seen and not os.path.isdir(path):
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def note(msg):
+    print(msg, file=sys.stderr)
+
+
+def run_all(paths, job, jobs):
+    """Run `job(path)` over `paths` on `jobs` threads; returns one record per path, in order."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(timed, job, path): path for path in paths}
+        for future in as_completed(futures):
+            record = future.result()
+            results[futures[future]] = record
+            if record["status"] == "ok":
+                note(f"✅ {record['file']}: {record['bytes'] / 1e6:.2f} MB in {record['seconds']:.2f}s")
+            else:
+                note(f"❌ {record['file']}: {record['error']}")
+    return [results[p] for p in paths]
+
+
+def timed(job, path):
+    started = time.perf_counter()
+    record = {"file": path, "status": "ok"}
+    try:
+        record.update(job(path))
+    except Exception as e:
+        record.update(status="error", error=str(e) or type(e).__name__)
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    nbytes = record.get("bytes", 0)
+    record["mb_s"] = round(nbytes / 1e6 / record["seconds"], 2) if record["seconds"] and nbytes else 0.0
+    return record
+
+
+def summarize(command, records, elapsed, **extra):
+    moved = sum(r.get("bytes", 0) for r in records if r["status"] == "ok")
+    return {
+        "command": command,
+        "files": len(records),
+        "failed": sum(r["status"] != "ok" for r in records),
+        "bytes": moved,
+        "seconds": round(elapsed, 3),
+        "mb_s": round(moved / 1e6 / elapsed, 2) if elapsed else 0.0,
+        "files_per_s": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        **extra,
+        "results": records,
+    }
+
+
+def cmd_upload(args):
+    pub_key = load_public_key(args.pubkey)
+    store = open_store(args.store) if args.store else None
+    dht = DHT(store) if store is not None else None
+    erasure = tuple(int(n) for n in args.erasure.split(",")) if args.erasure else None
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    claimed = set()
+    lock = threading.Lock()
+
+    def upload(path):
+        path = path.rstrip("/" + os.sep) or path
+        name = os.path.basename(path) + "_manifest.p2pm"
+        manifest_path = os.path.join(args.out_dir or os.path.dirname(path), name)
+        with lock:
+            if manifest_path in claimed:
+                raise ValueError(f"another input already writes {manifest_path}")
+            claimed.add(manifest_path)
+        encrypt = chunk_and_encrypt_dir if os.path.isdir(path) else chunk_and_encrypt
+        aes_key, manifest = encrypt(path, add_decoys=not args.no_decoys)
+        manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
+        if erasure:
+            encode_manifest(manifest, *erasure)
+        if dht is not None:
+            for h, chunk in manifest["chunk_data"].items():
+                dht.store(h, chunk)
+        save_manifest(manifest, manifest_path)
+        record = {"manifest": manifest_path, "bytes": manifest["size"], "chunks": len(manifest["chunks"])}
+        if is_bundle(manifest):
+            record["files"] = len(manifest["files"])
+        return record
+
+    try:
+        bundles = [p for p in args.paths if os.path.isdir(p)]
+        paths = bundles + expand([p for p in args.paths if p not in bundles])
+        started = time.perf_counter()
+        records = run_all(paths, upload, args.jobs)
+        return summarize("upload", records, time.perf_counter() - started)
+    finally:
+        if store is not None and hasattr(store, "close"):
+            store.close()
+
+
+def cmd_download(args):
+    priv_key = load_private_key(args.key)
+    connections = ConnectionPool(args.server, args.port, size=args.connections, timeout=args.timeout)
+    fetchers = ThreadPoolExecutor(max_workers=args.workers)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    def download(manifest_path):
+        with open_manifest(manifest_path) as manifest:
+            aes_key = decrypt_key_with_rsa(priv_key, bytes.fromhex(manifest["encrypted_key"]))
+            dht = wrap_dht(SocketDHT(chunk_keys(manifest), args.server, args.port, pool=connections), manifest)
+            output_path = os.path.join(args.out_dir, "RECEIVED_" + manifest["filename"])
+            if is_bundle(manifest):
+                written = extract_bundle(manifest, aes_key, dht, output_path, args.file,
+                                         prefetch=args.prefetch, pool=fetchers)
+                return {"output": output_path, "bytes": written,
+                        "files": len(args.file) if args.file else len(manifest["files"])}
+            part_path = output_path + ".part"
+            written = 0
+            with open(part_path, "wb") as f:
+                try:
+                    for data in iter_decrypted(manifest, aes_key, dht, prefetch=args.prefetch, pool=fetchers):
+                        f.write(data)
+                        written += len(data)
+                except Exception:
+                    f.close()
+                    os.remove(part_path)
+                    raise
+            os.replace(part_path, output_path)
+            return {"output": output_path, "bytes": written, "chunks": len(manifest["chunks"])}
+
+    try:
+        paths = expand(args.paths)
+        started = time.perf_counter()
+        records = run_all(paths, download, args.jobs)
+        return summarize("download", records, time.perf_counter() - started,
+                         connections=dict(connections.stats))
+    finally:
+        fetchers.shutdown(cancel_futures=True)
+        connections.close()
+
+
+def cmd_serve(args):
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    server = ChunkServer(port=args.port)
+    for source in args.sources:
+        for path in (expand([source]) if not source.startswith(("segment:", "sqlite:")) else [source]):
+            server.add(path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        note("\n[*] Server stopped.")
+    return None
+
+
+def cmd_keygen(args):
+    os.makedirs(args.out_dir, exist_ok=True)
+    pvt_path = os.path.join(args.out_dir, f"{args.name}_private.pem")
+    pub_path = os.path.join(args.out_dir, f"{args.name}_public.pem")
+    if not args.force and (os.path.exists(pvt_path) or os.path.exists(pub_path)):
+        raise SystemExit(f"{pvt_path} or {pub_path} already exists; use --force to overwrite")
+    key = RSA.generate(args.bits)
+    with open(pvt_path, "wb") as f:
+        f.write(key.export_key())
+    with open(pub_path, "wb") as f:
+        f.write(key.publickey().export_key())
+    return {"command": "keygen", "private_key": pvt_path, "public_key": pub_path}
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--summary", default=None, help="write the JSON summary here instead of stdout")
+    add_arguments(common)
+    parser = argparse.ArgumentParser(description="Non-interactive bulk uploads and downloads")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    up = sub.add_parser("upload", help="encrypt files and write their manifests", parents=[common])
+    up.add_argument("paths", nargs="+", help="files, globs, @list, or directories to bundle")
+    up.add_argument("--pubkey", required=True, help="receiver's public key")
+    up.add_argument("--out-dir", default=None, help="manifest directory (default: next to each file)")
+    up.add_argument("--store", default=None, help="also store chunks in segment:<dir> or sqlite:<file>")
+    up.add_argument("--erasure", default=None, metavar="K,M", help="erasure-code chunks, e.g. 4,2")
+    up.add_argument("--no-decoys", action="store_true")
+    up.add_argument("--jobs", type=int, default=4, help="files encrypted at once")
+    up.set_defaults(func=cmd_upload)
+
+    down = sub.add_parser("download", help="fetch and decrypt files from a peer server", parents=[common])
+    down.add_argument("paths", nargs="+", help="manifests, globs or @list")
+    down.add_argument("--key", required=True, help="your private key")
+    down.add_argument("--server", required=True, help="peer server IP address")
+    down.add_argument("--port", type=int, default=PORT)
+    down.add_argument("--out-dir", default="received_files")
+    down.add_argument("--jobs", type=int, default=4, help="files downloaded at once")
+    down.add_argument("--workers", type=int, default=16, help="chunk fetch threads shared by all files")
+    down.add_argument("--connections", type=int, default=16, help="kept-alive connections to the server")
+    down.add_argument("--prefetch", type=int, default=8, help="chunks in flight per file")
+    down.add_argument("--timeout", type=float, default=10.0)
+    down.add_argument("--file", action="append", default=None,
+                      help="extract only this file from a bundle (repeatable)")
+    down.set_defaults(func=cmd_download)
+
+    serve = sub.add_parser("serve", help="serve manifests and chunk stores to peers", parents=[common])
+    serve.add_argument("sources", nargs="+", help="manifests, globs, @list, segment:<dir> or sqlite:<file>")
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--metrics-port", type=int, default=None)
+    serve.set_defaults(func=cmd_serve)
+
+    keygen = sub.add_parser("keygen", help="generate an RSA keypair", parents=[common])
+    keygen.add_argument("--out-dir", default=".")
+    keygen.add_argument("--name", default="my")
+    keygen.add_argument("--bits", type=int, default=2048)
+    keygen.add_argument("--force", action="store_true")
+    keygen.set_defaults(func=cmd_keygen)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with profiled(args, args.command):
+        summary = args.func(args)
+    if summary is None:
+        return 0
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(text + "\n")
+        note(f"📊 Summary written to {args.summary}")
+    else:
+        print(text)
+    return 1 if summary.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
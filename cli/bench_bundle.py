@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from Crypto.PublicKey import RSA
+from bundle import chunk_and_encrypt_dir, extract_bundle, extract_file
+from encryption_utils import chunk_and_encrypt, encrypt_key_with_rsa
+from manifest_format import load_manifest, save_manifest
+from p2p_node import DHT
+
+
+def make_tree(root, files, min_size, max_size, seed):
+    rng = random.Random(seed)
+    for i in range(files):
+        path = os.path.join(root, f"dir{i % 50:02d}", f"file{i:06d}.txt")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(rng.randint(min_size, max_size)))
+
+
+def per_file_upload(root, out_dir, pub_key, dht):
+    # What uploading a tree costs today: one manifest, key wrap and chunk set per file.
+    count = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            aes_key, manifest = chunk_and_encrypt(path)
+            manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
+            for h, chunk in manifest["chunk_data"].items():
+                dht.store(h, chunk)
+            save_manifest(manifest, os.path.join(out_dir, f"{count}_manifest.p2pm"))
+            count += 1
+    return count
+
+
+def bundle_upload(root, out_dir, pub_key, dht):
+    aes_key, manifest = chunk_and_encrypt_dir(root)
+    manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
+    for h, chunk in manifest["chunk_data"].items():
+        dht.store(h, chunk)
+    path = os.path.join(out_dir, "bundle_manifest.p2pm")
+    save_manifest(manifest, path)
+    return aes_key, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Small-file uploads: one manifest per file vs one bundle")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--min-size", type=int, default=200)
+    parser.add_argument("--max-size", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pub_key = RSA.generate(2048).publickey()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "tree")
+        make_tree(root, args.files, args.min_size, args.max_size, args.seed)
+        total = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(root) for f in fs)
+        print(f"🌲 {args.files} files, {total / 1e6:.2f} MB")
+
+        rows = []
+        for name, upload in (("per-file", per_file_upload), ("bundle", bundle_upload)):
+            out_dir = os.path.join(tmp, name)
+            os.makedirs(out_dir)
+            dht = DHT()
+            start = time.perf_counter()
+            result = upload(root, out_dir, pub_key, dht)
+            elapsed = time.perf_counter() - start
+            manifests = len(os.listdir(out_dir))
+            rows.append((name, elapsed, manifests, len(dht.storage)))
+            if name == "bundle":
+                aes_key, manifest_path = result
+                bundle_dht = dht
+
+        print(f"\n{'upload':<10} {'seconds':>8} {'files/s':>9} {'MB/s':>7} {'manifests':>10} {'dht_keys':>9}")
+        for name, elapsed, manifests, keys in rows:
+            print(f"{name:<10} {elapsed:>8.2f} {args.files / elapsed:>9.0f} {total / 1e6 / elapsed:>7.2f} "
+                  f"{manifests:>10} {keys:>9}")
+        print(f"🚀 Bundle is {rows[0][1] / rows[1][1]:.0f}x faster")
+
+        manifest = load_manifest(manifest_path)
+        target = manifest["files"][len(manifest["files"]) // 2][0]
+        start = time.perf_counter()
+        data = extract_file(manifest, aes_key, bundle_dht, target)
+        single = time.perf_counter() - start
+        with open(os.path.join(root, target), "rb") as f:
+            assert f.read() == data, "single-file extract mismatch"
+
+        out = os.path.join(tmp, "extracted")
+        start = time.perf_counter()
+        extract_bundle(manifest, aes_key, bundle_dht, out)
+        full = time.perf_counter() - start
+        for path, _, _ in manifest["files"]:
+            with open(os.path.join(root, path), "rb") as a, open(os.path.join(out, path), "rb") as b:
+                assert a.read() == b.read(), f"{path}: extract mismatch"
+        manifest.close()
+        print(f"📄 Extract one file: {single * 1000:.1f} ms; whole bundle: {full:.2f}s (all files verified)")
+
+
+if __name__ == "__main__":
+    main()
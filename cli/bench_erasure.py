@@ -0,0 +1,136 @@
+import argparse
+import base64
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from erasure import ErasureDHT, encode_manifest, shard_key
+
+
+class SimNode:
+    """An in-memory node with per-request latency that can be switched off."""
+
+    def __init__(self, latency, timeout):
+        self.storage = {}
+        self.latency = latency
+        self.timeout = timeout
+        self.up = True
+
+    def get(self, key):
+        if not self.up:
+            time.sleep(self.timeout)  # a dead node costs a connect timeout
+            return None
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        return self.storage.get(key)
+
+
+class SimCluster:
+    """DHT-shaped front end: each key lives on `copies` distinct nodes, tried in order."""
+
+    def __init__(self, nodes, copies):
+        self.nodes = nodes
+        self.copies = copies
+        self.locations = {}
+
+    def placement(self, key):
+        # Rendezvous hashing: stable, spread evenly, always distinct nodes.
+        return sorted(range(len(self.nodes)), key=lambda i: sha256(f"{key}:{i}".encode()).digest())
+
+    def store(self, key, value, nodes=None):
+        nodes = nodes if nodes is not None else self.placement(key)[:self.copies]
+        self.locations[key] = nodes
+        for i in nodes:
+            self.nodes[i].storage[key] = value
+
+    def retrieve(self, key):
+        for i in self.locations.get(key, ()):
+            value = self.nodes[i].get(key)
+            if value is not None:
+                return value
+        return None
+
+    def stored_bytes(self):
+        return sum(len(base64.b64decode(v)) for node in self.nodes for v in node.storage.values())
+
+
+def make_manifest(chunks, chunk_size):
+    manifest = {"chunks": [], "chunk_data": {}, "nonces": {}}
+    originals = {}
+    for _ in range(chunks):
+        data = os.urandom(chunk_size)
+        chunk_hash = sha256(data).hexdigest()
+        manifest["chunks"].append(chunk_hash)
+        manifest["chunk_data"][chunk_hash] = base64.b64encode(data).decode()
+        manifest["nonces"][chunk_hash] = ""
+        originals[chunk_hash] = data
+    return manifest, originals
+
+
+def download(dht, manifest, originals, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(dht.retrieve, manifest["chunks"]))
+    seconds = time.perf_counter() - start
+    lost = sum(1 for h, r in zip(manifest["chunks"], results)
+               if r is None or base64.b64decode(r) != originals[h])
+    return seconds, lost
+
+
+def run(scheme, args, down):
+    random.seed(args.seed)
+    nodes = [SimNode(args.latency_ms / 1000, args.timeout_ms / 1000) for _ in range(args.nodes)]
+    manifest, originals = make_manifest(args.chunks, args.chunk_size)
+    if scheme == "replication":
+        cluster = SimCluster(nodes, args.replicas)
+        dht = cluster
+        for key, value in manifest["chunk_data"].items():
+            cluster.store(key, value)
+    else:
+        # One copy of each shard, and the shards of a chunk on distinct nodes,
+        # so losing a node costs each chunk at most one shard.
+        cluster = SimCluster(nodes, 1)
+        chunks = list(manifest["chunks"])
+        encode_manifest(manifest, args.k, args.m)
+        dht = ErasureDHT(cluster, manifest, workers=args.workers * (args.k + args.m))
+        for chunk_hash in chunks:
+            for i, node in enumerate(cluster.placement(chunk_hash)[:args.k + args.m]):
+                key = shard_key(chunk_hash, i)
+                cluster.store(key, manifest["chunk_data"][key], nodes=[node])
+    overhead = cluster.stored_bytes() / (args.chunks * args.chunk_size)
+
+    for node in random.sample(nodes, down):
+        node.up = False
+    seconds, lost = download(dht, manifest, originals, args.workers)
+    if isinstance(dht, ErasureDHT):
+        dht.close()
+    return overhead, seconds, lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replication vs Reed-Solomon erasure coding on a simulated cluster")
+    parser.add_argument("--nodes", type=int, default=12)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=8 * 1024)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("-m", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--timeout-ms", type=float, default=200.0)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    schemes = ["replication", "erasure"]
+    labels = {"replication": f"{args.replicas}x replication", "erasure": f"RS({args.k},{args.m})"}
+    print(f"{args.nodes} nodes, {args.chunks} chunks of {args.chunk_size // 1024} KB, "
+          f"{args.latency_ms} ms latency, {args.timeout_ms} ms timeout for a dead node\n")
+    print(f"{'scheme':<16} {'down':>4} {'storage':>8} {'download_s':>11} {'lost':>5}")
+    for down in range(min(args.m, args.replicas - 1) + 1):
+        for scheme in schemes:
+            overhead, seconds, lost = run(scheme, args, down)
+            print(f"{labels[scheme]:<16} {down:>4} {overhead:>7.2f}x {seconds:>11.2f} {lost:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import base64
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from compact_manifest import CompactManifest
+from manifest_format import load_manifest, read_header, save_manifest
+
+
+def synthetic_manifest(chunks):
+    hashes = [os.urandom(32).hex() for _ in range(chunks)]
+    return {
+        "filename": "synthetic.bin",
+        "size": chunks * 8192,
+        "chunks": hashes,
+        "offsets": [i * 8192 for i in range(chunks)],
+        "nonces": {h: base64.b64encode(os.urandom(16)).decode() for h in hashes},
+        "encrypted_key": os.urandom(256).hex(),
+        "decoy_hashes": [os.urandom(32).hex() for _ in range(chunks // 2)],
+    }
+
+
+def indexed(raw):
+    # A JSON manifest can look up nonces by hash as soon as it is parsed; the
+    # compact one needs its hash index for that, so count it too.
+    manifest = CompactManifest.from_bytes(raw)
+    manifest.index_of(manifest["chunks"][0])
+    return manifest
+
+
+def measure(loader):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = loader()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and load time of JSON vs compact manifests")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    manifest = synthetic_manifest(args.chunks)
+    raw_json = json.dumps(manifest)
+    raw_compact = CompactManifest.from_manifest(manifest).to_bytes()
+    del manifest
+
+    loaded, json_bytes, json_s = measure(lambda: json.loads(raw_json))
+    del loaded
+    loaded, compact_bytes, compact_s = measure(lambda: CompactManifest.from_bytes(raw_compact))
+    del loaded
+    loaded, indexed_bytes, indexed_s = measure(lambda: indexed(raw_compact))
+    del loaded
+
+    mb = 1024 * 1024
+    print(f"chunks: {args.chunks}")
+    print(f"{'format':<8} {'on disk MB':>11} {'in memory MB':>13} {'load s':>8}")
+    print(f"{'json':<8} {len(raw_json) / mb:>11.1f} {json_bytes / mb:>13.1f} {json_s:>8.2f}")
+    print(f"{'compact':<8} {len(raw_compact) / mb:>11.1f} {compact_bytes / mb:>13.1f} {compact_s:>8.2f}")
+    print(f"{'+ index':<8} {'':>11} {indexed_bytes / mb:>13.1f} {indexed_s:>8.2f}")
+    print(f"memory reduction: {json_bytes / max(compact_bytes, 1):.1f}x, "
+          f"{json_bytes / max(indexed_bytes, 1):.1f}x with the hash index built")
+
+    # Time to open a manifest file and read its header, legacy JSON vs binary format
+    manifest = json.loads(raw_json)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "manifest.json")
+        binary_path = os.path.join(tmp, "manifest.p2pm")
+        with open(json_path, "w") as f:
+            f.write(raw_json)
+        save_manifest(manifest, binary_path)
+        del manifest
+
+        print(f"{'format':<8} {'header s':>9} {'open s':>8}")
+        for name, path in (("json", json_path), ("binary", binary_path)):
+            start = time.perf_counter()
+            read_header(path)
+            header_s = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = load_manifest(path)
+            open_s = time.perf_counter() - start
+            if hasattr(loaded, "close"):
+                loaded.close()
+            del loaded
+            print(f"{name:<8} {header_s:>9.4f} {open_s:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
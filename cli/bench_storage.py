@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import shutil
+import time
+from hashlib import sha256
+from storage import SegmentStore, SQLiteStore
+
+
+def chunk_key(i):
+    return sha256(i.to_bytes(8, "little")).hexdigest()
+
+
+def open_backend(name, path):
+    if name == "memory":
+        return {}
+    if name == "segment":
+        return SegmentStore(path)
+    return SQLiteStore(path)
+
+
+def bench_backend(name, keys, value_size, lookups, workdir):
+    path = os.path.join(workdir, name if name != "sqlite" else "chunks.db")
+    store = open_backend(name, path)
+    value = os.urandom(value_size)
+
+    start = time.perf_counter()
+    for i in range(keys):
+        store[chunk_key(i)] = value
+    if hasattr(store, "sync"):
+        store.sync()
+    insert_s = time.perf_counter() - start
+
+    sample = [chunk_key(random.randrange(keys)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for key in sample:
+        store[key]
+    lookup_s = time.perf_counter() - start
+
+    reopen_s = None
+    if hasattr(store, "close"):
+        store.close()
+        start = time.perf_counter()
+        store = open_backend(name, path)
+        assert len(store) == keys
+        reopen_s = time.perf_counter() - start
+        store.close()
+
+    return {
+        "backend": name,
+        "keys": keys,
+        "insert_s": round(insert_s, 2),
+        "inserts_per_s": round(keys / insert_s),
+        "lookups_per_s": round(lookups / lookup_s),
+        "reopen_s": round(reopen_s, 2) if reopen_s is not None else "-",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert/lookup benchmark for the chunk storage backends")
+    parser.add_argument("--keys", type=int, default=10_000_000)
+    parser.add_argument("--value-size", type=int, default=64)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--backend", choices=["memory", "segment", "sqlite", "all"], default="all")
+    parser.add_argument("--dir", default="benchmark_storage")
+    args = parser.parse_args()
+
+    backends = ["memory", "segment", "sqlite"] if args.backend == "all" else [args.backend]
+    shutil.rmtree(args.dir, ignore_errors=True)
+    os.makedirs(args.dir)
+    random.seed(0)
+
+    print(f"{'backend':<8} {'keys':>10} {'insert_s':>9} {'insert/s':>10} {'lookup/s':>10} {'reopen_s':>9}")
+    for name in backends:
+        r = bench_backend(name, args.keys, args.value_size, args.lookups, args.dir)
+        print(f"{r['backend']:<8} {r['keys']:>10} {r['insert_s']:>9} {r['inserts_per_s']:>10} "
+              f"{r['lookups_per_s']:>10} {r['reopen_s']:>9}")
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
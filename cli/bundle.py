@@ -0,0 +1,147 @@
+import os
+from Crypto.Random import get_random_bytes
+from encryption_utils import SUB_CHUNK_SIZE, add_chunk, add_decoy_chunks, decrypt_range, iter_decrypted
+
+# Directory bundles: a whole tree in one manifest.
+#
+# The files are read in sorted path order and streamed back to back into one
+# plaintext, which is cut into the usual sub-chunks, so small files share
+# chunks instead of each paying for its own manifest, key wrap and partly
+# filled chunk. Nothing is written to disk on the way. The manifest carries
+# a file table, "files": [[path, offset, size], ...], giving each file's
+# place in that plaintext. Any one file comes back with decrypt_range(),
+# which fetches only the chunks it overlaps.
+
+READ_BLOCK = 1024 * 1024
+
+
+def walk_files(root, prefix=""):
+    """Yield (path, name relative to `root` with "/" separators, size) for regular files, sorted.
+
+    scandir entries carry their type and size, so a tree of many small files
+    costs one directory read per directory rather than several stats per file.
+    """
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_files(entry.path, prefix + entry.name + "/")
+        elif entry.is_file(follow_symlinks=False):
+            yield entry.path, prefix + entry.name, entry.stat(follow_symlinks=False).st_size
+
+
+def chunk_and_encrypt_dir(root, add_decoys=True, decoy_budget=None, progress=None):
+    """Like chunk_and_encrypt(), for every file under the directory `root`."""
+    files = list(walk_files(root))
+    total = sum(size for _, _, size in files)
+    key = get_random_bytes(16)
+    manifest = {
+        "filename": os.path.basename(os.path.abspath(root)),
+        "size": 0,
+        "chunks": [],
+        "offsets": [],
+        "chunk_data": {},
+        "nonces": {},
+        "encrypted_key": "",
+        "decoy_hashes": [],
+        "files": [],
+    }
+
+    sizes = []
+    pending = bytearray()
+    offset = 0  # plaintext offset of pending[0]
+    for path, name, _ in files:
+        start = offset + len(pending)
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    break
+                pending += block
+                cut = 0
+                while len(pending) - cut >= SUB_CHUNK_SIZE:
+                    sizes.append(add_chunk(manifest, key, offset, bytes(pending[cut:cut + SUB_CHUNK_SIZE])))
+                    cut += SUB_CHUNK_SIZE
+                    offset += SUB_CHUNK_SIZE
+                del pending[:cut]
+        manifest["files"].append([name, start, offset + len(pending) - start])
+        if progress is not None:
+            progress(offset + len(pending), total)
+    if pending:
+        sizes.append(add_chunk(manifest, key, offset, bytes(pending)))
+        offset += len(pending)
+    manifest["size"] = offset
+
+    if add_decoys:
+        add_decoy_chunks(manifest, sizes, decoy_budget)
+    return key, manifest
+
+
+def is_bundle(manifest):
+    return "files" in manifest  # an empty directory has an empty file table
+
+
+def find_file(manifest, name):
+    """Return (offset, size) of `name` in a bundle."""
+    for path, offset, size in manifest["files"]:
+        if path == name:
+            return offset, size
+    raise KeyError(f"No file '{name}' in bundle {manifest['filename']}")
+
+
+def extract_file(manifest, key, dht, name):
+    """Return the contents of one file in a bundle, fetching only its chunks."""
+    offset, size = find_file(manifest, name)
+    if not size:
+        return b""
+    return decrypt_range(manifest, key, dht, offset, size)
+
+
+def safe_join(directory, name):
+    # File tables come from other people's manifests: never write outside `directory`.
+    path = os.path.normpath(name)
+    if os.path.isabs(path) or path == ".." or path.startswith(".." + os.sep):
+        raise ValueError(f"Unsafe path in bundle: {name}")
+    return os.path.join(directory, path)
+
+
+def extract_bundle(manifest, key, dht, out_dir, names=None, **fetch_options):
+    """Write a bundle's files under `out_dir`; returns the bytes written.
+
+    With `names`, only those files are fetched, each through decrypt_range().
+    Otherwise the whole bundle is streamed once with iter_decrypted() and cut
+    into files along the file table. `fetch_options` go to iter_decrypted.
+    """
+    written = 0
+    if names:
+        for name in names:
+            data = extract_file(manifest, key, dht, name)
+            target = safe_join(out_dir, name)
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(data)
+            written += len(data)
+        return written
+
+    os.makedirs(out_dir, exist_ok=True)  # even for an empty directory
+    stream = iter_decrypted(manifest, key, dht, **fetch_options)
+    buffer = memoryview(b"")
+    try:
+        for name, _, size in manifest["files"]:
+            target = safe_join(out_dir, name)
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            with open(target, "wb") as f:
+                remaining = size
+                while remaining:
+                    if not buffer:
+                        buffer = memoryview(next(stream, b""))
+                        if not buffer:
+                            raise ValueError(f"Bundle ended early while writing {name}")
+                    part = buffer[:remaining]
+                    f.write(part)
+                    buffer = buffer[len(part):]
+                    remaining -= len(part)
+            written += size
+    finally:
+        stream.close()
+    return written
@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+
+
+class ChunkCache:
+    """Thread-safe, byte-budgeted LRU cache for chunk payloads.
+
+    Entries evicted from memory are optionally spilled to `spill_dir`, which has
+    its own byte budget, so hot chunks of repeatedly downloaded files can still be
+    served locally after they fall out of RAM.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, spill_dir=None, spill_max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.bytes = 0
+        self.spill_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+        self._entries = OrderedDict()
+        self._spilled = OrderedDict()  # key -> (path, size, is_text)
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries or key in self._spilled
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            spilled = self._spilled.pop(key, None)
+            if spilled is None:
+                self.misses += 1
+                return default
+            path, size, is_text = spilled
+            self.spill_bytes -= size
+
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.remove(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return default
+        if is_text:
+            value = value.decode()
+
+        with self._lock:
+            self.disk_hits += 1
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            shadowed = self._spilled.pop(key, None)
+            if shadowed is not None:
+                self.spill_bytes -= shadowed[1]
+            self._entries[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.bytes -= len(old_value)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+
+        if shadowed is not None:
+            try:
+                os.remove(shadowed[0])
+            except OSError:
+                pass
+        if self.spill_dir:
+            for old_key, old_value in evicted:
+                self._spill(old_key, old_value)
+
+    def _spill(self, key, value):
+        is_text = isinstance(value, str)
+        data = value.encode() if is_text else value
+        if len(data) > self.spill_max_bytes:
+            return
+        path = os.path.join(self.spill_dir, sha256(key.encode()).hexdigest())
+        with open(path, "wb") as f:
+            f.write(data)
+
+        stale = []
+        with self._lock:
+            self._spilled[key] = (path, len(data), is_text)
+            self.spill_bytes += len(data)
+            self.spills += 1
+            while self.spill_bytes > self.spill_max_bytes:
+                _, (old_path, old_size, _) = self._spilled.popitem(last=False)
+                self.spill_bytes -= old_size
+                stale.append(old_path)
+        for old_path in stale:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            spilled = list(self._spilled.values())
+            self._spilled.clear()
+            self.spill_bytes = 0
+        for path, _, _ in spilled:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "spilled_entries": len(self._spilled),
+                "spill_bytes": self.spill_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "spills": self.spills,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,276 @@
+import base64
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from encryption_utils import SUB_CHUNK_SIZE, chunk_offsets
+
+DIGEST_SIZE = 32
+NONCE_SIZE = 16
+
+MAGIC = b"P2PC"
+VERSION = 1
+# magic, version, flags, filename length, encrypted key length, plaintext size, chunk count, decoy count
+HEADER = struct.Struct("<4sBBHHQII")
+UNKNOWN_SIZE = 0xFFFFFFFFFFFFFFFF
+# Set when every chunk starts at i * SUB_CHUNK_SIZE, so no offset table is stored.
+FLAG_STRIDE_OFFSETS = 1
+
+
+class _HashList(Sequence):
+    """Read-only list of hex hashes backed by packed 32-byte digests."""
+
+    __slots__ = ("_digests",)
+
+    def __init__(self, digests):
+        self._digests = digests
+
+    def __len__(self):
+        return len(self._digests) // DIGEST_SIZE
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE].hex()
+
+
+class _StrideOffsets(Sequence):
+    """Offsets of fixed-size chunks, computed instead of stored."""
+
+    __slots__ = ("_count",)
+
+    def __init__(self, count):
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return i * SUB_CHUNK_SIZE
+
+
+class _NonceMap(Mapping):
+    """Read-only hex hash -> base64 nonce mapping, matching the JSON manifest."""
+
+    __slots__ = ("_manifest",)
+
+    def __init__(self, manifest):
+        self._manifest = manifest
+
+    def __getitem__(self, chunk_hash):
+        i = self._manifest.index_of(chunk_hash)
+        if i < 0:
+            raise KeyError(chunk_hash)
+        return base64.b64encode(self._manifest.nonce(i)).decode()
+
+    def __iter__(self):
+        return iter(_HashList(self._manifest._digests))
+
+    def __len__(self):
+        return len(self._manifest)
+
+
+class DigestIndex:
+    """Lazily built linear-probing table mapping packed 32-byte digests to positions."""
+
+    __slots__ = ("_digests", "_table", "_slots")
+
+    def __init__(self, digests):
+        self._digests = digests
+        self._table = None
+        self._slots = 0
+
+    def _build(self):
+        # Slots hold position + 1 (0 means empty), ~1.5 slots per digest.
+        count = len(self._digests) // DIGEST_SIZE
+        self._slots = count * 3 // 2 + 8
+        table = array("I", bytes(4 * self._slots))
+        for i in range(count):
+            slot = self._slot(self._digests, i * DIGEST_SIZE)
+            while table[slot]:
+                slot = (slot + 1) % self._slots
+            table[slot] = i + 1
+        self._table = table
+
+    def _slot(self, buf, start):
+        return int.from_bytes(buf[start:start + 8], "little") % self._slots
+
+    def find(self, chunk_hash):
+        """Position of a hex hash, or -1."""
+        try:
+            digest = bytes.fromhex(chunk_hash)
+        except ValueError:
+            return -1
+        if len(digest) != DIGEST_SIZE:
+            return -1
+        if self._table is None:
+            self._build()
+        slot = self._slot(digest, 0)
+        while True:
+            entry = self._table[slot]
+            if not entry:
+                return -1
+            start = (entry - 1) * DIGEST_SIZE
+            if self._digests[start:start + DIGEST_SIZE] == digest:
+                return entry - 1
+            slot = (slot + 1) % self._slots
+
+
+class CompactManifest:
+    """Memory-compact, read-only manifest.
+
+    Chunk hashes and nonces are held as packed byte strings and offsets as an
+    `array`, all indexed by chunk position, with an open-addressing table of
+    positions for O(1) lookup by hash. It can be used wherever the JSON manifest
+    dict is read (`manifest["chunks"]`, `manifest["nonces"][h]`, ...) and
+    serialized with `to_bytes()`. The hash index is built on first lookup.
+    """
+
+    __slots__ = ("filename", "encrypted_key", "size", "_digests", "_nonces", "_offsets", "_decoys",
+                 "_index")
+
+    def __init__(self, filename, encrypted_key, size, digests, nonces, offsets, decoys=b""):
+        self.filename = filename
+        self.encrypted_key = encrypted_key
+        self.size = size
+        self._digests = digests
+        self._nonces = nonces
+        self._offsets = offsets
+        self._decoys = decoys
+        self._index = DigestIndex(digests)
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        hashes = manifest["chunks"]
+        digests = b"".join(bytes.fromhex(h) for h in hashes)
+        nonces = b"".join(base64.b64decode(manifest["nonces"][h]) for h in hashes)
+        offsets = chunk_offsets(manifest)
+        if any(offset != i * SUB_CHUNK_SIZE for i, offset in enumerate(offsets)):
+            offsets = array("Q", offsets)
+        else:
+            offsets = _StrideOffsets(len(offsets))
+        decoys = b"".join(bytes.fromhex(h) for h in manifest.get("decoy_hashes", []))
+        size = manifest.get("size")
+        if size is None:
+            size = 0 if not offsets else -1  # unknown for legacy manifests
+        return cls(manifest["filename"], manifest.get("encrypted_key", ""), size,
+                   digests, nonces, offsets, decoys)
+
+    def to_manifest(self):
+        """Expand back into the JSON manifest layout (without chunk data)."""
+        hashes = list(self["chunks"])
+        manifest = {
+            "filename": self.filename,
+            "chunks": hashes,
+            "offsets": list(self._offsets),
+            "nonces": {h: base64.b64encode(self.nonce(i)).decode() for i, h in enumerate(hashes)},
+            "encrypted_key": self.encrypted_key,
+            "decoy_hashes": list(self["decoy_hashes"]),
+        }
+        if self.size >= 0:
+            manifest["size"] = self.size
+        return manifest
+
+    def __len__(self):
+        return len(self._digests) // DIGEST_SIZE
+
+    def index_of(self, chunk_hash):
+        """Position of a hex hash in the chunk list, or -1."""
+        return self._index.find(chunk_hash)
+
+    @property
+    def decoy_digests(self):
+        return self._decoys
+
+    def digest(self, i):
+        return self._digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]
+
+    def nonce(self, i):
+        return self._nonces[i * NONCE_SIZE:(i + 1) * NONCE_SIZE]
+
+    # --- dict-style access so existing manifest readers work unchanged ---
+
+    def __getitem__(self, name):
+        if name == "filename":
+            return self.filename
+        if name == "encrypted_key":
+            return self.encrypted_key
+        if name == "size" and self.size >= 0:
+            return self.size
+        if name == "chunks":
+            return _HashList(self._digests)
+        if name == "nonces":
+            return _NonceMap(self)
+        if name == "offsets":
+            return self._offsets
+        if name == "decoy_hashes":
+            return _HashList(self._decoys)
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        if name == "size":
+            return self.size >= 0
+        return name in ("filename", "encrypted_key", "chunks", "nonces", "offsets", "decoy_hashes")
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    # --- binary serialization ---
+
+    def to_bytes(self):
+        filename = self.filename.encode()
+        enc_key = bytes.fromhex(self.encrypted_key)
+        size = self.size if self.size >= 0 else UNKNOWN_SIZE
+        if isinstance(self._offsets, _StrideOffsets):
+            flags, offsets = FLAG_STRIDE_OFFSETS, b""
+        else:
+            flags = 0
+            offsets = (self._offsets if sys.byteorder == "little" else _swapped(self._offsets)).tobytes()
+        return b"".join([
+            HEADER.pack(MAGIC, VERSION, flags, len(filename), len(enc_key), size, len(self),
+                        len(self._decoys) // DIGEST_SIZE),
+            filename, enc_key, self._digests, self._nonces, offsets, self._decoys,
+        ])
+
+    @classmethod
+    def from_bytes(cls, buf, offset=0):
+        magic, version, flags, name_len, key_len, size, count, decoys = HEADER.unpack_from(buf, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a compact manifest")
+        pos = offset + HEADER.size
+        filename = bytes(buf[pos:pos + name_len]).decode()
+        pos += name_len
+        enc_key = bytes(buf[pos:pos + key_len]).hex()
+        pos += key_len
+        digests = bytes(buf[pos:pos + count * DIGEST_SIZE])
+        pos += count * DIGEST_SIZE
+        nonces = bytes(buf[pos:pos + count * NONCE_SIZE])
+        pos += count * NONCE_SIZE
+        if flags & FLAG_STRIDE_OFFSETS:
+            offsets = _StrideOffsets(count)
+        else:
+            offsets = array("Q")
+            offsets.frombytes(bytes(buf[pos:pos + count * 8]))
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            pos += count * 8
+        decoy_digests = bytes(buf[pos:pos + decoys * DIGEST_SIZE])
+        if size == UNKNOWN_SIZE:
+            size = -1
+        return cls(filename, enc_key, size, digests, nonces, offsets, decoy_digests)
+
+
+def _swapped(values):
+    copy = array(values.typecode, values)
+    copy.byteswap()
+    return copy
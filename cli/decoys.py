@@ -0,0 +1,102 @@
+import base64
+import os
+import random
+import threading
+import time
+from hashlib import sha256
+
+
+class DecoyBudget:
+    """Caps how much decoy traffic a transfer may generate.
+
+    Decoys may use at most `ratio` of the real payload bytes, optionally also
+    capped at `max_bytes` in total and `max_seconds` after `start()`. The budget
+    tracks what was actually spent so the privacy overhead can be reported.
+    """
+
+    def __init__(self, ratio=0.1, max_bytes=None, max_seconds=None):
+        self.ratio = ratio
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.real_bytes = 0
+        self.decoy_bytes = 0
+        self.decoy_count = 0
+        self.decoy_seconds = 0.0
+        self.started = None
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def start(self, real_bytes=None):
+        if real_bytes is not None:
+            self.real_bytes = real_bytes
+        self.started = time.perf_counter()
+        return self
+
+    def limit(self):
+        limit = int(self.real_bytes * self.ratio)
+        if self.max_bytes is not None:
+            limit = min(limit, self.max_bytes)
+        return limit
+
+    def allow(self, nbytes):
+        """Reserve `nbytes` of decoy traffic; False once the budget is spent."""
+        with self._lock:
+            if self.max_seconds is not None and self.started is not None:
+                if time.perf_counter() - self.started > self.max_seconds:
+                    return False
+            if self._reserved + nbytes > self.limit():
+                return False
+            self._reserved += nbytes
+            return True
+
+    def record(self, nbytes, seconds=0.0):
+        with self._lock:
+            self.decoy_bytes += nbytes
+            self.decoy_count += 1
+            self.decoy_seconds += seconds
+
+    def report(self):
+        total = self.real_bytes + self.decoy_bytes
+        return {
+            "real_bytes": self.real_bytes,
+            "decoy_bytes": self.decoy_bytes,
+            "decoy_count": self.decoy_count,
+            "decoy_seconds": round(self.decoy_seconds, 4),
+            "decoy_fraction": round(self.decoy_bytes / total, 4) if total else 0.0,
+        }
+
+
+def generate_decoys(sizes, budget):
+    """Generate decoy chunks whose sizes follow `sizes`, within `budget`.
+
+    Random bytes are indistinguishable from AES ciphertext, so decoys skip the
+    compress/encrypt pipeline: all of them are cut from a single os.urandom call.
+    Returns a dict of hash -> base64 payload.
+    """
+    if not sizes:
+        return {}
+    picked = []
+    while True:
+        size = random.choice(sizes)
+        if not budget.allow(size):
+            break
+        picked.append(size)
+
+    pool = os.urandom(sum(picked))
+    decoys = {}
+    pos = 0
+    for size in picked:
+        data = pool[pos:pos + size]
+        pos += size
+        decoys[sha256(data).hexdigest()] = base64.b64encode(data).decode()
+        budget.record(size)
+    return decoys
+
+
+def fetch_decoy(dht, decoy_hash, budget, estimate):
+    """Fetch a decoy through `dht` if the budget allows, discarding the payload."""
+    if not budget.allow(estimate):
+        return
+    start = time.perf_counter()
+    data = dht.retrieve(decoy_hash)
+    budget.record(len(data) if data else 0, time.perf_counter() - start)
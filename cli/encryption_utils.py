@@ -2,11 +2,16 @@ import zlib
 import base64
 import os
 import random
-import string
+from bisect import bisect_right
 from hashlib import sha256
 from Crypto.Cipher import AES, PKCS1_OAEP
 from Crypto.PublicKey import RSA
 from Crypto.Random import get_random_bytes
+from decoys import DecoyBudget, generate_decoys, fetch_decoy
+from metrics import stage
+
+CHUNK_SIZE = 16 * 1024
+SUB_CHUNK_SIZE = 8 * 1024
 
 def compress(data):
     return zlib.compress(data)
@@ -54,80 +59,214 @@ def decrypt_key_with_rsa(priv_key, enc_key):
     return cipher.decrypt(enc_key)
 
 def generate_dummy_data(size=128):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=size)).encode()
+    return os.urandom(size)
 
-def chunk_and_encrypt(filepath, add_decoys=True):
-    with open(filepath, "rb") as f:
+def chunk_and_encrypt(filepath, add_decoys=True, decoy_budget=None, progress=None):
+    with stage("read"), open(filepath, "rb") as f:
         data = f.read()
 
-    chunk_size = 16 * 1024
-    sub_chunk_size = 8 * 1024
+    chunk_size = CHUNK_SIZE
+    sub_chunk_size = SUB_CHUNK_SIZE
     key = get_random_bytes(16)
 
     manifest = {
         "filename": os.path.basename(filepath),
+        "size": len(data),
         "chunks": [],
+        "offsets": [],
         "chunk_data": {},
         "nonces": {},
         "encrypted_key": "",
         "decoy_hashes": []
     }
 
+    sizes = []
     for i in range(0, len(data), chunk_size):
         chunk = data[i:i + chunk_size]
         for j in range(0, len(chunk), sub_chunk_size):
-            sub_chunk = chunk[j:j + sub_chunk_size]
-            compressed = compress(sub_chunk)
-            cipher = AES.new(key, AES.MODE_EAX)
-            ciphertext, _ = cipher.encrypt_and_digest(compressed)
-            chunk_hash = sha256(ciphertext).hexdigest()
+            sizes.append(add_chunk(manifest, key, i + j, chunk[j:j + sub_chunk_size]))
 
-            manifest["chunks"].append(chunk_hash)
-            manifest["chunk_data"][chunk_hash] = base64.b64encode(ciphertext).decode()
-            manifest["nonces"][chunk_hash] = base64.b64encode(cipher.nonce).decode()
+        if progress is not None:
+            progress(i + len(chunk), len(data))
 
-    # Add fake/dummy chunks to the manifest
     if add_decoys:
-        for _ in range(len(manifest["chunks"]) // 2):  # 50% dummy ratio
-            fake_data = compress(generate_dummy_data())
-            cipher = AES.new(key, AES.MODE_EAX)
-            encrypted, _ = cipher.encrypt_and_digest(fake_data)
-            fake_hash = sha256(encrypted).hexdigest()
-            manifest["decoy_hashes"].append(fake_hash)
-            manifest["chunk_data"][fake_hash] = base64.b64encode(encrypted).decode()
-            manifest["nonces"][fake_hash] = base64.b64encode(cipher.nonce).decode()
+        add_decoy_chunks(manifest, sizes, decoy_budget)
 
     return key, manifest
 
-def decrypt_and_reconstruct(manifest, key, dht, output_path):
+def add_chunk(manifest, key, offset, sub_chunk):
+    """Compress, encrypt and hash one sub-chunk at plaintext `offset` into the manifest; returns its ciphertext size."""
+    with stage("compress", len(sub_chunk)):
+        compressed = compress(sub_chunk)
+    with stage("encrypt", len(compressed)):
+        cipher = AES.new(key, AES.MODE_EAX)
+        ciphertext, _ = cipher.encrypt_and_digest(compressed)
+    with stage("hash", len(ciphertext)):
+        chunk_hash = sha256(ciphertext).hexdigest()
+
+    manifest["chunks"].append(chunk_hash)
+    manifest["offsets"].append(offset)
+    with stage("b64encode", len(ciphertext)):
+        manifest["chunk_data"][chunk_hash] = base64.b64encode(ciphertext).decode()
+    manifest["nonces"][chunk_hash] = base64.b64encode(cipher.nonce).decode()
+    return len(ciphertext)
+
+def add_decoy_chunks(manifest, sizes, decoy_budget=None):
+    # Add fake/dummy chunks to the manifest, sized like the real ciphertexts.
+    # The budget is a share of the ciphertext actually stored, not of the
+    # plaintext, which compression can make several times larger.
+    budget = (decoy_budget or DecoyBudget()).start(real_bytes=sum(sizes))
+    decoys = generate_decoys(sizes, budget)
+    manifest["decoy_hashes"].extend(decoys)
+    manifest["chunk_data"].update(decoys)
+
+def decrypt_chunk(manifest, key, chunk_hash, ciphertext_b64):
+    with stage("b64decode", len(ciphertext_b64)):
+        ciphertext = base64.b64decode(ciphertext_b64)
+    nonce = base64.b64decode(manifest["nonces"][chunk_hash])
+    with stage("decrypt", len(ciphertext)):
+        cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
+        compressed = cipher.decrypt(ciphertext)
+    with stage("decompress", len(compressed)):
+        return decompress(compressed)
+
+def fetch_chunk(dht, chunk_hash):
+    with stage("fetch"):
+        return dht.retrieve(chunk_hash)
+
+def chunk_offsets(manifest):
+    # Manifests written before offsets were recorded always used fixed-size
+    # sub-chunks, so their plaintext offsets can be derived from the index.
+    if "offsets" in manifest:
+        return manifest["offsets"]
+    return [i * SUB_CHUNK_SIZE for i in range(len(manifest["chunks"]))]
+
+def chunks_for_range(manifest, start, length):
+    """Return the indices of the chunks overlapping plaintext [start, start + length)."""
+    offsets = chunk_offsets(manifest)
+    if length <= 0 or not offsets:
+        return range(0)
+    first = max(bisect_right(offsets, start) - 1, 0)
+    last = bisect_right(offsets, start + length - 1)
+    return range(first, last)
+
+def decrypt_range(manifest, key, dht, start, length):
+    """Fetch and decrypt only the chunks needed to return `length` bytes at `start`."""
     import threading
+    offsets = chunk_offsets(manifest)
+    indices = chunks_for_range(manifest, start, length)
     sub_chunks = {}
 
-    def retrieve_and_decrypt(chunk_hash):
-        ciphertext_b64 = dht.retrieve(chunk_hash)
+    def retrieve_and_decrypt(index):
+        chunk_hash = manifest["chunks"][index]
+        ciphertext_b64 = fetch_chunk(dht, chunk_hash)
         if not ciphertext_b64:
             print(f"[!] Missing chunk: {chunk_hash}")
             return
-        ciphertext = base64.b64decode(ciphertext_b64)
-        nonce = base64.b64decode(manifest["nonces"][chunk_hash])
-        cipher = AES.new(key, AES.MODE_EAX, nonce=nonce)
-        decrypted = cipher.decrypt(ciphertext)
-        sub_chunks[chunk_hash] = decompress(decrypted)
+        sub_chunks[index] = decrypt_chunk(manifest, key, chunk_hash, ciphertext_b64)
 
     threads = []
-    for chunk_hash in manifest["chunks"]:
-        t = threading.Thread(target=retrieve_and_decrypt, args=(chunk_hash,))
+    for index in indices:
+        t = threading.Thread(target=retrieve_and_decrypt, args=(index,))
         threads.append(t)
         t.start()
 
-    # Simulate traffic noise
-    for fake_hash in manifest.get("decoy_hashes", []):
-        _ = dht.retrieve(fake_hash)
+    for t in threads:
+        t.join()
+
+    missing = [i for i in indices if i not in sub_chunks]
+    if missing:
+        raise ValueError(f"Missing {len(missing)} chunk(s) for range {start}-{start + length}")
+
+    data = b"".join(sub_chunks[i] for i in indices)
+    skip = start - offsets[indices[0]] if indices else 0
+    return data[skip:skip + length]
+
+def iter_decrypted(manifest, key, dht, prefetch=8, workers=4, decoy_budget=None, pool=None):
+    """Yield the plaintext chunk by chunk, in order, as soon as each one arrives.
+
+    At most `prefetch` chunks are in flight or buffered at any time, so memory
+    stays bounded and the first bytes are ready after a single chunk fetch.
+    Decoy fetches are spread at random between the real ones, within budget.
+    Pass an executor as `pool` to share fetch threads between downloads.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    chunks = manifest["chunks"]
+    real_bytes = manifest.get("size") or len(chunks) * SUB_CHUNK_SIZE
+    budget = (decoy_budget or DecoyBudget()).start(real_bytes=real_bytes)
+    estimate = real_bytes // max(len(chunks), 1)
+    decoys = {}
+    for decoy_hash in manifest.get("decoy_hashes", []):
+        decoys.setdefault(random.randrange(max(len(chunks), 1)), []).append(decoy_hash)
+
+    def retrieve_and_decrypt(chunk_hash):
+        ciphertext_b64 = fetch_chunk(dht, chunk_hash)
+        if not ciphertext_b64:
+            raise IOError(f"Missing chunk: {chunk_hash}")
+        return decrypt_chunk(manifest, key, chunk_hash, ciphertext_b64)
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for index, chunk_hash in enumerate(chunks):
+            for decoy_hash in decoys.get(index, ()):
+                pool.submit(fetch_decoy, dht, decoy_hash, budget, estimate)
+            pending.append(pool.submit(retrieve_and_decrypt, chunk_hash))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+def decrypt_and_reconstruct(manifest, key, dht, output_path, decoy_budget=None):
+    import threading
+    sub_chunks = {}
+    real_count = len(manifest["chunks"])
+    real_bytes = manifest.get("size") or real_count * SUB_CHUNK_SIZE
+    budget = (decoy_budget or DecoyBudget()).start(real_bytes=real_bytes)
+    estimate = real_bytes // max(real_count, 1)
+
+    def retrieve_and_decrypt(chunk_hash):
+        ciphertext_b64 = fetch_chunk(dht, chunk_hash)
+        if not ciphertext_b64:
+            print(f"[!] Missing chunk: {chunk_hash}")
+            return
+        sub_chunks[chunk_hash] = decrypt_chunk(manifest, key, chunk_hash, ciphertext_b64)
+
+    # Decoy fetches go out on the same path as the real ones, interleaved at
+    # random, until the decoy budget is spent.
+    tasks = [(retrieve_and_decrypt, (h,)) for h in manifest["chunks"]]
+    tasks += [(fetch_decoy, (dht, h, budget, estimate)) for h in manifest.get("decoy_hashes", [])]
+    random.shuffle(tasks)
+
+    threads = []
+    for target, args in tasks:
+        t = threading.Thread(target=target, args=args)
+        threads.append(t)
+        t.start()
 
     for t in threads:
         t.join()
 
+    missing = [h for h in manifest["chunks"] if h not in sub_chunks]
+    if missing:
+        raise ValueError(f"Missing {len(missing)} of {real_count} chunk(s)")
+
     with open(output_path, "wb") as f:
         for chunk_hash in manifest["chunks"]:
-            f.write(sub_chunks[chunk_hash])
+            data = sub_chunks[chunk_hash]
+            with stage("write", len(data)):
+                f.write(data)
     print(f"✅ File reconstructed at: {output_path}")
+    report = budget.report()
+    if report["decoy_count"]:
+        print(f"🎭 Decoy traffic: {report['decoy_bytes'] // 1024} KB "
+              f"({report['decoy_fraction']:.0%} of transfer, {report['decoy_count']} fetches)")
+    return report
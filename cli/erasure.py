@@ -0,0 +1,241 @@
+import base64
+import struct
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from hashlib import sha256
+from itertools import combinations
+
+# Reed-Solomon erasure coding over GF(2^8).
+#
+# Each encrypted chunk is split into k data shards and m parity shards; any k
+# of the k+m shards rebuild the chunk. The code is systematic (the data shards
+# are plain slices of the chunk) and uses a Cauchy matrix for parity, so every
+# k x k submatrix of the generator is invertible. Multiplying a whole shard by
+# a constant is one bytes.translate() call and adding shards is an int XOR, so
+# the inner loops run in C.
+#
+# Shards are stored under keys derived from the chunk hash, which look like
+# any other chunk hash to peers; the manifest only records {"k": k, "m": m}.
+# A rebuilt chunk is checked against its sha256 chunk hash.
+
+POLY = 0x11d
+LENGTH = struct.Struct("<I")
+
+EXP = [0] * 512
+LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= POLY
+for _i in range(255, 512):
+    EXP[_i] = EXP[_i - 255]
+
+_mul_tables = {}
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return EXP[LOG[a] + LOG[b]]
+
+
+def gf_inv(a):
+    return EXP[255 - LOG[a]]
+
+
+def mul_table(c):
+    table = _mul_tables.get(c)
+    if table is None:
+        table = _mul_tables[c] = bytes(gf_mul(c, x) for x in range(256))
+    return table
+
+
+def _xor_into(acc, data):
+    return acc ^ int.from_bytes(data, "little")
+
+
+def _combine(coeffs, shards, length):
+    """sum(coeff * shard) over GF(2^8), for equal-length shards."""
+    acc = 0
+    for c, shard in zip(coeffs, shards):
+        if c == 1:
+            acc = _xor_into(acc, shard)
+        elif c:
+            acc = _xor_into(acc, shard.translate(mul_table(c)))
+    return acc.to_bytes(length, "little")
+
+
+def cauchy_row(i, k):
+    # x_i = k + i and y_j = j never collide, so x_i ^ y_j is never zero.
+    return [gf_inv((k + i) ^ j) for j in range(k)]
+
+
+def generator_row(index, k):
+    if index < k:
+        return [1 if j == index else 0 for j in range(k)]
+    return cauchy_row(index - k, k)
+
+
+def invert(matrix):
+    """Gauss-Jordan inverse of a square matrix over GF(2^8)."""
+    n = len(matrix)
+    rows = [list(row) + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next(r for r in range(col, n) if rows[r][col])
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        scale = gf_inv(rows[col][col])
+        rows[col] = [gf_mul(scale, v) for v in rows[col]]
+        for r in range(n):
+            if r != col and rows[r][col]:
+                factor = rows[r][col]
+                rows[r] = [v ^ gf_mul(factor, p) for v, p in zip(rows[r], rows[col])]
+    return [row[n:] for row in rows]
+
+
+def encode(data, k, m):
+    """Split `data` into k data shards plus m parity shards of equal length."""
+    payload = LENGTH.pack(len(data)) + data
+    size = -(-len(payload) // k)
+    payload += bytes(size * k - len(payload))
+    shards = [payload[j * size:(j + 1) * size] for j in range(k)]
+    for i in range(m):
+        shards.append(_combine(cauchy_row(i, k), shards, size))
+    return shards
+
+
+def decode(available, k):
+    """Rebuild the data from a dict of shard index -> shard with at least k entries."""
+    indices = sorted(available)[:k]
+    if len(indices) < k:
+        raise ValueError(f"Need {k} shards, got {len(indices)}")
+    shards = [available[i] for i in indices]
+    if indices != list(range(k)):
+        size = len(shards[0])
+        inverse = invert([generator_row(i, k) for i in indices])
+        shards = [_combine(row, shards, size) for row in inverse]
+    payload = b"".join(shards)
+    (length,) = LENGTH.unpack_from(payload)
+    return payload[LENGTH.size:LENGTH.size + length]
+
+
+def shard_key(chunk_hash, index):
+    return sha256(f"{chunk_hash}:{index}".encode()).hexdigest()
+
+
+def encode_manifest(manifest, k=4, m=2):
+    """Replace the manifest's real chunk data with k+m erasure-coded shards each.
+
+    Decoys are left as they are. Store `manifest["chunk_data"]` as usual
+    afterwards; each shard is an ordinary DHT entry.
+    """
+    chunk_data = manifest["chunk_data"]
+    for chunk_hash in manifest["chunks"]:
+        ciphertext = base64.b64decode(chunk_data.pop(chunk_hash))
+        for index, shard in enumerate(encode(ciphertext, k, m)):
+            chunk_data[shard_key(chunk_hash, index)] = base64.b64encode(shard).decode()
+    manifest["erasure"] = {"k": k, "m": m}
+    return manifest
+
+
+def chunk_keys(manifest):
+    """The keys the manifest's real chunks are stored under: shard keys or chunk hashes."""
+    erasure = manifest.get("erasure")
+    if erasure:
+        n = erasure["k"] + erasure["m"]
+        return [shard_key(h, i) for h in manifest["chunks"] for i in range(n)]
+    return list(manifest["chunks"])
+
+
+def stored_hashes(manifest):
+    """Every key the manifest's chunks are stored under: shards or chunks, then decoys."""
+    return chunk_keys(manifest) + list(manifest.get("decoy_hashes", []))
+
+
+# Shard fetches of every ErasureDHT share one pool, so a long-running server
+# does not gain a pool of threads per download.
+SHARD_WORKERS = 32
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+
+
+def shard_pool():
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shards")
+    return _shard_pool
+
+
+class ErasureDHT:
+    """Wraps a DHT so `retrieve(chunk_hash)` rebuilds erasure-coded chunks.
+
+    All k+m shards are requested at once; as soon as any k have arrived the
+    chunk is decoded and the remaining requests are cancelled (or ignored if
+    already running). Other keys, e.g. decoys, pass straight through. Fetches
+    run on the shared shard_pool() unless `workers` asks for a private pool,
+    which close() shuts down.
+    """
+
+    def __init__(self, dht, manifest, workers=None):
+        self.dht = dht
+        self.nonces = manifest["nonces"]  # keyed by real chunk hashes only
+        self.k = manifest["erasure"]["k"]
+        self.m = manifest["erasure"]["m"]
+        self._own_pool = workers is not None
+        self.pool = ThreadPoolExecutor(max_workers=workers) if self._own_pool else shard_pool()
+
+    def close(self):
+        if self._own_pool:
+            self.pool.shutdown(cancel_futures=True)
+
+    def store(self, key, value):
+        self.dht.store(key, value)
+
+    def _fetch_shard(self, chunk_hash, index):
+        data = self.dht.retrieve(shard_key(chunk_hash, index))
+        return base64.b64decode(data) if data else None
+
+    def retrieve_shards(self, chunk_hash, want=None):
+        want = self.k if want is None else want
+        futures = {self.pool.submit(self._fetch_shard, chunk_hash, i): i for i in range(self.k + self.m)}
+        shards = {}
+        pending = set(futures)
+        while pending and len(shards) < want:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = None if future.exception() else future.result()
+                if shard is not None:
+                    shards[futures[future]] = shard
+        for future in pending:
+            future.cancel()
+        return shards
+
+    def retrieve(self, chunk_hash):
+        if chunk_hash not in self.nonces:
+            return self.dht.retrieve(chunk_hash)  # not erasure-coded (decoy)
+        shards = self.retrieve_shards(chunk_hash)
+        if len(shards) < self.k:
+            print(f"[!] Only {len(shards)} of {self.k} shards found for {chunk_hash}")
+            return None
+        ciphertext = decode(shards, self.k)
+        if sha256(ciphertext).hexdigest() != chunk_hash:
+            # A shard is corrupt: fetch every shard and find a set that checks out.
+            shards = self.retrieve_shards(chunk_hash, want=self.k + self.m)
+            for subset in combinations(sorted(shards), self.k):
+                ciphertext = decode({i: shards[i] for i in subset}, self.k)
+                if sha256(ciphertext).hexdigest() == chunk_hash:
+                    break
+            else:
+                print(f"[!] Rebuilt chunk {chunk_hash} failed its hash check")
+                return None
+        return base64.b64encode(ciphertext).decode()
+
+
+def wrap_dht(dht, manifest):
+    """Return a DHT that understands the manifest's storage layout."""
+    if manifest.get("erasure") and not isinstance(dht, ErasureDHT):
+        return ErasureDHT(dht, manifest)
+    return dht
@@ -1,42 +1,138 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse,FileResponse
+from fastapi.responses import HTMLResponse,FileResponse,JSONResponse,PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.background import BackgroundTask
 import os
-import json
-import shutil
+import time
+import uuid
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import NamedTemporaryFile
 from encryption_utils import (generate_rsa_keypair_gui,load_public_key,
   encrypt_key_with_rsa,
   chunk_and_encrypt)
 from p2p_node import DHT
+from manifest_format import save_manifest
 from fastapi import UploadFile, File
-import threading
-from peer_server import start_server
+from peer_server import LOG_LINES, ChunkServer
+import metrics
 
 dht = DHT()
 app = FastAPI()
 
-@app.post("/upload", response_class=FileResponse)
-async def upload_file(file: UploadFile = File(...), pubkey: UploadFile = File(...)):
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# Encrypt/store jobs run here so a large upload never blocks the event loop.
+upload_pool = ThreadPoolExecutor(max_workers=2)
+upload_jobs = {}
+# A finished job is dropped once its manifest is fetched, or this long after it ends.
+UPLOAD_JOB_TTL = 15 * 60
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def evict_upload_jobs():
+    cutoff = time.time() - UPLOAD_JOB_TTL
+    for job_id, job in list(upload_jobs.items()):
+        if job.get("finished", cutoff + 1) < cutoff:
+            upload_jobs.pop(job_id, None)
+            if "manifest_path" in job:
+                remove_file(job["manifest_path"])
+
+async def save_upload(upload, temp_file):
+    while True:
+        block = await upload.read(UPLOAD_BLOCK_SIZE)
+        if not block:
+            break
+        await run_in_threadpool(temp_file.write, block)
+
+def run_upload_job(job_id, file_path, pubkey_path):
+    job = upload_jobs[job_id]
+
+    def progress(done, total):
+        job["done_bytes"] = done
+        job["total_bytes"] = total
+
+    try:
+        job["status"] = "encrypting"
+        pub_key = load_public_key(pubkey_path)
+        aes_key, manifest = chunk_and_encrypt(file_path, progress=progress)
+        manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
+
+        # Progress restarts for the store phase, counted in stored bytes.
+        job["done_bytes"] = 0
+        job["total_bytes"] = sum(len(chunk_data) for chunk_data in manifest["chunk_data"].values())
+        job["status"] = "storing"
+        for h, chunk_data in manifest["chunk_data"].items():
+            dht.store(h, chunk_data)
+            job["done_bytes"] += len(chunk_data)
+
+        manifest_path = file_path + "_manifest.p2pm"
+        save_manifest(manifest, manifest_path)
+        job["manifest_path"] = manifest_path
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "error"
+        job["error"] = str(e)
+    finally:
+        job["finished"] = time.time()
+        # The plaintext upload never outlives its job; only the manifest is kept.
+        remove_file(file_path)
+        remove_file(pubkey_path)
+
+@app.post("/upload", response_class=HTMLResponse)
+async def upload_file(request: Request, file: UploadFile = File(...), pubkey: UploadFile = File(...)):
 
     with NamedTemporaryFile(delete=False) as temp_file, NamedTemporaryFile(delete=False) as temp_pubkey:
-        shutil.copyfileobj(file.file, temp_file)
-        shutil.copyfileobj(pubkey.file, temp_pubkey)
+        await save_upload(file, temp_file)
+        await save_upload(pubkey, temp_pubkey)
         file_path = temp_file.name
         pubkey_path = temp_pubkey.name
 
-    pub_key = load_public_key(pubkey_path)
-    aes_key, manifest = chunk_and_encrypt(file_path)
-    manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
-    for h, chunk_data in manifest["chunk_data"].items():
-        dht.store(h, chunk_data)
-
-    manifest_path = file_path + "_manifest.json"
-    with open(manifest_path, "w") as f:
-        json.dump(manifest, f)
-
-    return FileResponse(manifest_path, filename="manifest.json", media_type="application/json")
+    evict_upload_jobs()
+    job_id = uuid.uuid4().hex
+    upload_jobs[job_id] = {
+        "status": "queued",
+        "filename": file.filename,
+        "done_bytes": 0,
+        "total_bytes": os.path.getsize(file_path),
+        "started": time.time(),
+    }
+    asyncio.get_running_loop().run_in_executor(upload_pool, run_upload_job, job_id, file_path, pubkey_path)
+
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"job_id": job_id}, status_code=202)
+    return templates.TemplateResponse("upload_status.html", {"request": request, "job_id": job_id})
+
+@app.get("/upload/status/{job_id}")
+async def upload_status(job_id: str):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    status = {k: v for k, v in job.items() if k != "manifest_path"}
+    status["progress"] = round(job["done_bytes"] / job["total_bytes"], 4) if job["total_bytes"] else 1.0
+    return status
+
+@app.get("/upload/result/{job_id}")
+async def upload_result(job_id: str):
+    job = upload_jobs.get(job_id)
+    if job is None or job["status"] != "done":
+        return JSONResponse({"error": "Manifest not ready"}, status_code=404)
+    del upload_jobs[job_id]
+    return FileResponse(job["manifest_path"], filename="manifest.p2pm", media_type="application/octet-stream",
+                        background=BackgroundTask(remove_file, job["manifest_path"]))
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    if not metrics.ENABLED:
+        return PlainTextResponse("Metrics are off; start with P2P_METRICS=1\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -65,26 +161,56 @@ async def download_private_key():
 async def download_public_key():
   return FileResponse("generated/my_public.pem", filename="my_public.pem", media_type='application/octet-stream')
     
-logs=[]
+logs=deque(maxlen=LOG_LINES)
 active_server = False
+# One chunk server per process; further manifests are added to it while it runs.
+chunk_server = None
 @app.post("/start-chunk-server")
 async def start_chunk_server(request: Request):
+    global chunk_server, active_server
     form = await request.form()
     manifest_path = form.get("manifest_path")
 
-    if not os.path.exists(manifest_path):
+    if not manifest_path.startswith(("segment:", "sqlite:")) and not os.path.exists(manifest_path):
         return templates.TemplateResponse("error.html", {
             "request": request,
             "msg": "Manifest file not found!"
         })
-    logs.clear()
+    try:
+        if chunk_server is None:
+            chunk_server = ChunkServer(log_collector=logs)
+            chunk_server.add(manifest_path)
+            chunk_server.start()
+            msg = f"Chunk server started on port 5000 with {manifest_path}"
+        else:
+            chunk_server.add(manifest_path)
+            msg = f"Now also serving {manifest_path} ({len(chunk_server.index.names())} sources)"
+    except ValueError as e:
+        return templates.TemplateResponse("error.html", {"request": request, "msg": str(e)})
     active_server=True
-    threading.Thread(target=start_server, args=(manifest_path,logs), daemon=True).start()
 
     return templates.TemplateResponse("success.html", {
         "request": request,
-        "msg": f"Chunk server started on port 5000 with {manifest_path}",
-        "logs":logs
+        "msg": msg,
+        "logs":logs,
+        "sources": chunk_server.index.names()
+    })
+
+@app.post("/stop-serving")
+async def stop_serving(request: Request):
+    form = await request.form()
+    manifest_path = form.get("manifest_path")
+    if chunk_server is None or manifest_path not in chunk_server.index.names():
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "msg": f"Not serving {manifest_path}"
+        })
+    chunk_server.remove(manifest_path)
+    return templates.TemplateResponse("success.html", {
+        "request": request,
+        "msg": f"Stopped serving {manifest_path}",
+        "logs": logs,
+        "sources": chunk_server.index.names()
     })
 
 @app.get("/view-active-server-log")
@@ -92,12 +218,14 @@ async def view_active_server(request: Request):
     return templates.TemplateResponse("success.html", {
         "request": request,
         "msg": "Chunk server is still running...",
-        "logs": logs
+        "logs": logs,
+        "sources": chunk_server.index.names() if chunk_server else []
     })
 @app.post("/view-logs")
 async def view_logs(request: Request):
     return templates.TemplateResponse("success.html", {
         "request": request,
         "msg": "Chunk server is still running...",
-        "logs": logs
+        "logs": logs,
+        "sources": chunk_server.index.names() if chunk_server else []
     })
\ No newline at end of file
@@ -1,40 +1,215 @@
 from fastapi import FastAPI, UploadFile, Form, Request
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from tempfile import NamedTemporaryFile
 import shutil, json, os
-from encryption_utils import load_private_key, decrypt_key_with_rsa, decrypt_and_reconstruct
-import socket
+import queue, threading
+import asyncio, random, time
+from concurrent.futures import ThreadPoolExecutor
+from encryption_utils import load_private_key, decrypt_key_with_rsa, iter_decrypted
+from chunk_cache import ChunkCache
+from manifest_format import load_manifest
+from erasure import chunk_keys, wrap_dht
+import metrics
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 PORT = 3500
+# Decrypted chunks buffered ahead of a download (and its disk copy).
+STREAM_PREFETCH = 16
+# Threads that wait on the retrieval loop, shared by every download.
+FETCH_WORKERS = 32
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+
+# Shared across requests so repeated downloads of hot files are served locally.
+chunk_cache = ChunkCache(spill_dir=os.path.join("received_files", ".chunk_cache"))
+
+# All peer fetches run as coroutines on one background event loop, so the
+# thousands of chunk requests of a download share a single thread and socket
+# I/O never blocks the web server.
+_loop = None
+_loop_lock = threading.Lock()
+
+def retrieval_loop():
+  global _loop
+  with _loop_lock:
+    if _loop is None:
+      _loop = asyncio.new_event_loop()
+      threading.Thread(target=_loop.run_forever, daemon=True).start()
+  return _loop
+
+
+def percentile(values, pct):
+  if not values:
+    return 0.0
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
 
 class SocketDHT:
-  def __init__(self, real_hashes, ip):
-    self.cache = {}
+  """Fetches chunks from a peer server with asyncio.
+
+  Each request has a connect/read `timeout`, at most `concurrency` requests
+  are in flight, and failed requests are retried up to `retries` times with
+  exponential backoff plus jitter. `retrieve()` stays synchronous so the
+  existing decrypt functions can call it from the threads of `fetch_pool`.
+  """
+
+  def __init__(self, real_hashes, ip, cache=None, port=5000, timeout=5.0,
+               concurrency=32, retries=3, backoff=0.1):
+    self.cache = cache if cache is not None else chunk_cache
     self.real_hashes = set(real_hashes)
     self.ip = ip
+    self.port = port
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.loop = retrieval_loop()
+    self.semaphore = asyncio.Semaphore(concurrency)
+    self.latencies = []
+    self.stats = {"requests": 0, "cache_hits": 0, "retries": 0, "timeouts": 0, "failures": 0}
 
-  def retrieve(self, chunk_hash):
-    if chunk_hash not in self.real_hashes:
-      return None
-    if chunk_hash in self.cache:
-      return self.cache[chunk_hash]
-
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-      s.connect((self.ip, 5000))
-      s.sendall(json.dumps({ "hash": chunk_hash }).encode())
-      response = s.recv(65536).decode()
-      reply = json.loads(response)
+  async def _request(self, chunk_hash):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(self.ip, self.port), self.timeout)
+    try:
+      writer.write(json.dumps({ "hash": chunk_hash }).encode())
+      await writer.drain()
+      # The server closes the connection after its reply.
+      response = await asyncio.wait_for(reader.read(), self.timeout)
+    finally:
+      writer.close()
+    return json.loads(response.decode())
+
+  async def fetch(self, chunk_hash):
+    for attempt in range(self.retries + 1):
+      if attempt:
+        self.stats["retries"] += 1
+        await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+      self.stats["requests"] += 1
+      try:
+        # A slot is held for the request only, never through the backoff sleep,
+        # so a flaky chunk does not throttle the healthy ones.
+        async with self.semaphore:
+          start = time.perf_counter()
+          reply = await self._request(chunk_hash)
+      except asyncio.TimeoutError:
+        self.stats["timeouts"] += 1
+        metrics.inc("p2p_peer_requests_total", help_text="Chunk requests to peers, by outcome", outcome="timeout")
+        continue
+      except (OSError, ValueError):
+        metrics.inc("p2p_peer_requests_total", help_text="Chunk requests to peers, by outcome", outcome="error")
+        continue
+      latency = time.perf_counter() - start
+      self.latencies.append(latency)
+      metrics.observe("p2p_peer_request_seconds", latency, help_text="Round trip of answered peer chunk requests")
+      metrics.inc("p2p_peer_requests_total", help_text="Chunk requests to peers, by outcome",
+                  outcome=reply.get("status", "error").lower())
       if reply.get("status") == "OK":
-        self.cache[chunk_hash] = reply["chunk"]
         return reply["chunk"]
+      break  # NOT_FOUND is an answer, not a transient failure
+    self.stats["failures"] += 1
     return None
 
+  def retrieve(self, chunk_hash):
+    # Decoys are fetched over the network like real chunks (cover traffic)
+    # but never cached.
+    is_real = chunk_hash in self.real_hashes
+    if is_real:
+      chunk = self.cache.get(chunk_hash)
+      if chunk is not None:
+        self.stats["cache_hits"] += 1
+        metrics.inc("p2p_chunk_cache_hits_total", help_text="Real chunks served from the local chunk cache")
+        return chunk
+
+    chunk = asyncio.run_coroutine_threadsafe(self.fetch(chunk_hash), self.loop).result()
+    if chunk is not None and is_real:
+      self.cache.put(chunk_hash, chunk)
+    return chunk
+
+  def report(self):
+    report = dict(self.stats)
+    for pct in (50, 95, 99):
+      report[f"p{pct}_ms"] = round(percentile(self.latencies, pct) * 1000, 1)
+    return report
+
+
+def tee_to_file(chunks, output_path):
+  # The disk copy is written by its own thread through a bounded queue, so a
+  # slow disk never stalls the HTTP stream by more than STREAM_PREFETCH chunks.
+  # The file only gets its final name once the whole stream has been written.
+  pending = queue.Queue(maxsize=STREAM_PREFETCH)
+  part_path = output_path + ".part"
+
+  def writer():
+    with open(part_path, "wb") as f:
+      while True:
+        data = pending.get()
+        if data is None:
+          break
+        with metrics.stage("write", len(data)):
+          f.write(data)
+
+  thread = threading.Thread(target=writer, daemon=True)
+  thread.start()
+  complete = False
+  try:
+    for data in chunks:
+      pending.put(data)
+      yield data
+    complete = True
+  finally:
+    pending.put(None)
+    thread.join()
+    if complete:
+      os.replace(part_path, output_path)
+      print(f"✅ File reconstructed at: {output_path}")
+    else:
+      os.remove(part_path)
+
+
+def remove_file(path):
+  try:
+    os.remove(path)
+  except FileNotFoundError:
+    pass
+
+
+def reconstruct_file(manifest_data, aes_key, dht, output_path):
+  # Fetches go through fetch_pool like streaming ones, so a large file parks
+  # at most FETCH_WORKERS threads on the retrieval loop, not one per chunk.
+  part_path = output_path + ".part"
+  try:
+    with open(part_path, "wb") as f:
+      for data in iter_decrypted(manifest_data, aes_key, dht, prefetch=STREAM_PREFETCH, pool=fetch_pool):
+        with metrics.stage("write", len(data)):
+          f.write(data)
+  except BaseException:
+    remove_file(part_path)
+    raise
+  os.replace(part_path, output_path)
+  print(f"✅ File reconstructed at: {output_path}")
+
+
+def stream_file(manifest_data, aes_key, dht, output_path=None, cleanup=()):
+  try:
+    chunks = iter_decrypted(manifest_data, aes_key, dht, prefetch=STREAM_PREFETCH, pool=fetch_pool)
+    if output_path:
+      chunks = tee_to_file(chunks, output_path)
+    yield from chunks
+  except Exception as e:
+    # Headers are already sent, so the client only sees a truncated body.
+    print(f"[!] Streaming download aborted: {e}")
+    raise
+  finally:
+    if hasattr(manifest_data, "close"):
+      manifest_data.close()
+    for path in cleanup:
+      remove_file(path)
+
 
 @app.get("/", response_class=HTMLResponse)
 async def homepage(request: Request):
@@ -46,33 +221,52 @@ async def submit_manifest(
   request: Request,
   manifest: UploadFile,
   privkey: UploadFile,
-  server_ip: str = Form(...)
+  server_ip: str = Form(...),
+  stream: bool = Form(False),
+  save_copy: bool = Form(False)
 ):
+  # Both temp files hold secrets (the private key, the manifest with its
+  # wrapped AES key) and are removed when the request ends. A streaming
+  # response hands them to stream_file(), which removes them when the body ends.
+  manifest_path = priv_key_path = manifest_data = None
+  streaming = False
   try:
     with NamedTemporaryFile(delete=False) as mfile, NamedTemporaryFile(delete=False) as kfile:
-      shutil.copyfileobj(manifest.file, mfile)
-      shutil.copyfileobj(privkey.file, kfile)
       manifest_path = mfile.name
       priv_key_path = kfile.name
+      shutil.copyfileobj(manifest.file, mfile)
+      shutil.copyfileobj(privkey.file, kfile)
 
-    output_path = "received_output_from_peer"  # Can be auto-named too
-
-    with open(manifest_path, "r") as f:
-      manifest_data = json.load(f)
+    manifest_data = load_manifest(manifest_path)
 
     priv_key = load_private_key(priv_key_path)
     aes_key = decrypt_key_with_rsa(priv_key, bytes.fromhex(manifest_data["encrypted_key"]))
 
-    dht = SocketDHT(manifest_data["chunks"], server_ip)
+    socket_dht = SocketDHT(chunk_keys(manifest_data), server_ip)
+    dht = wrap_dht(socket_dht, manifest_data)
     output_file_path = os.path.join("received_files", "RECEIVED_" + manifest_data["filename"])
     os.makedirs("received_files", exist_ok=True)
 
-    decrypt_and_reconstruct(manifest_data, aes_key, dht, output_file_path)
+    if stream:
+      # Pipe chunks to the browser as they are decrypted instead of
+      # reconstructing the whole file first.
+      headers = {"Content-Disposition": f'attachment; filename="{manifest_data["filename"]}"'}
+      if manifest_data.get("size") is not None:
+        headers["Content-Length"] = str(manifest_data["size"])
+      body = stream_file(manifest_data, aes_key, dht,
+                         output_path=output_file_path if save_copy else None,
+                         cleanup=(priv_key_path, manifest_path))
+      streaming = True
+      return StreamingResponse(body, media_type="application/octet-stream", headers=headers)
+
+    # Fetching and decrypting take the whole transfer; keep them off the event loop.
+    await run_in_threadpool(reconstruct_file, manifest_data, aes_key, dht, output_file_path)
 
     return templates.TemplateResponse("client_success.html", {
       "request": request,
       "msg": "File reconstructed successfully!",
-      "filepath": output_file_path
+      "filepath": output_file_path,
+      "stats": socket_dht.report()
     })
 
   except Exception as e:
@@ -80,6 +274,20 @@ async def submit_manifest(
       "request": request,
       "msg": f"Error: {e}"
     })
+  finally:
+    if not streaming:
+      if hasattr(manifest_data, "close"):
+        manifest_data.close()
+      for path in (priv_key_path, manifest_path):
+        if path:
+          remove_file(path)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+  if not metrics.ENABLED:
+    return PlainTextResponse("Metrics are off; start with P2P_METRICS=1\n", status_code=404)
+  return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/download")
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import httpx
+from Crypto.PublicKey import RSA
+
+# Load test for the GUI server (uvicorn gui:app): runs concurrent uploads while
+# repeatedly loading the home page, and reports page latency during the uploads.
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def upload(client, payload, pubkey):
+    start = time.perf_counter()
+    response = await client.post(
+        "/upload",
+        files={"file": ("load.bin", payload), "pubkey": ("pub.pem", pubkey)},
+        headers={"accept": "application/json"},
+    )
+    job_id = response.json()["job_id"]
+    accepted = time.perf_counter() - start
+    while True:
+        status = (await client.get(f"/upload/status/{job_id}")).json()
+        if status["status"] in ("done", "error"):
+            return accepted, time.perf_counter() - start, status["status"]
+        await asyncio.sleep(0.1)
+
+
+async def page_loads(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+async def run(url, uploads, size_mb, pages):
+    pubkey = RSA.generate(2048).publickey().export_key()
+    payload = os.urandom(size_mb * 1024 * 1024)
+
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        latencies = []
+        stop = asyncio.Event()
+        loaders = [asyncio.create_task(page_loads(client, stop, latencies)) for _ in range(pages)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(upload(client, payload, pubkey) for _ in range(uploads)))
+        total = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*loaders)
+
+    accepted = [r[0] for r in results]
+    finished = [r[1] for r in results]
+    failed = sum(1 for r in results if r[2] != "done")
+    print(f"uploads: {uploads} x {size_mb} MB in {total:.2f}s ({failed} failed)")
+    print(f"upload accepted  p50 {percentile(accepted, 50) * 1000:.0f} ms   max {max(accepted) * 1000:.0f} ms")
+    print(f"upload finished  p50 {percentile(finished, 50):.2f} s    max {max(finished):.2f} s")
+    print(f"page loads: {len(latencies)}  p50 {statistics.median(latencies) * 1000:.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms  p99 {percentile(latencies, 99) * 1000:.1f} ms  "
+          f"max {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload + page load test for gui.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=4, help="concurrent page-load loops")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.uploads, args.size_mb, args.pages))
+
+
+if __name__ == "__main__":
+    main()
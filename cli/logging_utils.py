@@ -0,0 +1,152 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Levelled logging that keeps terminal I/O off the hot path.
+#
+#   from logging_utils import get_logger, Progress
+#   log = get_logger(__name__)
+#   log.debug("Stored: %s", key)          # per-chunk detail, hidden by default
+#   progress = Progress(total_bytes, "Uploading")
+#   progress.update(len(chunk))           # redraws at most a few times a second
+#   progress.close()
+#
+# Records are handed to a QueueHandler; one listener thread formats and writes
+# them, so a slow terminal or log pipe never stalls a worker. P2P_LOG_LEVEL
+# (default INFO) sets the level and P2P_LOG_FORMAT=json writes one JSON object
+# per line for log pipelines. Progress bars go through the same queue; use
+# the logger rather than print() in a function that draws one, since print()
+# bypasses the queue and can land out of order.
+
+ROOT = "p2p"
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+class _ConsoleHandler(logging.StreamHandler):
+    """Writes log lines and progress bars from the one listener thread, in order.
+
+    With no stream it writes to whatever sys.stdout is now, so redirecting
+    stdout also moves the logs. A record with `bar` set is a progress bar: on
+    a terminal it is rewritten in place, and the next log line starts below it.
+    """
+
+    def __init__(self, stream=None):
+        self._target = stream
+        self._bar_open = False
+        super().__init__(stream)
+
+    @property
+    def stream(self):
+        return self._target or sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+    def isatty(self):
+        return hasattr(self.stream, "isatty") and self.stream.isatty()
+
+    def emit(self, record):
+        bar = getattr(record, "bar", None)
+        if bar is None or not self.isatty():
+            if self._bar_open:
+                self.stream.write("\n")
+                self._bar_open = False
+            super().emit(record)
+            return
+        try:
+            self.stream.write("\r" + record.getMessage() + ("\n" if bar == "done" else ""))
+            self.stream.flush()
+            self._bar_open = bar != "done"
+        except Exception:
+            self.handleError(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname,
+                 "logger": record.name, "msg": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """Route the "p2p" loggers through a background queue listener; safe to call repeatedly."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        level = level or os.environ.get("P2P_LOG_LEVEL", "INFO")
+        fmt = fmt or os.environ.get("P2P_LOG_FORMAT", "text")
+        _handler = _ConsoleHandler(stream)
+        _handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter("%(message)s"))
+
+        records = queue.SimpleQueue()
+        logger = logging.getLogger(ROOT)
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.propagate = False
+        _listener = logging.handlers.QueueListener(records, _handler)
+        _listener.start()
+        atexit.register(_listener.stop)  # drains the queue before exit
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+class Progress:
+    """One progress bar with MB/s and ETA, redrawn at most every `interval` seconds.
+
+    The bar goes through the same queue as the log records, so it never
+    interleaves with them out of order. On a terminal it is rewritten in
+    place; otherwise (a pipe or a log file) a progress line is logged at most
+    every `log_interval` seconds. update() is thread-safe and cheap between
+    redraws, so it can be called once per chunk.
+    """
+
+    def __init__(self, total, label="Progress", interval=0.2, log_interval=5.0):
+        self.total = total
+        self.label = label
+        self._log = get_logger("progress")
+        self.interval = interval if _handler.isatty() else log_interval
+        self.done = 0
+        self.started = time.monotonic()
+        self._next_draw = self.started
+        self._lock = threading.Lock()
+
+    def update(self, nbytes):
+        self.set(self.done + nbytes)
+
+    def set(self, done):
+        with self._lock:
+            self.done = done
+            now = time.monotonic()
+            if now < self._next_draw:
+                return
+            self._next_draw = now + self.interval
+            self._log.info(self._line(now), extra={"bar": "draw"})
+
+    def _line(self, now):
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        fraction = min(self.done / self.total, 1.0) if self.total else 1.0
+        eta = (self.total - self.done) / rate if rate and self.total else 0.0
+        bar = "#" * int(fraction * 30)
+        return (f"{self.label} [{bar:<30}] {fraction:4.0%} {self.done / 1e6:.1f}/{self.total / 1e6:.1f} MB "
+                f"{rate / 1e6:6.2f} MB/s ETA {eta:4.0f}s")
+
+    def close(self):
+        with self._lock:
+            self._log.info(self._line(time.monotonic()), extra={"bar": "done"})
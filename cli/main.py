@@ -1,38 +1,87 @@
+import argparse
 import os
-import json
 from encryption_utils import (
     generate_rsa_keypair, load_private_key, load_public_key,
     encrypt_key_with_rsa, decrypt_key_with_rsa,
-    chunk_and_encrypt, decrypt_and_reconstruct
+    chunk_and_encrypt, decrypt_and_reconstruct, decrypt_range
 )
 from p2p_node import DHT, PeerNode
-
+from manifest_format import open_manifest, read_header, save_manifest
+from erasure import encode_manifest, wrap_dht
+from bundle import chunk_and_encrypt_dir, extract_bundle, is_bundle
+from logging_utils import get_logger, Progress
+from profiling import add_arguments, profiled
+
+# Set to (k, m) to store each chunk as k data + m parity shards, e.g. (4, 2):
+# any k of the k + m shards rebuild the chunk, for 1.5x storage instead of 3x
+# for replication. None stores chunks whole.
+ERASURE_CODING = None
+
+log = get_logger(__name__)
 dht = DHT()
 peer_node = PeerNode(dht)
 
-def upload_file():
-    file_path = input("Enter file path: ").strip()
+def upload(file_path, pub_key_path):
+    pub_key = load_public_key(pub_key_path)
+    # A directory is packed into one bundle manifest with a file table.
+    encrypt = chunk_and_encrypt_dir if os.path.isdir(file_path) else chunk_and_encrypt
+    progress = Progress(0, "🔐 Encrypting")
+    def report(done, total):
+        progress.total = total
+        progress.set(done)
+    aes_key, manifest = encrypt(file_path, progress=report)
+    progress.close()
+
+    manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
+    if ERASURE_CODING:
+        encode_manifest(manifest, *ERASURE_CODING)
+
+    progress = Progress(sum(len(v) for v in manifest["chunk_data"].values()), "📤 Storing")
+    for h in manifest["chunk_data"]:
+        dht.store(h, manifest["chunk_data"][h])
+        progress.update(len(manifest["chunk_data"][h]))
+    progress.close()
+
+    manifest_path = file_path.rstrip("/" + os.sep) + "_manifest.p2pm"
+    save_manifest(manifest, manifest_path)
+
+    log.info(f"✅ Uploaded and manifest saved at: {manifest_path}")
+    return manifest_path
+
+def upload_file(args=None):
+    file_path = input("Enter file or directory path: ").strip()
     pub_key_path = input("Enter receiver's public key path: ").strip()
 
     if not os.path.exists(file_path) or not os.path.exists(pub_key_path):
         print("Invalid paths.")
         return
 
-    pub_key = load_public_key(pub_key_path)
-    aes_key, manifest = chunk_and_encrypt(file_path)
+    with profiled(args, "upload"):
+        upload(file_path, pub_key_path)
 
-    manifest["encrypted_key"] = encrypt_key_with_rsa(pub_key, aes_key).hex()
+def download(manifest_path, priv_key_path, output_path, names=None):
+    with open_manifest(manifest_path) as manifest:
+        priv_key = load_private_key(priv_key_path)
+        enc_key = bytes.fromhex(manifest["encrypted_key"])
+        aes_key = decrypt_key_with_rsa(priv_key, enc_key)
 
-    for h in manifest["chunk_data"]:
-        dht.store(h, manifest["chunk_data"][h])
+        if is_bundle(manifest):
+            # Files are written under output_path; `names` picks single files.
+            if os.path.isdir(output_path):
+                output_path = os.path.join(output_path, "RECEIVED_" + manifest["filename"])
+            written = extract_bundle(manifest, aes_key, wrap_dht(dht, manifest), output_path, names)
+            print(f"✅ Extracted {len(names) if names else len(manifest['files'])} file(s), "
+                  f"{written} bytes, to: {output_path}")
+            return output_path
 
-    manifest_path = file_path + "_manifest.json"
-    with open(manifest_path, "w") as f:
-        json.dump(manifest, f)
+        if os.path.isdir(output_path):
+            filename = "RECEIVED_" + manifest["filename"]
+            output_path = os.path.join(output_path, filename)
 
-    print(f"✅ Uploaded and manifest saved at: {manifest_path}")
+        decrypt_and_reconstruct(manifest, aes_key, wrap_dht(dht, manifest), output_path)
+        return output_path
 
-def download_file():
+def download_file(args=None):
     manifest_path = input("Enter manifest path: ").strip()
     priv_key_path = input("Enter your private key path: ").strip()
     output_path = input("Enter path where output file should be saved: ").strip()
@@ -41,21 +90,50 @@ def download_file():
         print("Invalid paths.")
         return
 
-    with open(manifest_path, "r") as f:
-        manifest = json.load(f)
+    names = None
+    if read_header(manifest_path).get("files"):
+        name = input("File inside the bundle to extract (blank for all): ").strip()
+        names = [name] if name else None
+
+    with profiled(args, "download"):
+        download(manifest_path, priv_key_path, output_path, names)
+
+def download_byte_range(manifest_path, priv_key_path, start, length, output_path):
+    with open_manifest(manifest_path) as manifest:
+        priv_key = load_private_key(priv_key_path)
+        enc_key = bytes.fromhex(manifest["encrypted_key"])
+        aes_key = decrypt_key_with_rsa(priv_key, enc_key)
 
-    priv_key = load_private_key(priv_key_path)
-    enc_key = bytes.fromhex(manifest["encrypted_key"])
-    aes_key = decrypt_key_with_rsa(priv_key, enc_key)
+        if os.path.isdir(output_path):
+            filename = f"RECEIVED_{start}-{start + length}_" + manifest["filename"]
+            output_path = os.path.join(output_path, filename)
+
+        data = decrypt_range(manifest, aes_key, wrap_dht(dht, manifest), start, length)
+        with open(output_path, "wb") as f:
+            f.write(data)
+        print(f"✅ Wrote {len(data)} bytes to: {output_path}")
+        return output_path
+
+def download_range(args=None):
+    manifest_path = input("Enter manifest path: ").strip()
+    priv_key_path = input("Enter your private key path: ").strip()
+    start = input("Start offset (bytes): ").strip() or "0"
+    length = input("Length (bytes): ").strip()
+    output_path = input("Enter path where output file should be saved: ").strip()
 
-    if os.path.isdir(output_path):
-        filename = "RECEIVED_" + manifest["filename"]
-        output_path = os.path.join(output_path, filename)
+    if not os.path.exists(manifest_path) or not os.path.exists(priv_key_path):
+        print("Invalid paths.")
+        return
+    if not start.isdigit() or not length.isdigit():
+        print("Invalid range.")
+        return
+    start, length = int(start), int(length)
 
-    decrypt_and_reconstruct(manifest, aes_key, dht, output_path)
+    with profiled(args, "range"):
+        download_byte_range(manifest_path, priv_key_path, start, length, output_path)
 
 
-def cli():
+def cli(args=None):
     while True:
         print("\n--- P2P CLI Secure File Sharing (Phase 3) ---")
         print("1. Upload file")
@@ -63,12 +141,13 @@ def cli():
         print("3. Generate RSA Keypair")
         print("4. Connect to Peer")
         print("5. Exit")
+        print("6. Download byte range")
 
         choice = input("Choose an option: ").strip()
         if choice == "1":
-            upload_file()
+            upload_file(args)
         elif choice == "2":
-            download_file()
+            download_file(args)
         elif choice == "3":
             generate_rsa_keypair()
         elif choice == "4":
@@ -77,8 +156,14 @@ def cli():
             peer_node.connect_to_peer(ip, port)
         elif choice == "5":
             break
+        elif choice == "6":
+            download_range(args)
         else:
             print("Invalid choice.")
 
 if __name__ == "__main__":
-    cli()
+    # With --profile, each upload/download runs under the profiler; the
+    # prompts before it are not profiled.
+    parser = argparse.ArgumentParser(description="Secure P2P file sharing CLI")
+    add_arguments(parser)
+    cli(parser.parse_args())
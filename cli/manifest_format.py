@@ -0,0 +1,245 @@
+import base64
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from contextlib import contextmanager
+from compact_manifest import CompactManifest, DigestIndex
+from erasure import shard_key
+
+# Binary manifest file layout (version 2):
+#
+#   preamble   magic "P2PM", format version, header length, table length
+#   header     small JSON object: filename, size, encrypted key and counts
+#   table      CompactManifest.to_bytes() - chunk hashes, nonces, offsets, decoys
+#   data index one (offset, length) entry per chunk, then per decoy
+#   data       raw ciphertext of every chunk and decoy, back to back
+#
+# The header can be read without touching the chunk table, and chunk data is
+# read lazily through mmap, so large manifests cost almost nothing to open.
+# For an erasure-coded manifest (header "erasure": {"k", "m"}) a chunk's data
+# entry holds its k + m equal-length shards back to back, and chunk_data is
+# keyed by shard key instead of chunk hash. A directory bundle (bundle.py)
+# keeps its file table in the header as "files": [[path, offset, size], ...].
+# Version 1 is the original JSON manifest, which load_manifest still reads.
+MAGIC = b"P2PM"
+FORMAT_VERSION = 2
+PREAMBLE = struct.Struct("<4sBII")
+DATA_ENTRY = struct.Struct("<QI")
+MISSING = 0xFFFFFFFF
+# Optional manifest fields kept in the JSON header: the erasure layout and a
+# bundle's file table.
+HEADER_FIELDS = ("erasure", "files")
+
+
+def is_binary_manifest(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path):
+    """Return the manifest header (filename, size, counts, ...) without loading chunks."""
+    with open(path, "rb") as f:
+        preamble = f.read(PREAMBLE.size)
+        if preamble[:len(MAGIC)] != MAGIC:
+            f.seek(0)
+            manifest = json.load(f)
+            return {
+                "version": 1,
+                "filename": manifest["filename"],
+                "size": manifest.get("size"),
+                "encrypted_key": manifest.get("encrypted_key", ""),
+                "chunk_count": len(manifest["chunks"]),
+                "decoy_count": len(manifest.get("decoy_hashes", [])),
+                **{name: manifest[name] for name in HEADER_FIELDS if manifest.get(name) is not None},
+            }
+        _, version, header_len, _ = PREAMBLE.unpack(preamble)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported manifest version: {version}")
+        return json.loads(f.read(header_len))
+
+
+class _ChunkData(Mapping):
+    """Lazy hash -> base64 ciphertext mapping over the mmapped data section."""
+
+    def __init__(self, manifest_file):
+        self._file = manifest_file
+
+    def _locate(self, chunk_hash):
+        shards = self._file.shards
+        part = None
+        if shards:
+            i = self._file.shard_index.find(chunk_hash)
+            if i >= 0:
+                i, part = divmod(i, shards)
+        else:
+            i = self._file.table.index_of(chunk_hash)
+        if i < 0:
+            i = self._file.decoy_index.find(chunk_hash)
+            if i < 0:
+                return None
+            i += len(self._file.table)
+        pos = self._file.data_index_offset + i * DATA_ENTRY.size
+        offset, length = DATA_ENTRY.unpack_from(self._file.buffer, pos)
+        if length == MISSING:
+            return None
+        if part is not None:
+            length //= shards
+            offset += part * length
+        return offset, length
+
+    def raw(self, chunk_hash):
+        location = self._locate(chunk_hash)
+        if location is None:
+            raise KeyError(chunk_hash)
+        offset, length = location
+        return self._file.buffer[offset:offset + length]
+
+    def __getitem__(self, chunk_hash):
+        return base64.b64encode(self.raw(chunk_hash)).decode()
+
+    def __contains__(self, chunk_hash):
+        return self._locate(chunk_hash) is not None
+
+    def __iter__(self):
+        if self._file.shards:
+            real = [shard_key(h, i) for h in self._file.table["chunks"] for i in range(self._file.shards)]
+        else:
+            real = list(self._file.table["chunks"])
+        for chunk_hash in real + list(self._file.table["decoy_hashes"]):
+            if chunk_hash in self:
+                yield chunk_hash
+
+    def __len__(self):
+        return self._file.header["data_count"]
+
+
+class ManifestFile:
+    """A binary manifest opened via mmap; reads like the JSON manifest dict."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, version, header_len, table_len = PREAMBLE.unpack_from(self.buffer, 0)
+        if version != FORMAT_VERSION:
+            self.buffer.close()
+            raise ValueError(f"Unsupported manifest version: {version}")
+        table_offset = PREAMBLE.size + header_len
+        self.header = json.loads(self.buffer[PREAMBLE.size:table_offset])
+        self.table = CompactManifest.from_bytes(self.buffer, table_offset)
+        self.decoy_index = DigestIndex(self.table.decoy_digests)
+        self.data_index_offset = table_offset + table_len
+        erasure = self.header.get("erasure")
+        self.shards = erasure["k"] + erasure["m"] if erasure else 0
+        self._shard_index = None
+        self.chunk_data = _ChunkData(self)
+
+    @property
+    def shard_index(self):
+        # Built on first use: one digest per shard, in chunk order.
+        if self._shard_index is None:
+            digests = b"".join(bytes.fromhex(shard_key(h, i))
+                               for h in self.table["chunks"] for i in range(self.shards))
+            self._shard_index = DigestIndex(digests)
+        return self._shard_index
+
+    def __getitem__(self, name):
+        if name == "chunk_data":
+            return self.chunk_data
+        if name in HEADER_FIELDS and name in self.header:
+            return self.header[name]
+        return self.table[name]
+
+    def __contains__(self, name):
+        return name == "chunk_data" or (name in HEADER_FIELDS and name in self.header) or name in self.table
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_manifest(manifest, path):
+    """Write a manifest dict (or CompactManifest) in the binary format."""
+    table = manifest if isinstance(manifest, CompactManifest) else CompactManifest.from_manifest(manifest)
+    table_bytes = table.to_bytes()
+    chunk_data = manifest.get("chunk_data") or {}
+    hashes = list(table["chunks"]) + list(table["decoy_hashes"])
+    erasure = manifest.get("erasure")
+    shards = erasure["k"] + erasure["m"] if erasure else 0
+    real = set(table["chunks"]) if shards else ()
+
+    def stored(chunk_hash):
+        # The base64 pieces written for one data entry, or None if missing.
+        if chunk_hash in real:
+            keys = [shard_key(chunk_hash, i) for i in range(shards)]
+            if all(key in chunk_data for key in keys):
+                return [chunk_data[key] for key in keys]
+            return None
+        if chunk_hash in chunk_data:
+            return [chunk_data[chunk_hash]]
+        return None
+
+    entries = [stored(h) for h in hashes]
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "filename": table.filename,
+        "size": table.size if table.size >= 0 else None,
+        "encrypted_key": table.encrypted_key,
+        "chunk_count": len(table),
+        "decoy_count": len(table["decoy_hashes"]),
+        "data_count": sum(len(pieces) for pieces in entries if pieces),
+        **{name: manifest[name] for name in HEADER_FIELDS if manifest.get(name) is not None},
+    }).encode()
+
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header), len(table_bytes)))
+        f.write(header)
+        f.write(table_bytes)
+
+        index = []
+        offset = PREAMBLE.size + len(header) + len(table_bytes) + len(hashes) * DATA_ENTRY.size
+        for pieces in entries:
+            if pieces:
+                length = sum(_b64_length(piece) for piece in pieces)
+                index.append(DATA_ENTRY.pack(offset, length))
+                offset += length
+            else:
+                index.append(DATA_ENTRY.pack(0, MISSING))
+        f.write(b"".join(index))
+
+        for pieces in entries:
+            for piece in pieces or ():
+                f.write(base64.b64decode(piece))
+
+
+def _b64_length(encoded):
+    return len(encoded) * 3 // 4 - encoded[-2:].count("=")
+
+
+def load_manifest(path):
+    """Open a manifest in either the binary format or the legacy JSON format."""
+    if is_binary_manifest(path):
+        return ManifestFile(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+@contextmanager
+def open_manifest(path):
+    """load_manifest() for a with-block: a binary manifest's mmap is closed on exit."""
+    manifest = load_manifest(path)
+    try:
+        yield manifest
+    finally:
+        if isinstance(manifest, ManifestFile):
+            manifest.close()
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters, histograms and stage timers for the hot paths, exported in the
+# Prometheus text format.
+#
+#   P2P_METRICS=1 python peer_server.py --metrics-port 9100 a_manifest.p2pm
+#   curl localhost:9100/metrics
+#
+# Metrics are off unless P2P_METRICS is set (or enable() is called). Off,
+# stage() hands back one shared no-op context manager and inc()/observe()
+# return after a single flag check, so instrumented code pays almost nothing.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; chunk stages run from microseconds (hash an 8 KB chunk) up to
+# seconds (a peer fetch that times out).
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+ENABLED = os.environ.get("P2P_METRICS", "") not in ("", "0")
+_NOOP = nullcontext()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.kind = "counter"
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self.values)
+        return [f"{self.name}{_labels(key)} {value}" for key, value in sorted(values.items())]
+
+    def clear(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.kind = "histogram"
+        self.buckets = tuple(buckets)
+        self.series = {}      # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            series[slot] += 1
+            series[-1] += value
+
+    def sums(self, label):
+        """Sum of observed values per value of `label`, e.g. seconds per stage."""
+        with self._lock:
+            series = list(self.series.items())
+        return {dict(key).get(label): values[-1] for key, values in series}
+
+    def clear(self):
+        with self._lock:
+            self.series.clear()
+
+    def render(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "p2p_stage_seconds", "Time spent per pipeline stage, per chunk")
+STAGE_BYTES = REGISTRY.counter(
+    "p2p_stage_bytes_total", "Bytes fed into each pipeline stage")
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+class _Stage:
+    __slots__ = ("name", "nbytes", "started")
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, stage=self.name)
+        if self.nbytes:
+            STAGE_BYTES.inc(self.nbytes, stage=self.name)
+        return False
+
+
+def stage(name, nbytes=0):
+    """Time a `with` block as one run of pipeline stage `name` (compress, encrypt, ...)."""
+    if not ENABLED:
+        return _NOOP
+    return _Stage(name, nbytes)
+
+
+def inc(name, amount=1, help_text="", **labels):
+    if ENABLED:
+        REGISTRY.counter(name, help_text).inc(amount, **labels)
+
+
+def observe(name, value, help_text="", **labels):
+    if ENABLED:
+        REGISTRY.histogram(name, help_text).observe(value, **labels)
+
+
+def render():
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scrapes every few seconds would drown the server log
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve /metrics on `port` from a daemon thread; also turns metrics on."""
+    enable()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,147 @@
+import io
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from encryption_utils import SUB_CHUNK_SIZE, chunk_offsets, decrypt_chunk
+from chunk_cache import ChunkCache
+from erasure import wrap_dht
+
+
+class P2PFile(io.BufferedIOBase):
+    """Read-only, seekable file object that streams a manifest's plaintext from a DHT.
+
+    Chunks are fetched and decrypted on demand; the next `prefetch` chunks are
+    requested in the background and recently decrypted chunks are kept in a small
+    byte-bounded LRU (`cache`) so nearby seeks and re-reads stay local.
+    read(n) and readinto() keep going across chunk boundaries until they have
+    n bytes or reach the end, so a short read means EOF, as tarfile expects.
+    """
+
+    def __init__(self, manifest, key, dht, prefetch=4, cache=None, workers=4):
+        super().__init__()
+        self.manifest = manifest
+        self.key = key
+        self.dht = wrap_dht(dht, manifest)
+        self.name = manifest["filename"]
+        self.prefetch = prefetch
+        self._offsets = chunk_offsets(manifest)
+        self._cache = cache if cache is not None else ChunkCache(max_bytes=(prefetch + 4) * SUB_CHUNK_SIZE)
+        self._pending = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pos = 0
+        if "size" in manifest:
+            self.size = manifest["size"]
+        elif self._offsets:
+            self.size = self._offsets[-1] + len(self._chunk(len(self._offsets) - 1))
+        else:
+            self.size = 0
+
+    def _fetch(self, index):
+        chunk_hash = self.manifest["chunks"][index]
+        ciphertext_b64 = self.dht.retrieve(chunk_hash)
+        if not ciphertext_b64:
+            raise IOError(f"Missing chunk: {chunk_hash}")
+        return decrypt_chunk(self.manifest, self.key, chunk_hash, ciphertext_b64)
+
+    def _schedule(self, index):
+        if index >= len(self._offsets) or index in self._pending:
+            return
+        if self.manifest["chunks"][index] in self._cache:
+            return
+        self._pending[index] = self._pool.submit(self._fetch, index)
+
+    def _settle(self, index):
+        # Finished prefetches move into the byte-bounded cache; ones outside the
+        # read-ahead window (left behind by a seek) are cancelled and dropped, so
+        # plaintext is never held anywhere but the cache.
+        for i, future in list(self._pending.items()):
+            if i < index or i > index + self.prefetch:
+                future.cancel()
+                del self._pending[i]
+            elif future.done():
+                del self._pending[i]
+                if future.exception() is None:
+                    self._cache.put(self.manifest["chunks"][i], future.result())
+
+    def _chunk(self, index):
+        self._settle(index)
+        chunk_hash = self.manifest["chunks"][index]
+        data = self._cache.get(chunk_hash)
+        if data is None:
+            future = self._pending.pop(index, None)
+            data = future.result() if future else self._fetch(index)
+            self._cache.put(chunk_hash, data)
+
+        for ahead in range(index + 1, index + 1 + self.prefetch):
+            self._schedule(ahead)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def _read_chunk_into(self, view):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if self._pos >= self.size or not self._offsets or not len(view):
+            return 0
+
+        index = bisect_right(self._offsets, self._pos) - 1
+        data = self._chunk(index)
+        start = self._pos - self._offsets[index]
+        n = min(len(view), len(data) - start)
+        view[:n] = data[start:start + n]
+        self._pos += n
+        return n
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")
+        total = 0
+        while total < len(view):
+            n = self._read_chunk_into(view[total:])
+            if not n:
+                break
+            total += n
+        return total
+
+    def readinto1(self, b):
+        return self._read_chunk_into(memoryview(b).cast("B"))
+
+    def _read_with(self, readinto, size):
+        if size is None or size < 0:
+            size = max(self.size - self._pos, 0)
+        buffer = bytearray(size)
+        del buffer[readinto(buffer):]
+        return bytes(buffer)
+
+    def read(self, size=-1):
+        return self._read_with(self.readinto, size)
+
+    def read1(self, size=-1):
+        return self._read_with(self.readinto1, size)
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._pool.shutdown(wait=False)
+        super().close()
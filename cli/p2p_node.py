@@ -1,10 +1,17 @@
+from metrics import stage
+from logging_utils import get_logger
+
+log = get_logger(__name__)
+
 class DHT:
-    def __init__(self):
-        self.storage = {}
+    def __init__(self, storage=None):
+        # Any mutable mapping works: a dict, or a persistent store from storage.py
+        self.storage = storage if storage is not None else {}
 
     def store(self, key, value):
-        self.storage[key] = value
-        print(f"Stored: {key}")
+        with stage("store", len(value)):
+            self.storage[key] = value
+        log.debug(f"Stored: {key}")
 
     def retrieve(self, key):
         return self.storage.get(key)
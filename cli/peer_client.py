@@ -1,66 +1,155 @@
+import argparse
 import socket
 import json
 import os
+import queue
+import threading
 from encryption_utils import load_private_key, decrypt_key_with_rsa, decrypt_and_reconstruct
+from chunk_cache import ChunkCache
+from manifest_format import open_manifest
+from erasure import chunk_keys, wrap_dht
+from peer_server import POOLED_HELLO
+from profiling import add_arguments, profiled
 
-SERVER_IP = input("Enter server IP address: ").strip()
 PORT = 5000
 
-def request_chunk(chunk_hash):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((SERVER_IP, PORT))
-        request = json.dumps({ "hash": chunk_hash })
-        s.sendall(request.encode())
-
-        response = s.recv(65536).decode()
+def request_chunk(chunk_hash, server_ip, port=PORT, timeout=10.0):
+    # One request per connection; the reply may span many segments and ends
+    # at a newline or when the server closes the connection.
+    with socket.create_connection((server_ip, port), timeout) as s, s.makefile("rb") as reader:
+        s.sendall(json.dumps({ "hash": chunk_hash }).encode() + b"\n")
+        response = reader.readline()
+        if not response:
+            raise ConnectionError("connection closed by server")
         reply = json.loads(response)
 
         if reply.get("status") == "OK":
             return reply["chunk"]
         return None
 
+class ConnectionPool:
+    """Reuses up to `size` open connections to one peer server.
+
+    Each connection opens with a hello line that tells the server to keep it
+    open; requests and replies on it then end with a newline. A connection the
+    server has dropped while idle is discarded and the request retried; only
+    a failure on a fresh connection is raised.
+    """
+
+    def __init__(self, server_ip, port=PORT, size=8, timeout=10.0):
+        self.address = (server_ip, port)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "requests": 0}
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, self.timeout)
+        sock.sendall(json.dumps(POOLED_HELLO).encode() + b"\n")
+        with self._lock:
+            self.stats["opened"] += 1
+        return sock, sock.makefile("rb")
+
+    def request(self, chunk_hash):
+        with self._slots:
+            while True:
+                try:
+                    conn, fresh = self._idle.get_nowait(), False
+                except queue.Empty:
+                    conn, fresh = self._connect(), True
+                sock, reader = conn
+                try:
+                    sock.sendall(json.dumps({ "hash": chunk_hash }).encode() + b"\n")
+                    line = reader.readline()
+                    if not line:
+                        raise ConnectionError("connection closed by server")
+                except OSError:
+                    reader.close()
+                    sock.close()
+                    if fresh:
+                        raise
+                    continue
+                self._idle.put(conn)
+                with self._lock:
+                    self.stats["requests"] += 1
+                reply = json.loads(line)
+                if reply.get("status") == "OK":
+                    return reply["chunk"]
+                return None
+
+    def close(self):
+        while True:
+            try:
+                sock, reader = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            reader.close()
+            sock.close()
+
 class SocketDHT:
-    def __init__(self, real_hashes):
-        self.cache = {}
+    def __init__(self, real_hashes, server_ip, port=PORT, cache=None, pool=None):
+        self.cache = cache if cache is not None else ChunkCache()
         self.real_hashes = set(real_hashes)
+        self.server_ip = server_ip
+        self.port = port
+        self.pool = pool
 
     def retrieve(self, chunk_hash):
-        if chunk_hash not in self.real_hashes:
-            return None  # ignore decoys
-        if chunk_hash in self.cache:
-            return self.cache[chunk_hash]
-
-        chunk = request_chunk(chunk_hash)
-        if chunk:
-            self.cache[chunk_hash] = chunk
+        # Decoys are fetched over the network like real chunks (cover traffic)
+        # but never cached.
+        is_real = chunk_hash in self.real_hashes
+        if is_real:
+            chunk = self.cache.get(chunk_hash)
+            if chunk is not None:
+                return chunk
+
+        if self.pool is not None:
+            chunk = self.pool.request(chunk_hash)
+        else:
+            chunk = request_chunk(chunk_hash, self.server_ip, self.port)
+        if chunk and is_real:
+            self.cache.put(chunk_hash, chunk)
         return chunk
 
-def start_client():
-    manifest_path = input("Enter path to manifest file: ").strip()
-    priv_key_path = input("Enter path to your private key: ").strip()
-    output_path = input("Enter output file path: ").strip()
+def download(server_ip, manifest_path, priv_key_path, output_path, port=PORT):
+    with open_manifest(manifest_path) as manifest:
+        priv_key = load_private_key(priv_key_path)
+        enc_key = bytes.fromhex(manifest["encrypted_key"])
+        aes_key = decrypt_key_with_rsa(priv_key, enc_key)
 
-    if not os.path.exists(manifest_path) or not os.path.exists(priv_key_path):
-        print("Missing manifest or private key.")
-        return
+        # Wrap server as a DHT-like interface; real chunks (or their shards) are cached
+        dht = wrap_dht(SocketDHT(chunk_keys(manifest), server_ip, port), manifest)
 
-    with open(manifest_path, "r") as f:
-        manifest = json.load(f)
+        # If user gave a folder path, auto-generate a file path using manifest filename
+        if os.path.isdir(output_path):
+            output_path = os.path.join(output_path, "RECEIVED_" + manifest["filename"])
 
-    priv_key = load_private_key(priv_key_path)
-    enc_key = bytes.fromhex(manifest["encrypted_key"])
-    aes_key = decrypt_key_with_rsa(priv_key, enc_key)
+        decrypt_and_reconstruct(manifest, aes_key, dht, output_path)
+        return output_path
 
-    # Wrap server as a DHT-like interface
-    real_hashes = manifest["chunks"]
-    dht = SocketDHT(real_hashes)
+def start_client(args):
+    # Anything not given on the command line is asked for.
+    server_ip = args.server or input("Enter server IP address: ").strip()
+    manifest_path = args.manifest or input("Enter path to manifest file: ").strip()
+    priv_key_path = args.key or input("Enter path to your private key: ").strip()
+    output_path = args.output or input("Enter output file path: ").strip()
 
-    # If user gave a folder path, auto-generate a file path using manifest filename
-    if os.path.isdir(output_path):
-        output_path = os.path.join(output_path, "RECEIVED_" + manifest["filename"])
+    if not os.path.exists(manifest_path) or not os.path.exists(priv_key_path):
+        print("Missing manifest or private key.")
+        return
 
-    decrypt_and_reconstruct(manifest, aes_key, dht, output_path)
+    with profiled(args, "client"):
+        download(server_ip, manifest_path, priv_key_path, output_path, args.port)
 
 
 if __name__ == "__main__":
-    start_client()
+    #   python peer_client.py --server 192.168.1.20 --manifest a.p2pm --key my_private.pem --output received_files/
+    parser = argparse.ArgumentParser(description="Download a file from a peer server")
+    parser.add_argument("--server", help="peer server IP address")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--manifest")
+    parser.add_argument("--key", help="your private key")
+    parser.add_argument("--output", help="output file or directory")
+    add_arguments(parser)
+    start_client(parser.parse_args())
@@ -1,61 +1,342 @@
+import argparse
 import socket
 import json
+import queue
+import signal
+import threading
+import time
+import metrics
+from profiling import add_arguments, profiled
 from encryption_utils import chunk_and_encrypt, generate_rsa_keypair, load_public_key, encrypt_key_with_rsa
 import os
+from manifest_format import load_manifest
+from storage import open_store
+from erasure import stored_hashes
 
 HOST = '0.0.0.0'  # Listen on all interfaces
 PORT = 5000       # Change this if needed
 
-def handle_client(conn, chunk_data):
+
+HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+POOLED_HELLO = {"mode": "pooled"}  # first line from a client that keeps its connection open
+MAX_REQUEST = 4096
+LOG_LINES = 1000  # server log lines a GUI keeps (see ChunkServer's log_collector)
+
+
+def _short(chunk_hash):
+    # First 64 bits of the hash: small int keys keep the global index compact.
+    return int(chunk_hash[:16], 16)
+
+
+def is_chunk_hash(value):
+    # Every served key (chunk, shard or decoy) is a hex SHA-256 digest.
+    return isinstance(value, str) and len(value) == 64 and not set(value) - HEX_DIGITS
+
+
+class ChunkIndex:
+    """One hash -> location index over many manifests and chunk stores.
+
+    Binary manifests are served straight from their mmapped data section, so
+    a served file costs little more than its index entries. Chunk stores
+    (segment logs, SQLite) keep their own index and are probed after a miss.
+    Sources can be added and removed while the server is running.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}    # source id -> (chunk mapping, manifest or None for stores)
+        self._names = {}      # path/spec -> source id
+        self._index = {}      # short hash -> source id, or tuple of ids on collision
+        self._stores = []
+        self._next_id = 0
+        self._readers = {}    # source id -> get() calls reading it right now
+        self._closing = {}    # removed source id -> object to close after its last reader
+
+    def add_manifest(self, manifest_path):
+        manifest = load_manifest(manifest_path)
+        chunk_data = manifest["chunk_data"]
+        hashes = stored_hashes(manifest)
+        with self._lock:
+            if manifest_path in self._names:
+                raise ValueError(f"Already serving {manifest_path}")
+            source = self._register(manifest_path, chunk_data, manifest)
+            for chunk_hash in hashes:
+                key = _short(chunk_hash)
+                current = self._index.get(key)
+                if current is None:
+                    self._index[key] = source
+                else:
+                    self._index[key] = (current if isinstance(current, tuple) else (current,)) + (source,)
+        return len(chunk_data)
+
+    def add_store(self, spec):
+        store = open_store(spec)
+        with self._lock:
+            if spec in self._names:
+                raise ValueError(f"Already serving {spec}")
+            self._stores.append(self._register(spec, store, None))
+        return len(store)
+
+    def _register(self, name, chunk_data, manifest):
+        source = self._next_id
+        self._next_id += 1
+        self._sources[source] = (chunk_data, manifest)
+        self._names[name] = source
+        return source
+
+    def remove(self, name):
+        with self._lock:
+            source = self._names.pop(name)
+            chunk_data, manifest = self._sources.pop(source)
+            if manifest is None:
+                self._stores.remove(source)
+            else:
+                for chunk_hash in stored_hashes(manifest):
+                    key = _short(chunk_hash)
+                    current = self._index.get(key)
+                    if current == source:
+                        del self._index[key]
+                    elif isinstance(current, tuple) and source in current:
+                        rest = tuple(s for s in current if s != source)
+                        self._index[key] = rest[0] if len(rest) == 1 else rest
+            closable = manifest if manifest is not None else chunk_data
+            if self._readers.get(source):
+                # A get() is still slicing its mmap; the last reader closes it.
+                self._closing[source] = closable
+                return
+        if hasattr(closable, "close"):
+            closable.close()
+
+    def _release(self, source):
+        with self._lock:
+            self._readers[source] -= 1
+            if self._readers[source]:
+                return
+            del self._readers[source]
+            closable = self._closing.pop(source, None)
+        if hasattr(closable, "close"):
+            closable.close()
+
+    def names(self):
+        return list(self._names)
+
+    def get(self, chunk_hash, default=None):
+        if not is_chunk_hash(chunk_hash):
+            return default
+        candidates = self._index.get(_short(chunk_hash), ())
+        if not isinstance(candidates, tuple):
+            candidates = (candidates,)
+        for source in candidates + tuple(self._stores):
+            with self._lock:
+                entry = self._sources.get(source)
+                if entry is None:
+                    continue  # removed concurrently
+                self._readers[source] = self._readers.get(source, 0) + 1
+            try:
+                return entry[0][chunk_hash]
+            except KeyError:
+                pass
+            finally:
+                self._release(source)
+        return default
+
+    def __contains__(self, chunk_hash):
+        return self.get(chunk_hash) is not None
+
+    def __len__(self):
+        # Entries actually served; the short-hash index can hold fewer keys than that.
+        with self._lock:
+            sources = list(self._sources.values())
+        return sum(len(chunk_data) for chunk_data, _ in sources)
+
+
+def answer(conn, chunk_data, request, terminator=b""):
+    started = time.perf_counter()
+    status = "ERROR"
     try:
-        request = conn.recv(1024).decode()
-        req = json.loads(request)
-        chunk_hash = req.get("hash")
+        try:
+            req = json.loads(request)
+            chunk_hash = req.get("hash") if isinstance(req, dict) else None
+        except ValueError:
+            chunk_hash = None  # malformed: answered NOT_FOUND like an unknown hash
 
-        if chunk_hash in chunk_data:
+        with metrics.stage("lookup"):
+            chunk = chunk_data.get(chunk_hash)
+        if chunk is not None:
             response = {
                 "status": "OK",
-                "chunk": chunk_data[chunk_hash]
+                "chunk": chunk
             }
         else:
             response = {
                 "status": "NOT_FOUND"
             }
 
-        conn.sendall(json.dumps(response).encode())
+        payload = json.dumps(response).encode() + terminator
+        with metrics.stage("send", len(payload)):
+            conn.sendall(payload)
+        status = response["status"]
+    finally:
+        metrics.inc("p2p_server_requests_total", help_text="Chunk requests answered, by status", status=status)
+        metrics.observe("p2p_server_request_seconds", time.perf_counter() - started,
+                        help_text="Time to look up and send one chunk")
+
+
+def _parses(data):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def handle_client(conn, chunk_data):
+    try:
+        # Read the first line. One-shot clients send a single request with no
+        # terminator and wait for the reply, so a complete JSON object also
+        # ends it, however many segments it arrived in.
+        buffer = b""
+        while b"\n" not in buffer and len(buffer) < MAX_REQUEST:
+            more = conn.recv(4096)
+            if not more:
+                break
+            buffer += more
+            if b"\n" not in buffer and _parses(buffer) is not None:
+                break
+        first, newline, buffer = buffer.partition(b"\n")
+        if not newline or _parses(first) != POOLED_HELLO:
+            answer(conn, chunk_data, first)  # one request per connection
+            return
+        # Pooled clients open with a hello line, then end every request with a
+        # newline and keep the connection open; replies end with a newline too.
+        while True:
+            *requests, buffer = buffer.split(b"\n")
+            for request in requests:
+                answer(conn, chunk_data, request, b"\n")
+            more = conn.recv(4096)
+            if not more:
+                break
+            buffer += more
+    except TimeoutError:
+        pass  # idle or stalled client; a pool reconnects when it needs to
     except Exception as e:
         print(f"[!] Error handling client: {e}")
     finally:
         conn.close()
 
+
+class ChunkServer:
+    """Serves every chunk in a ChunkIndex on one port; sources can change live.
+
+    Accepted connections wait in a bounded queue served by a fixed pool of
+    `workers` threads. When the queue is full the accept loop waits up to
+    `admission_wait` seconds and then rejects the connection instead of piling
+    up threads. A connection idle for `idle_timeout` seconds is closed, so
+    pooled clients cannot hold a worker forever. `log_collector` gets every
+    log line; pass a bounded deque (see LOG_LINES) for a long-running server.
+    """
+
+    def __init__(self, host=HOST, port=PORT, log_collector=None, workers=64, max_queue=256,
+                 admission_wait=0.5, idle_timeout=30.0):
+        self.host = host
+        self.port = port
+        self.logs = log_collector
+        self.index = ChunkIndex()
+        self.workers = workers
+        self.admission_wait = admission_wait
+        self.idle_timeout = idle_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.rejected = 0
+        self._sock = None
+
+    def log(self, msg):
+        print(msg)
+        if self.logs is not None:
+            self.logs.append(msg)
+
+    def add(self, source):
+        """Serve a manifest file, or a chunk store given as "segment:<dir>" / "sqlite:<file>"."""
+        if source.startswith(("segment:", "sqlite:")):
+            count = self.index.add_store(source)
+        else:
+            count = self.index.add_manifest(source)
+        self.log(f"[*] Loaded {count} chunks from {source} ({len(self.index)} served in total).")
+        return count
+
+    def remove(self, source):
+        self.index.remove(source)
+        self.log(f"[*] Stopped serving {source}.")
+
+    def serve_forever(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((self.host, self.port))
+            s.listen()
+            self._sock = s
+            self.log(f"[*] Server listening on port {self.port}...")
+
+            for _ in range(self.workers):
+                threading.Thread(target=self.worker, daemon=True).start()
+            while True:
+                try:
+                    conn, addr = s.accept()
+                except OSError:
+                    break  # closed by stop()
+                try:
+                    self.queue.put(conn, timeout=self.admission_wait)
+                except queue.Full:
+                    self.rejected += 1
+                    conn.close()
+                    continue
+                self.log(f"[+] Connection from {addr}")
+
+    def worker(self):
+        while True:
+            conn = self.queue.get()
+            conn.settimeout(self.idle_timeout)
+            handle_client(conn, self.index)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+
+
 def start_server(manifest_path,log_collector=None):
     if not os.path.exists(manifest_path):
         print("Manifest not found.")
         if log_collector is not None:
             log_collector.append("Manifest not found.")
         return
-    
-    with open(manifest_path, "r") as f:
-        manifest = json.load(f)
-
-    chunk_data = manifest["chunk_data"]
-    if log_collector is not None:
-        log_collector.append(f"[*] Loaded {len(chunk_data)} chunks.")
-        log_collector.append(f"[*] Server listening on port {PORT}...")
-    print(f"[*] Loaded {len(chunk_data)} chunks.")
-    print(f"[*] Server listening on port {PORT}...")
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT))
-        s.listen()
-
-        while True:
-            conn, addr = s.accept()
-            print(f"[+] Connection from {addr}")
-            if log_collector is not None:
-                log_collector.append(f"[+] Connection from {addr}")
-            handle_client(conn, chunk_data)
+    server = ChunkServer(log_collector=log_collector)
+    server.add(manifest_path)
+    server.serve_forever()
 
 if __name__ == "__main__":
-    manifest_file = input("Enter path to manifest file (e.g., myfile.pdf_manifest.json): ").strip()
-    start_server(manifest_file)
+    # Any number of manifests and chunk stores can be served at once:
+    #   python peer_server.py a_manifest.p2pm b_manifest.p2pm segment:chunks/
+    parser = argparse.ArgumentParser(description="Serve chunks from manifests and chunk stores")
+    parser.add_argument("sources", nargs="*", help="manifest files, segment:<dir> or sqlite:<file>")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on this port")
+    add_arguments(parser)
+    args = parser.parse_args()
+    sources = args.sources
+    if not sources:
+        sources = [input("Enter path to manifest file (e.g., myfile.pdf_manifest.p2pm): ").strip()]
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    server = ChunkServer(port=args.port)
+    for source in sources:
+        server.add(source)
+    # Under --profile, stop the server with Ctrl-C (or SIGTERM) to write the profile.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        with profiled(args, "server"):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[*] Server stopped.")
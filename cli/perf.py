@@ -1,320 +1,251 @@
-import os, time, json, csv
-import psutil, tracemalloc
-from pathlib import Path
-from encryption_utils import (
-    chunk_and_encrypt, decrypt_and_reconstruct,
-    encrypt_key_with_rsa, decrypt_key_with_rsa,
-    load_public_key, load_private_key
-)
-from threading import Lock
-from random import choice
-import matplotlib.pyplot as plt
-
-# ---- Simulated DHT and Nodes ----
-
-class DHTNode:
-    def __init__(self, node_id):
-        self.node_id = node_id
-        self.storage = {}
-        self.lock = Lock()
-
-    def store(self, chunk_hash, data):
-        with self.lock:
-            self.storage[chunk_hash] = data
-
-    def retrieve(self, chunk_hash):
-        with self.lock:
-            return self.storage.get(chunk_hash, None)
-
-class DHTNetwork:
-    def __init__(self, num_nodes=5):
-        self.nodes = [DHTNode(f"node_{i}") for i in range(num_nodes)]
-
-    def store(self, chunk_hash, data):
-        # Store chunk on a random node to simulate P2P distribution
-        node = choice(self.nodes)
-        node.store(chunk_hash, data)
-
-    def retrieve(self, chunk_hash):
-        # Search all nodes for the chunk
-        for node in self.nodes:
-            data = node.retrieve(chunk_hash)
-            if data is not None:
-                return data
-        return None
-
-# ---- Benchmark Setup ----
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import metrics
+from encryption_utils import chunk_and_encrypt, decrypt_and_reconstruct
+from metrics import STAGE_SECONDS
+from p2p_node import DHT
+
+# Reproducible benchmark suite for the upload/download pipeline.
+#
+#   python perf.py --save baseline.json                # run and save a baseline
+#   python perf.py --compare baseline.json             # run and flag regressions
+#   python perf.py --diff old.json new.json            # compare two saved runs
+#
+# Every case runs `--warmups` untimed passes, then `--trials` timed ones.
+# Inputs are generated from `--seed`, so two runs see byte-identical corpora.
+# Each trial times the real upload (chunk_and_encrypt + DHT.store) and
+# download (decrypt_and_reconstruct) paths end to end with
+# time.perf_counter_ns, then runs them again with metrics on and reads the
+# per-stage breakdown (read, compress, encrypt, hash, b64encode, store, fetch,
+# b64decode, decrypt, decompress, write) from the metrics.stage() timers in
+# that same code. Download stages run on many threads at once and are summed
+# across them. decoy_fraction is the share of stored bytes that are decoys,
+# which is what the default DecoyBudget costs in storage and traffic. Peak
+# memory is measured in a separate, untimed pass (--memory) because
+# tracemalloc slows everything it traces.
 
 TMP = "benchmark_local"
-os.makedirs(TMP, exist_ok=True)
-
-RSA_PUB = "generated/my_public.pem"
-RSA_PRIV = "generated/my_private.pem"
-CSV_OUT = "comparison_results.csv"
-SIZES_MB = [1, 5, 10, 20]
-
-def create_file(path, size_mb):
+STAGES = ["read", "compress", "encrypt", "hash", "b64encode", "store",
+          "fetch", "b64decode", "decrypt", "decompress", "write"]
+END_TO_END = ["upload", "download"]
+WORDS = ("chunk peer node manifest hash key cipher nonce decoy store fetch file data block "
+         "network privacy secure stream offset range cache index server client upload download").split()
+
+# ---- Input corpora ----
+
+def make_corpus(kind, size, seed):
+    rng = random.Random(f"{kind}:{size}:{seed}")
+    if kind == "random":
+        return rng.randbytes(size)  # incompressible, like media or archives
+    if kind == "text":
+        words = rng.choices(WORDS, k=size // 5 + 1)
+        return " ".join(words).encode()[:size]
+    if kind == "zeros":
+        return bytes(size)
+    raise ValueError(f"Unknown corpus: {kind}")
+
+# ---- Pipeline runs ----
+
+def end_to_end(path, out_path, dht):
+    """The real code paths, as main.py runs them; returns ns per direction."""
+    clock = time.perf_counter_ns
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = clock()
+        key, manifest = chunk_and_encrypt(path)
+        for h, d in manifest["chunk_data"].items():
+            dht.store(h, d)
+        t1 = clock()
+        decrypt_and_reconstruct(manifest, key, dht, out_path)
+        t2 = clock()
+    return {"upload": t1 - t0, "download": t2 - t1}
+
+def decoy_fraction(manifest):
+    chunk_data = manifest["chunk_data"]
+    decoy = sum(len(chunk_data[h]) for h in manifest["decoy_hashes"])
+    total = sum(len(v) for v in chunk_data.values())
+    return round(decoy / total, 4) if total else 0.0
+
+def stage_breakdown(path, out_path, dht):
+    """Run end_to_end() with metrics on; returns ns per stage from the stage timers."""
+    was_enabled = metrics.ENABLED
+    STAGE_SECONDS.clear()
+    metrics.enable()
+    try:
+        end_to_end(path, out_path, dht)
+    finally:
+        metrics.enable(was_enabled)
+    seconds = STAGE_SECONDS.sums("stage")
+    return {name: int(seconds.get(name, 0.0) * 1e9) for name in STAGES}
+
+# ---- Running cases ----
+
+def run_case(kind, size_mb, args):
+    size = int(size_mb * 1024 * 1024)
+    name = f"{kind}-{size_mb:g}MB"
+    path = os.path.join(TMP, f"{name}_input.bin")
+    out_path = os.path.join(TMP, f"{name}_out.bin")
+    data = make_corpus(kind, size, args.seed)
     with open(path, "wb") as f:
-        f.write(os.urandom(size_mb * 1024 * 1024))
-
-def measure(fn, *args):
-    tracemalloc.start()
-    cpu_before = psutil.cpu_percent(interval=None)
-    net_before = psutil.net_io_counters()._asdict()
-    start = time.time()
-
-    fn(*args)
-
-    end = time.time()
-    cpu_after = psutil.cpu_percent(interval=None)
-    net_after = psutil.net_io_counters()._asdict()
-    _, peak_mem = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
-
-    net_used = (
-        net_after["bytes_sent"] + net_after["bytes_recv"]
-        - net_before["bytes_sent"] - net_before["bytes_recv"]
-    ) / (1024 * 1024)
-
+        f.write(data)
+
+    samples = {metric: [] for metric in STAGES + END_TO_END}
+    for trial in range(args.warmups + args.trials):
+        random.seed(args.seed + trial)  # decoy sizes and task order
+        totals = end_to_end(path, out_path, DHT())
+        random.seed(args.seed + trial)
+        stages = stage_breakdown(path, out_path, DHT())
+        if trial < args.warmups:
+            continue
+        for metric, ns in {**stages, **totals}.items():
+            samples[metric].append(ns)
+
+    with open(out_path, "rb") as f:
+        assert f.read() == data, f"{name}: round trip mismatch"
+
+    result = {"bytes": size, "metrics": {m: summarize(v, size) for m, v in samples.items()}}
+    random.seed(args.seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result["decoy_fraction"] = decoy_fraction(chunk_and_encrypt(path)[1])
+    if args.memory:
+        random.seed(args.seed)
+        tracemalloc.start()
+        end_to_end(path, out_path, DHT())
+        result["peak_mem_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    return name, result
+
+def summarize(ns_samples, nbytes):
+    ms = [ns / 1e6 for ns in ns_samples]
+    median = statistics.median(ms)
     return {
-        "time": round(end - start, 3),
-        "cpu": round((cpu_before + cpu_after) / 2, 2),
-        "mem": round(peak_mem / (1024 * 1024), 2),
-        "bandwidth": round(net_used / (end - start + 1e-5), 2)
+        "median_ms": round(median, 3),
+        "min_ms": round(min(ms), 3),
+        "max_ms": round(max(ms), 3),
+        "stdev_ms": round(statistics.stdev(ms), 3) if len(ms) > 1 else 0.0,
+        "mb_s": round(nbytes / 1e6 / (median / 1000), 1) if median else None,
+        "samples_ms": [round(v, 3) for v in ms],
     }
 
-# ---- Basic upload/download (simple file copy) ----
-
-def basic_upload(src, dest):
-    with open(src, "rb") as f: data = f.read()
-    with open(dest, "wb") as f: f.write(data)
-
-def basic_download(src, dest):
-    with open(src, "rb") as f: data = f.read()
-    with open(dest, "wb") as f: f.write(data)
-
-# ---- Secure upload/download (P2P chunks + encryption) ----
-
-def secure_upload(src_path, manifest_path, dht):
-    pubkey = load_public_key(RSA_PUB)
-    aes_key, manifest = chunk_and_encrypt(src_path)
-    manifest["encrypted_key"] = encrypt_key_with_rsa(pubkey, aes_key).hex()
-    for h, d in manifest["chunk_data"].items():
-        dht.store(h, d)
-    with open(manifest_path, "w") as f: json.dump(manifest, f)
-
-def secure_download(manifest_path, output_path, dht):
-    with open(manifest_path, "r") as f: manifest = json.load(f)
-    priv = load_private_key(RSA_PRIV)
-    key = decrypt_key_with_rsa(priv, bytes.fromhex(manifest["encrypted_key"]))
-    decrypt_and_reconstruct(manifest, key, dht, output_path)
-
-# ---- Benchmark run for one file size ----
-
-def benchmark_run(size_mb):
-    dht_network = DHTNetwork(num_nodes=5)
-
-    name = f"{size_mb}MB"
-    original = f"{TMP}/{name}_input.bin"
-    basic_temp = f"{TMP}/{name}_basic_temp.bin"
-    basic_out = f"{TMP}/{name}_basic_out.bin"
-    secure_out = f"{TMP}/{name}_secure_out.bin"
-    manifest = f"{TMP}/{name}_manifest.json"
-    
-    create_file(original, size_mb)
-
-    # Basic upload + download
-    up_b = measure(basic_upload, original, basic_temp)
-    down_b = measure(basic_download, basic_temp, basic_out)
-
-    # Secure upload + download on DHT network
-    up_s = measure(secure_upload, original, manifest, dht_network)
-    down_s = measure(secure_download, manifest, secure_out, dht_network)
-
-    with open(manifest) as f:
-        m = json.load(f)
-
-    return [
-        {
-            "Mode": "basic",
-            "File_MB": size_mb,
-            "Upload_s": up_b["time"],
-            "Download_s": down_b["time"],
-            "Total_s": round(up_b["time"] + down_b["time"], 3),
-            "Memory_MB": max(up_b["mem"], down_b["mem"]),
-            "CPU_%": round((up_b["cpu"] + down_b["cpu"]) / 2, 2),
-            "Bandwidth_MBps": round(size_mb / (up_b["time"] + down_b["time"] + 1e-5), 2),
-            "Chunks": 1,
-            "Decoys": 0,
-            "Latency_ms": 0
-        },
-        {
-            "Mode": "secure",
-            "File_MB": size_mb,
-            "Upload_s": up_s["time"],
-            "Download_s": down_s["time"],
-            "Total_s": round(up_s["time"] + down_s["time"], 3),
-            "Memory_MB": max(up_s["mem"], down_s["mem"]),
-            "CPU_%": round((up_s["cpu"] + down_s["cpu"]) / 2, 2),
-            "Bandwidth_MBps": round(size_mb / (up_s["time"] + down_s["time"] + 1e-5), 2),
-            "Chunks": len(m["chunks"]),
-            "Decoys": len(m.get("decoy_hashes", [])),
-            "Latency_ms": round((up_s["time"] + down_s["time"]) / len(m["chunks"]) * 1000, 2)
-        }
-    ]
-
-# ---- Save results to CSV ----
-
-def save_csv(results):
-    with open(CSV_OUT, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=results[0].keys())
-        writer.writeheader()
-        writer.writerows(results)
-
-# ---- Generate Markdown Report with Plots ----
-
-def generate_report(csv_path, report_path="benchmark_report.md"):
-    import pandas as pd
-
-    df = pd.read_csv(csv_path)
-
-    # Separate basic and secure
-    basic_df = df[df.Mode == "basic"]
-    secure_df = df[df.Mode == "secure"]
-
-    # Plot settings
-    def plot_metric(metric, ylabel, title, filename):
-        plt.figure(figsize=(8,5))
-        plt.plot(basic_df.File_MB, basic_df[metric], marker='o', label='Basic')
-        plt.plot(secure_df.File_MB, secure_df[metric], marker='o', label='Secure')
-        plt.xlabel("File Size (MB)")
-        plt.ylabel(ylabel)
-        plt.title(title)
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(filename)
-        plt.close()
-
-    os.makedirs("plots", exist_ok=True)
-    plot_metric("Upload_s", "Seconds", "Upload Time", "plots/upload_time.png")
-    plot_metric("Download_s", "Seconds", "Download Time", "plots/download_time.png")
-    plot_metric("Total_s", "Seconds", "Total Transfer Time", "plots/total_time.png")
-    plot_metric("CPU_%", "CPU %", "Average CPU Usage", "plots/cpu_usage.png")
-    plot_metric("Memory_MB", "MB", "Peak Memory Usage", "plots/memory_usage.png")
-    plot_metric("Bandwidth_MBps", "MB/s", "Effective Bandwidth", "plots/bandwidth.png")
-
-    # Convert the entire DataFrame to a markdown table
-    # Limit columns and round float columns nicely for readability
-    df_to_display = df.copy()
-    float_cols = ["Upload_s", "Download_s", "Total_s", "Memory_MB", "CPU_%", "Bandwidth_MBps", "Latency_ms"]
-    for col in float_cols:
-        if col in df_to_display.columns:
-            df_to_display[col] = df_to_display[col].apply(lambda x: round(x, 2))
-    markdown_table = df_to_display.to_markdown(index=False)
-
-    # Write markdown report
-    with open(report_path, "w") as f:
-        f.write("# Benchmark Report: Basic vs Secure P2P Storage\n\n")
-
-        f.write("This report compares the performance of a basic file copy method against a secure, chunked, encrypted P2P storage system.\n\n")
-
-        f.write("## Overview\n\n")
-        f.write(f"Tested file sizes: {', '.join(str(s) + 'MB' for s in sorted(df.File_MB.unique()))}\n\n")
-        f.write("Each test measures upload and download times, CPU and memory usage, and effective bandwidth.\n\n")
-
-        # Add CSV table here
-        f.write("## Summary Table\n\n")
-        f.write("Below is the raw benchmark data in table form for detailed reference.\n\n")
-        f.write(markdown_table + "\n\n")
-
-        f.write("## Results\n\n")
-
-        def add_plot_section(title, filename, analysis):
-            f.write(f"### {title}\n\n")
-            f.write(f"![{title}]({filename})\n\n")
-            f.write(analysis + "\n\n")
-
-        add_plot_section(
-            "Upload Time",
-            "plots/upload_time.png",
-            "The secure mode generally takes longer to upload due to chunking, encryption, and distributed storage overheads."
-        )
-
-        add_plot_section(
-            "Download Time",
-            "plots/download_time.png",
-            "Download time in secure mode can vary based on chunk retrieval from multiple nodes, but remains competitive."
-        )
-
-        add_plot_section(
-            "Total Transfer Time",
-            "plots/total_time.png",
-            "Overall, secure mode shows increased total time, a trade-off for added security and decentralization."
-        )
-
-        add_plot_section(
-            "CPU Usage",
-            "plots/cpu_usage.png",
-            "Secure mode uses more CPU due to cryptographic operations and chunk management."
-        )
-
-        add_plot_section(
-            "Memory Usage",
-            "plots/memory_usage.png",
-            "Memory peaks are higher in secure mode because of chunk buffering and encryption processes."
-        )
-
-        add_plot_section(
-            "Effective Bandwidth",
-            "plots/bandwidth.png",
-            "Basic mode bandwidth is higher because of straightforward file copying. Secure mode bandwidth is lower due to encryption overhead and chunk distribution."
-        )
-
-        # Enhanced Security Benefits and Performance Analysis Section
-        f.write("## Security Benefits and Performance Analysis\n\n")
-        f.write(
-            "- **Why Secure Mode Takes Longer and Uses More Resources:**\n\n"
-            "  1. **Chunking Overhead:**  \n"
-            "     The original file is split into multiple chunks, which introduces extra processing steps for indexing, handling, and storing each piece separately. This granularity increases the number of network operations compared to a single file copy.\n\n"
-            "  2. **Encryption and Decryption:**  \n"
-            "     Every chunk is encrypted using symmetric AES encryption with unique keys. Encryption and decryption are CPU-intensive tasks that require additional computation time and memory buffers, impacting both upload and download durations.\n\n"
-            "  3. **Distributed Storage Network:**  \n"
-            "     Chunks are stored across multiple DHT nodes rather than a single centralized server or disk. This decentralization increases network communication overhead, including latency and bandwidth usage, due to multiple storage and retrieval calls.\n\n"
-            "  4. **Key Management Overhead:**  \n"
-            "     AES keys are encrypted asymmetrically using RSA keys, which adds complexity and additional cryptographic operations on both upload and download, contributing to CPU and time usage.\n\n"
-            "- **Why Secure Mode is Still Better and Worth the Cost:**\n\n"
-            "  1. **Data Confidentiality:**  \n"
-            "     AES encryption ensures that even if chunks are intercepted or retrieved by unauthorized parties, the data remains unintelligible, protecting user privacy and sensitive information.\n\n"
-            "  2. **Resilience and Fault Tolerance:**  \n"
-            "     Distributing chunks across multiple nodes eliminates single points of failure. Even if some nodes go offline, the data can be reconstructed from other nodes, ensuring high availability.\n\n"
-            "  3. **Integrity and Tamper Detection:**  \n"
-            "     Each chunk’s hash is stored and verified, enabling detection of corrupted or maliciously altered data. This guards against data tampering and silent corruption.\n\n"
-            "  4. **Decentralization Reduces Trust Risks:**  \n"
-            "     Unlike centralized cloud storage, data spread across a peer-to-peer network reduces risks of data breaches caused by a compromised central server, making the system inherently more secure.\n\n"
-            "  5. **Scalability:**  \n"
-            "     The P2P model naturally scales with the number of nodes, distributing load and storage demands. This is crucial for large datasets or global-scale storage needs.\n\n"
-            "  6. **Enhanced Privacy Guarantees:**  \n"
-            "     Since no single node holds the entire file or encryption keys, the system minimizes information exposure, ensuring stronger privacy compared to traditional storage methods.\n\n"
-        )
-
-        f.write("## Conclusion\n\n")
-        f.write(
-            "While the secure P2P system demands more CPU, memory, and time due to the nature of chunking, encryption, and distributed storage, these trade-offs enable a **far more secure, private, and resilient** storage environment. "
-            "For users and applications where confidentiality, integrity, and fault tolerance are paramount, this system provides essential protections that conventional file transfers and centralized storage cannot match.\n"
-        )
-
-    print(f"✅ Markdown report generated: {report_path}")
-
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
 
+# ---- Reporting and regression checks ----
+
+def print_results(run):
+    print(f"\n{'case':<16} {'metric':<11} {'median_ms':>10} {'stdev_ms':>9} {'MB/s':>8}")
+    for name, result in run["results"].items():
+        for metric in END_TO_END + STAGES:
+            if metric not in result["metrics"]:
+                continue
+            m = result["metrics"][metric]
+            print(f"{name:<16} {metric:<11} {m['median_ms']:>10.3f} {m['stdev_ms']:>9.3f} {m['mb_s'] or '-':>8}")
+        if "decoy_fraction" in result:
+            print(f"{name:<16} {'decoys':<11} {result['decoy_fraction']:>10.1%} of stored bytes")
+        if "peak_mem_mb" in result:
+            print(f"{name:<16} {'peak_mem':<11} {result['peak_mem_mb']:>9.2f}MB")
+
+def compare(baseline, current, threshold, min_ms):
+    """Print a comparison and return the regressions.
+
+    A metric regresses when its median is more than `threshold` percent and
+    `min_ms` slower than the baseline median, and even its fastest trial is
+    slower than that baseline median, so one noisy trial cannot flag it.
+    """
+    if baseline["environment"].get("platform") != current["environment"].get("platform") or \
+            baseline["environment"].get("python") != current["environment"].get("python"):
+        print("⚠️ Baseline was recorded on a different platform or Python version")
+    regressions = []
+    print(f"\n{'case':<16} {'metric':<11} {'base_ms':>9} {'now_ms':>9} {'change':>8}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<16} (not in baseline)")
+            continue
+        for metric in END_TO_END + STAGES:
+            if metric not in base["metrics"] or metric not in result["metrics"]:
+                continue  # stage added or renamed since the baseline
+            before = base["metrics"][metric]
+            after = result["metrics"][metric]
+            change = (after["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0.0
+            flag = ""
+            if change > threshold and after["median_ms"] - before["median_ms"] > min_ms \
+                    and after["min_ms"] > before["median_ms"]:
+                flag = "⚠️ regression"
+                regressions.append((name, metric, before["median_ms"], after["median_ms"], change))
+            elif change < -threshold and before["median_ms"] - after["median_ms"] > min_ms \
+                    and after["max_ms"] < before["median_ms"]:
+                flag = "🚀 faster"
+            print(f"{name:<16} {metric:<11} {before['median_ms']:>9.3f} {after['median_ms']:>9.3f} {change:>+7.1f}% {flag}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {threshold:g}%")
+    else:
+        print(f"\n✅ No regressions beyond {threshold:g}%")
+    return regressions
+
+def load_run(path):
+    with open(path) as f:
+        return json.load(f)
 
 # ---- Main Execution ----
 
 def main():
-    all_results = []
-    for size in SIZES_MB:
-        all_results.extend(benchmark_run(size))
-    save_csv(all_results)
-    generate_report(CSV_OUT)
+    parser = argparse.ArgumentParser(description="Reproducible benchmarks for the secure upload/download pipeline")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5], help="file sizes in MB")
+    parser.add_argument("--corpora", nargs="+", default=["random", "text"], choices=["random", "text", "zeros"])
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="also measure peak memory (separate, untimed pass)")
+    parser.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare this run against a saved baseline")
+    parser.add_argument("--diff", nargs=2, metavar=("BASELINE", "RUN"), help="compare two saved runs and exit")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore changes smaller than this")
+    args = parser.parse_args()
+
+    if args.diff:
+        regressions = compare(load_run(args.diff[0]), load_run(args.diff[1]), args.threshold, args.min_ms)
+        sys.exit(1 if regressions else 0)
+
+    os.makedirs(TMP, exist_ok=True)
+    config = {k: getattr(args, k) for k in ("sizes", "corpora", "trials", "warmups", "seed")}
+    run = {"environment": environment(), "config": config, "results": {}}
+    for kind in args.corpora:
+        for size_mb in args.sizes:
+            print(f"⏱️ {kind} {size_mb:g} MB: {args.warmups} warmup + {args.trials} trials")
+            name, result = run_case(kind, size_mb, args)
+            run["results"][name] = result
+    print_results(run)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\n📊 Results saved to {args.save}")
+    if args.compare:
+        regressions = compare(load_run(args.compare), run, args.threshold, args.min_ms)
+        sys.exit(1 if regressions else 0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# --profile support for the CLI entry points.
+#
+#   python main.py --profile                        # cProfile -> profile_upload.pstats
+#   python main.py --profile --profiler sample      # sampler -> profile_upload.folded
+#   python peer_server.py --profile a_manifest.p2pm # Ctrl-C writes the profile
+#
+# cProfile records every call in every thread started while profiling: each
+# worker gets a profiler of its own, merged at the end. Threads that were
+# already running when profiling started are not profiled. From Python 3.12
+# cProfile sits on sys.monitoring, which allows one profiler per process but
+# sees every thread, so a single profiler covers pool workers too. The sampler
+# snapshots all thread stacks every few milliseconds instead, which costs far
+# less on hot loops, and writes collapsed stacks ("a;b;c count" lines) that
+# flamegraph.pl, speedscope or inferno render directly. Both print the top
+# functions by cumulative time.
+
+MODES = ("cprofile", "sample")
+
+
+def add_arguments(parser):
+    parser.add_argument("--profile", action="store_true", help="run the operation under a profiler")
+    parser.add_argument("--profiler", choices=MODES, default="cprofile",
+                        help="cprofile (every call) or sample (stack sampling, flamegraph output)")
+    parser.add_argument("--profile-out", default=None,
+                        help="output path prefix (default: profile_<operation>)")
+    parser.add_argument("--profile-top", type=int, default=20, help="functions in the summary")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="sampling interval in ms")
+
+
+class _ThreadedProfile:
+    """cProfile across threads: one Profile per thread started while running.
+
+    Threads already running at start() (pool workers from an earlier
+    operation, say) are not profiled. A profiler can only be unhooked from its
+    own thread, so workers still running at stop() keep theirs until they
+    exit; stop() snapshots every profile, and nothing they do afterwards
+    reaches the report. On 3.12+ a second profiler would be refused, and the
+    one process-wide profiler already sees every thread, so none is added.
+    """
+
+    PER_THREAD = sys.version_info < (3, 12)
+
+    def __init__(self):
+        self.profiles = [cProfile.Profile()]
+        self.snapshots = []
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def _start_thread(self, frame, event, arg):
+        profile = cProfile.Profile()
+        with self._lock:
+            if self._stopped:
+                sys.setprofile(None)  # started just as profiling stopped
+                return
+            self.profiles.append(profile)
+        profile.enable()  # replaces this hook for the rest of the thread
+
+    def start(self):
+        if self.PER_THREAD:
+            threading.setprofile(self._start_thread)
+        self.profiles[0].enable()
+
+    def stop(self):
+        if self.PER_THREAD:
+            threading.setprofile(None)
+        with self._lock:
+            self._stopped = True
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.disable()
+            try:
+                self.snapshots.append(pstats.Stats(profile))
+            except TypeError:
+                pass  # thread never made a call
+
+    def write(self, path, top):
+        stats, *rest = self.snapshots
+        for snapshot in rest:
+            stats.add(snapshot)
+        stats.dump_stats(path)
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(top)
+        return summary.getvalue()
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Sampler:
+    """Samples the stacks of all threads every `interval` seconds from a daemon thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path, top):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        inclusive = Counter()
+        own = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            for name in set(frames):
+                inclusive[name] += count
+            own[frames[-1]] += count
+        total = sum(self.stacks.values()) or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms "
+                 f"({total} thread stacks)", f"{'cumulative':>11} {'self':>7}  function"]
+        for name, count in inclusive.most_common(top):
+            lines.append(f"{count / total:>10.1%} {own[name] / total:>7.1%}  {name}")
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profiled(args, name):
+    """Run the with-block under the profiler selected by `args.profile`, if any."""
+    if not getattr(args, "profile", False):
+        yield
+        return
+    mode = args.profiler
+    profiler = Sampler(args.sample_interval / 1000) if mode == "sample" else _ThreadedProfile()
+    path = (args.profile_out or f"profile_{name}") + (".folded" if mode == "sample" else ".pstats")
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        elapsed = time.perf_counter() - started
+        summary = profiler.write(path, args.profile_top)
+        print(f"\n⏱️ Profiled '{name}' for {elapsed:.2f}s with {mode}; wrote {path}")
+        print(summary.rstrip() + "\n")
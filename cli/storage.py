@@ -0,0 +1,324 @@
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from collections.abc import MutableMapping
+
+# Record layout: key length, value length, flags, then the key and value bytes.
+RECORD = struct.Struct("<HIB")
+# Footer entry: key length, value offset, value length, flags, then the key bytes.
+FOOTER_ENTRY = struct.Struct("<HQIB")
+# Trailer at the very end of a sealed segment: footer offset, entry count, magic.
+TRAILER = struct.Struct("<QI4s")
+TRAILER_MAGIC = b"SGFT"
+
+FLAG_TEXT = 1
+FLAG_TOMBSTONE = 2
+
+# Index locations are packed into a single int to keep the per-key cost low:
+# segment id (16 bits) | value offset (40 bits) | value length (32 bits) | flags (8 bits)
+def _pack(segment, offset, length, flags):
+    return (segment << 80) | (offset << 40) | (length << 8) | flags
+
+def _unpack(loc):
+    return loc >> 80, (loc >> 40) & 0xFFFFFFFFFF, (loc >> 8) & 0xFFFFFFFF, loc & 0xFF
+
+
+class SegmentStore(MutableMapping):
+    """Append-only segment log with an in-memory key -> location index.
+
+    Values are appended to the active segment; once it reaches `segment_bytes` it
+    is sealed with a footer listing every record it holds, so reopening the store
+    only reads footers (plus the one unsealed segment) instead of the data. Sealed
+    segments are read through mmap. `compact()` rewrites live records and drops
+    overwritten and deleted ones.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._index = {}
+        self._maps = {}
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._footer = []
+        segments = self._segment_ids()
+        for segment in segments:
+            self._load_segment(segment)
+        self._active_id = segments[-1] if segments else 1
+        if segments and self._is_sealed(self._active_id):
+            self._active_id += 1
+            self._footer = []
+        self._open_active()
+
+    def _open_active(self):
+        path = self._segment_path(self._active_id)
+        self._active = open(path, "ab")
+        self._active_size = self._active.tell()
+        self._active_fd = os.open(path, os.O_RDONLY)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def _segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".log"):
+                ids.append(int(name[8:-4]))
+        return sorted(ids)
+
+    def _trailer(self, segment):
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        if size < TRAILER.size:
+            return None
+        with open(path, "rb") as f:
+            f.seek(size - TRAILER.size)
+            footer_offset, count, magic = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != TRAILER_MAGIC:
+            return None
+        return footer_offset, count
+
+    def _is_sealed(self, segment):
+        return self._trailer(segment) is not None
+
+    def _apply(self, key, loc):
+        if _unpack(loc)[3] & FLAG_TOMBSTONE:
+            self._index.pop(key, None)
+        else:
+            self._index[key] = loc
+
+    def _load_segment(self, segment):
+        trailer = self._trailer(segment)
+        path = self._segment_path(segment)
+        if trailer is not None:
+            footer_offset, count = trailer
+            with open(path, "rb") as f:
+                f.seek(footer_offset)
+                footer = f.read(os.path.getsize(path) - TRAILER.size - footer_offset)
+            pos = 0
+            for _ in range(count):
+                key_len, offset, length, flags = FOOTER_ENTRY.unpack_from(footer, pos)
+                pos += FOOTER_ENTRY.size
+                key = footer[pos:pos + key_len].decode()
+                pos += key_len
+                self._apply(key, _pack(segment, offset, length, flags))
+            return
+
+        # Unsealed (active or interrupted) segment: scan records, dropping a torn tail.
+        self._footer = []
+        valid = 0
+        with open(path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            key_len, length, flags = RECORD.unpack_from(data, pos)
+            end = pos + RECORD.size + key_len + length
+            if end > len(data):
+                break
+            key_bytes = data[pos + RECORD.size:pos + RECORD.size + key_len]
+            offset = pos + RECORD.size + key_len
+            self._footer.append(FOOTER_ENTRY.pack(key_len, offset, length, flags) + key_bytes)
+            self._apply(key_bytes.decode(), _pack(segment, offset, length, flags))
+            pos = valid = end
+        if valid != len(data):
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+
+    def _append(self, key, data, flags):
+        key_bytes = key.encode()
+        self._active.write(RECORD.pack(len(key_bytes), len(data), flags))
+        self._active.write(key_bytes)
+        self._active.write(data)
+        offset = self._active_size + RECORD.size + len(key_bytes)
+        self._active_size = offset + len(data)
+        self._footer.append(FOOTER_ENTRY.pack(len(key_bytes), offset, len(data), flags) + key_bytes)
+        loc = _pack(self._active_id, offset, len(data), flags)
+        self._apply(key, loc)
+        if self._active_size >= self.segment_bytes:
+            self._roll()
+        return loc
+
+    def _seal(self):
+        # Footer lists every record in the segment (including tombstones) so that
+        # replaying footers in segment order reproduces the same index.
+        self._active.write(b"".join(self._footer))
+        self._active.write(TRAILER.pack(self._active_size, len(self._footer), TRAILER_MAGIC))
+        self._active.close()
+        os.close(self._active_fd)
+        self._footer = []
+
+    def _roll(self):
+        self._seal()
+        self._active_id += 1
+        self._open_active()
+
+    def _raw(self, segment, offset, length):
+        if segment == self._active_id:
+            self._active.flush()
+            return os.pread(self._active_fd, length, offset)
+        mapped = self._maps.get(segment)
+        if mapped is None:
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped[offset:offset + length]
+
+    def _read(self, loc):
+        segment, offset, length, flags = _unpack(loc)
+        data = self._raw(segment, offset, length)
+        return data.decode() if flags & FLAG_TEXT else data
+
+    def __getitem__(self, key):
+        with self._lock:
+            loc = self._index[key]
+            return self._read(loc)
+
+    def __setitem__(self, key, value):
+        if isinstance(value, str):
+            data, flags = value.encode(), FLAG_TEXT
+        else:
+            data, flags = bytes(value), 0
+        with self._lock:
+            self._append(key, data, flags)
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._index:
+                raise KeyError(key)
+            self._append(key, b"", FLAG_TOMBSTONE)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def __iter__(self):
+        with self._lock:
+            keys = list(self._index)
+        return iter(keys)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def sync(self):
+        with self._lock:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+
+    def compact(self):
+        """Rewrite live records into fresh segments and delete the old ones."""
+        with self._lock:
+            old_segments = self._segment_ids()
+            live = list(self._index.items())
+            self._seal()
+            self._active_id = old_segments[-1] + 1
+            self._open_active()
+            for key, loc in live:
+                segment, offset, length, flags = _unpack(loc)
+                self._append(key, self._raw(segment, offset, length), flags)
+            self._close_maps()
+            for segment in old_segments:
+                os.remove(self._segment_path(segment))
+
+    def _close_maps(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+    def close(self):
+        with self._lock:
+            if self._active.closed:
+                return
+            if self._active_size:
+                self._seal()
+            else:
+                self._active.close()
+                os.close(self._active_fd)
+                os.remove(self._segment_path(self._active_id))
+            self._close_maps()
+
+
+class SQLiteStore(MutableMapping):
+    """Chunk store backed by a single SQLite table (WAL mode)."""
+
+    def __init__(self, path, commit_every=1000):
+        self.path = path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, value BLOB, is_text INTEGER)"
+        )
+
+    def __getitem__(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value, is_text FROM chunks WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value, is_text = row
+        return value.decode() if is_text else value
+
+    def __setitem__(self, key, value):
+        is_text = isinstance(value, str)
+        data = value.encode() if is_text else bytes(value)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO chunks (key, value, is_text) VALUES (?, ?, ?)",
+                (key, data, int(is_text)),
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._db.commit()
+                self._pending = 0
+
+    def __delitem__(self, key):
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM chunks WHERE key = ?", (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM chunks WHERE key = ?", (key,)).fetchone() is not None
+
+    def __iter__(self):
+        with self._lock:
+            keys = [row[0] for row in self._db.execute("SELECT key FROM chunks")]
+        return iter(keys)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def sync(self):
+        with self._lock:
+            self._db.commit()
+            self._pending = 0
+
+    def compact(self):
+        with self._lock:
+            self._db.commit()
+            self._db.execute("VACUUM")
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+def open_store(spec=None):
+    """Open a chunk store from a spec: None/"memory", "segment:<dir>" or "sqlite:<file>"."""
+    if not spec or spec == "memory":
+        return {}
+    kind, _, path = spec.partition(":")
+    if kind == "segment":
+        return SegmentStore(path)
+    if kind == "sqlite":
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown store spec: {spec}")
@@ -0,0 +1,120 @@
+import json
+import os
+import pytest
+from encryption_utils import chunk_and_encrypt, decrypt_and_reconstruct
+from bundle import chunk_and_encrypt_dir, extract_bundle, is_bundle
+from erasure import encode_manifest, wrap_dht
+from manifest_format import (
+    MAGIC, ManifestFile, is_binary_manifest, load_manifest, open_manifest, read_header, save_manifest
+)
+from p2p_node import DHT
+
+# Checks for the P2PM v2 manifest format:  python -m pytest -q test_manifest_format.py
+
+
+@pytest.fixture
+def uploaded(tmp_path):
+    data = os.urandom(100_000)
+    path = tmp_path / "input.bin"
+    path.write_bytes(data)
+    key, manifest = chunk_and_encrypt(str(path))
+    manifest["encrypted_key"] = "ab" * 16
+    return data, key, manifest
+
+
+def stored_dht(manifest):
+    dht = DHT()
+    for h, chunk in manifest["chunk_data"].items():
+        dht.store(h, chunk)
+    return dht
+
+
+def test_v2_round_trip(tmp_path, uploaded):
+    data, key, manifest = uploaded
+    path = str(tmp_path / "m.p2pm")
+    save_manifest(manifest, path)
+    assert is_binary_manifest(path)
+
+    header = read_header(path)
+    assert header["filename"] == manifest["filename"]
+    assert header["size"] == len(data)
+    assert header["chunk_count"] == len(manifest["chunks"])
+    assert header["decoy_count"] == len(manifest["decoy_hashes"])
+
+    with open_manifest(path) as loaded:
+        assert isinstance(loaded, ManifestFile)
+        for field in ("filename", "size", "encrypted_key"):
+            assert loaded[field] == manifest[field]
+        for field in ("chunks", "offsets", "decoy_hashes"):
+            assert list(loaded[field]) == list(manifest[field])
+        assert {h: loaded["nonces"][h] for h in manifest["chunks"]} == manifest["nonces"]
+        assert dict(loaded["chunk_data"].items()) == manifest["chunk_data"]
+
+        out = tmp_path / "out.bin"
+        decrypt_and_reconstruct(loaded, key, stored_dht(manifest), str(out))
+        assert out.read_bytes() == data
+    assert loaded.buffer.closed
+
+
+def test_v2_erasure_round_trip(tmp_path, uploaded):
+    data, key, manifest = uploaded
+    encode_manifest(manifest, 4, 2)
+    path = str(tmp_path / "m.p2pm")
+    save_manifest(manifest, path)
+
+    assert read_header(path)["erasure"] == {"k": 4, "m": 2}
+    with open_manifest(path) as loaded:
+        assert loaded["erasure"] == {"k": 4, "m": 2}
+        assert set(loaded["chunk_data"]) == set(manifest["chunk_data"])
+        out = tmp_path / "out.bin"
+        decrypt_and_reconstruct(loaded, key, wrap_dht(stored_dht(manifest), loaded), str(out))
+        assert out.read_bytes() == data
+
+
+def test_legacy_json_load(tmp_path, uploaded):
+    data, key, manifest = uploaded
+    path = str(tmp_path / "legacy_manifest.json")
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+    assert not is_binary_manifest(path)
+
+    header = read_header(path)
+    assert header["version"] == 1
+    assert header["chunk_count"] == len(manifest["chunks"])
+
+    with open_manifest(path) as loaded:
+        assert loaded == manifest
+        out = tmp_path / "out.bin"
+        decrypt_and_reconstruct(loaded, key, stored_dht(manifest), str(out))
+        assert out.read_bytes() == data
+
+
+def test_empty_directory_bundle(tmp_path):
+    (tmp_path / "empty").mkdir()
+    key, manifest = chunk_and_encrypt_dir(str(tmp_path / "empty"))
+    manifest["encrypted_key"] = "ab" * 16
+    path = str(tmp_path / "m.p2pm")
+    save_manifest(manifest, path)
+
+    assert read_header(path)["files"] == []
+    with open_manifest(path) as loaded:
+        assert is_bundle(loaded)
+        out = tmp_path / "out"
+        assert extract_bundle(loaded, key, stored_dht(manifest), str(out)) == 0
+        assert out.is_dir() and not list(out.iterdir())
+
+
+def test_unknown_version_is_rejected(tmp_path, uploaded):
+    path = tmp_path / "m.p2pm"
+    save_manifest(uploaded[2], str(path))
+    raw = bytearray(path.read_bytes())
+    raw[len(MAGIC)] = 99
+    path.write_bytes(bytes(raw))
+    with pytest.raises(ValueError):
+        read_header(str(path))
+    with pytest.raises(ValueError):
+        load_manifest(str(path))
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
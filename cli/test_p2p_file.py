@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+import random
+import tarfile
+import zipfile
+import pytest
+from encryption_utils import SUB_CHUNK_SIZE, chunk_and_encrypt
+from p2p_file import P2PFile
+from p2p_node import DHT
+
+# Checks for the seekable DHT-backed reader:  python -m pytest -q test_p2p_file.py
+
+
+def upload(tmp_path, data):
+    path = tmp_path / "input.bin"
+    path.write_bytes(data)
+    key, manifest = chunk_and_encrypt(str(path))
+    dht = DHT()
+    for h, chunk in manifest["chunk_data"].items():
+        dht.store(h, chunk)
+    return P2PFile(manifest, key, dht)
+
+
+def archive_members():
+    rng = random.Random(1)
+    return {f"dir/file{i}.bin": rng.randbytes(rng.randrange(1, 5 * SUB_CHUNK_SIZE)) for i in range(8)}
+
+
+def test_tarfile_round_trip(tmp_path):
+    members = archive_members()
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+
+    with upload(tmp_path, archive.getvalue()) as f, tarfile.open(fileobj=f) as tar:
+        assert {m.name: tar.extractfile(m).read() for m in tar.getmembers()} == members
+
+
+def test_zipfile_round_trip(tmp_path):
+    members = archive_members()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+
+    with upload(tmp_path, archive.getvalue()) as f, zipfile.ZipFile(f) as zf:
+        assert {name: zf.read(name) for name in zf.namelist()} == members
+
+
+def test_hashlib_file_digest(tmp_path):
+    data = os.urandom(100_000)
+    with upload(tmp_path, data) as f:
+        assert hashlib.file_digest(f, "sha256").hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_reads_span_chunk_boundaries(tmp_path):
+    data = os.urandom(10 * SUB_CHUNK_SIZE + 123)
+    with upload(tmp_path, data) as f:
+        assert f.read(3 * SUB_CHUNK_SIZE + 5) == data[:3 * SUB_CHUNK_SIZE + 5]
+        assert f.read() == data[3 * SUB_CHUNK_SIZE + 5:]
+        assert f.read(10) == b""
+
+        rng = random.Random(0)
+        boundaries = [i * SUB_CHUNK_SIZE + d for i in range(1, 11) for d in (-1, 0, 1)]
+        for _ in range(200):
+            start = rng.choice(boundaries + [rng.randrange(len(data))])
+            length = rng.randrange(1, 3 * SUB_CHUNK_SIZE)
+            assert f.seek(start) == start
+            assert f.read(length) == data[start:start + length]
+            assert f.tell() == min(start + length, len(data))
+
+        f.seek(-50, io.SEEK_END)
+        buffer = bytearray(100)
+        assert f.readinto(buffer) == 50 and buffer[:50] == data[-50:]
+        f.seek(SUB_CHUNK_SIZE - 10)
+        assert f.read1(100) == data[SUB_CHUNK_SIZE - 10:SUB_CHUNK_SIZE]
+    with pytest.raises(ValueError):
+        f.read(1)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
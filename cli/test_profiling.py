@@ -0,0 +1,41 @@
+import argparse
+import os
+import pstats
+import pytest
+from encryption_utils import chunk_and_encrypt, decrypt_and_reconstruct
+from p2p_node import DHT
+from profiling import profiled
+
+# Checks for --profile support:  python -m pytest -q test_profiling.py
+
+
+def profile_args(out, profiler):
+    return argparse.Namespace(profile=True, profiler=profiler, profile_out=str(out),
+                              profile_top=5, sample_interval=5.0)
+
+
+@pytest.mark.parametrize("profiler, suffix", [("cprofile", ".pstats"), ("sample", ".folded")])
+def test_threaded_download_under_profiler(tmp_path, profiler, suffix):
+    data = os.urandom(300_000)
+    path = tmp_path / "input.bin"
+    path.write_bytes(data)
+    key, manifest = chunk_and_encrypt(str(path))
+    dht = DHT()
+    for h, chunk in manifest["chunk_data"].items():
+        dht.store(h, chunk)
+
+    output = tmp_path / "output.bin"
+    with profiled(profile_args(tmp_path / "profile", profiler), "download"):
+        decrypt_and_reconstruct(manifest, key, dht, str(output))
+    assert output.read_bytes() == data
+
+    profile = tmp_path / f"profile{suffix}"
+    assert profile.exists()
+    if profiler == "cprofile":
+        # decrypt_chunk only runs on the worker threads.
+        names = {func[2] for func in pstats.Stats(str(profile)).stats}
+        assert "decrypt_chunk" in names
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,112 @@
+import os
+from storage import RECORD, TRAILER, TRAILER_MAGIC, SegmentStore, SQLiteStore, open_store
+
+# Checks for the on-disk chunk stores:  python -m pytest -q test_storage.py
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("segment-"))
+
+
+def is_sealed(path):
+    with open(path, "rb") as f:
+        f.seek(-TRAILER.size, os.SEEK_END)
+        return TRAILER.unpack(f.read())[2] == TRAILER_MAGIC
+
+
+def fill(store, count, size=300):
+    values = {}
+    for i in range(count):
+        key = f"{i:064x}"
+        values[key] = os.urandom(size) if i % 2 else f"text-{i}-" + "x" * size
+        store[key] = values[key]
+    return values
+
+
+def test_reopen_after_seal(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_bytes=4096)
+    values = fill(store, 100)
+    store.close()
+
+    names = segment_files(tmp_path)
+    assert len(names) > 1
+    assert all(is_sealed(os.path.join(tmp_path, name)) for name in names)
+
+    store = SegmentStore(str(tmp_path), segment_bytes=4096)
+    assert len(store) == len(values)
+    for key, value in values.items():
+        assert store[key] == value  # str stays str, bytes stay bytes
+    store["new"] = b"after reopen"
+    store.close()
+
+    store = SegmentStore(str(tmp_path), segment_bytes=4096)
+    assert store["new"] == b"after reopen"
+    assert len(store) == len(values) + 1
+    store.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    values = fill(store, 20)
+    store.sync()
+    path = os.path.join(tmp_path, segment_files(tmp_path)[-1])
+    good_size = os.path.getsize(path)
+    # A crash halfway through the next record: header and part of the key only.
+    with open(path, "ab") as f:
+        f.write(RECORD.pack(64, 300, 0) + b"f" * 10)
+    store._active.close()
+    os.close(store._active_fd)
+
+    store = SegmentStore(str(tmp_path))
+    assert os.path.getsize(path) == good_size
+    assert dict(store.items()) == values
+    store["after"] = "crash"
+    store.close()
+
+    store = SegmentStore(str(tmp_path))
+    assert store["after"] == "crash"
+    assert len(store) == len(values) + 1
+    store.close()
+
+
+def test_compact_drops_overwritten_and_deleted(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_bytes=4096)
+    values = fill(store, 60)
+    for i, key in enumerate(list(values)):
+        if i % 3 == 0:
+            del store[key]
+            del values[key]
+        elif i % 3 == 1:
+            values[key] = store[key] = b"overwritten-%d" % i
+    before = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in segment_files(tmp_path))
+    old_names = set(segment_files(tmp_path))
+
+    store.compact()
+    assert not old_names & set(segment_files(tmp_path))
+    after = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in segment_files(tmp_path))
+    assert after < before
+    assert dict(store.items()) == values
+    store.close()
+
+    store = SegmentStore(str(tmp_path), segment_bytes=4096)
+    assert dict(store.items()) == values  # tombstoned keys stay deleted
+    store.close()
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "chunks.db")
+    store = open_store("sqlite:" + path)
+    assert isinstance(store, SQLiteStore)
+    values = fill(store, 10)
+    del store[next(iter(values))]
+    del values[next(iter(values))]
+    store.close()
+
+    store = SQLiteStore(path)
+    assert dict(store.items()) == values
+    store.close()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main(["-q", __file__]))
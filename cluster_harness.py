@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from p2p_node_chunked import P2PNode, lookup_probe
+
+# Runs every DHT node as its own p2p_node_chunked.py process on 127.0.0.1 so
+# results are not bounded by one interpreter's GIL, shapes each node's link
+# (latency, jitter, loss, bandwidth), and drives upload/download workloads
+# from separate client processes that join the network as ordinary nodes.
+#
+#   python cluster_harness.py --nodes 30 --clients 4 --link 20:20:0.01 --link 10:150:0.05:2000
+
+HOST = "127.0.0.1"
+NODE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "p2p_node_chunked.py")
+
+
+def parse_link(spec):
+    """LATENCY_MS[:LOSS[:KBPS[:JITTER_MS]]] -> impair() arguments."""
+    parts = [float(p) for p in spec.split(":")] + [0.0] * 3
+    latency_ms, loss, kbps, jitter_ms = parts[:4]
+    return {"latency": latency_ms / 1000, "jitter": jitter_ms / 1000, "loss": loss,
+            "bandwidth": kbps * 1000 / 8 if kbps else None}
+
+
+def node_links(specs, num_nodes):
+    """--link COUNT:LATENCY_MS[:LOSS[:KBPS[:JITTER_MS]]], in node order; the rest are unshaped."""
+    links = []
+    for spec in specs:
+        count, rest = spec.split(":", 1)
+        links += [parse_link(rest)] * int(count)
+    links += [None] * (num_nodes - len(links))
+    return links[:num_nodes]
+
+
+def link_flags(link):
+    if not link:
+        return []
+    return ["--latency-ms", str(link["latency"] * 1000), "--jitter-ms", str(link["jitter"] * 1000),
+            "--loss", str(link["loss"]),
+            "--bandwidth-kbps", str(link["bandwidth"] * 8 / 1000 if link["bandwidth"] else 0)]
+
+
+def launch(port, seeds, ksize, link, log_dir):
+    cmd = [sys.executable, NODE_SCRIPT, str(port), "--ksize", str(ksize),
+           "--seeds", ",".join(f"{HOST}:{p}" for p in seeds)] + link_flags(link)
+    log = open(os.path.join(log_dir, f"node_{port}.log"), "w")
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_up(server, ports, timeout):
+    """Ping until every port answers; returns {port: node id}."""
+    ids = {}
+    deadline = time.monotonic() + timeout
+    while len(ids) < len(ports) and time.monotonic() < deadline:
+        # A ping to a port nobody listens on yet only fails after the 5 s RPC
+        # timeout, so stop waiting after a moment and ping again.
+        pings = {asyncio.ensure_future(server.bootstrap_node((HOST, p))): p
+                 for p in ports if p not in ids}
+        done, _ = await asyncio.wait(pings, timeout=0.5)
+        ids.update({pings[t]: t.result().id for t in done if t.result() is not None})
+    return ids
+
+
+async def start_network(args, links, log_dir, probe):
+    procs = []
+    seeds = list(range(args.base_port, args.base_port + max(1, min(args.seeds, args.nodes))))
+    start = time.perf_counter()
+
+    procs.append(launch(seeds[0], [], args.ksize, links[0], log_dir))
+    await wait_until_up(probe.node, seeds[:1], args.timeout)
+    for i, port in enumerate(seeds[1:], 1):
+        procs.append(launch(port, seeds[:1], args.ksize, links[i], log_dir))
+    await wait_until_up(probe.node, seeds, args.timeout)
+    ports = list(range(args.base_port, args.base_port + args.nodes))
+    for i, port in enumerate(ports[len(seeds):], len(seeds)):
+        procs.append(launch(port, seeds, args.ksize, links[i], log_dir))
+    ids = await wait_until_up(probe.node, ports, args.timeout)
+
+    # Converged once every node can be found by a lookup.
+    await probe.node.bootstrap([(HOST, p) for p in seeds])
+    missing = list(ids.values())
+    while missing and time.perf_counter() - start < args.timeout:
+        found = await asyncio.gather(*[lookup_probe(probe.node, node_id) for node_id in missing])
+        missing = [node_id for node_id, ok in zip(missing, found) if not ok]
+    ready = time.perf_counter() - start
+    print(f"✅ {len(ids)} of {args.nodes} node processes up, "
+          f"{args.nodes - len(missing)} reachable by lookup, in {ready:.2f}s")
+    return procs, seeds, ready
+
+
+def chunk_bytes(client, file_index, chunk_index, size):
+    # Deterministic, so any client can verify what another one uploaded.
+    return random.Random(f"{client}:{file_index}:{chunk_index}").randbytes(size)
+
+
+def chunk_key(client, file_index, chunk_index):
+    return f"bench:{client}:{file_index}:{chunk_index}"
+
+
+async def run_phase(jobs, concurrency):
+    """Run (coroutine function, bytes) jobs; returns latencies, bytes, failures, seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+    moved = 0
+
+    async def run(job, nbytes):
+        nonlocal failures, moved
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await job()
+            except Exception as e:
+                print(f"⚠️ Request failed: {e!r}")
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+                moved += nbytes
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run(job, nbytes) for job, nbytes in jobs])
+    return {"latencies": latencies, "bytes": moved, "failures": failures,
+            "seconds": time.perf_counter() - start}
+
+
+async def client_workload(index, args, seeds, link, barrier, results):
+    loop = asyncio.get_running_loop()
+    node = P2PNode(args.base_port + args.nodes + index, [(HOST, p) for p in seeds], ksize=args.ksize, link=link)
+    await node.start()
+    chunk_size = args.chunk_kb * 1024
+    chunks_per_file = max(1, args.file_kb // args.chunk_kb)
+    report = {"client": index}
+
+    async def upload(f, c):
+        return await node.node.set(chunk_key(index, f, c), chunk_bytes(index, f, c, chunk_size))
+
+    async def download(owner, f, c):
+        return await node.node.get(chunk_key(owner, f, c)) == chunk_bytes(owner, f, c, chunk_size)
+
+    # Phases are separated by barriers; waiting happens off the event loop so
+    # this node keeps answering RPCs from the rest of the network.
+    await loop.run_in_executor(None, barrier.wait)
+    report["upload"] = await run_phase(
+        [(lambda f=f, c=c: upload(f, c), chunk_size)
+         for f in range(args.files) for c in range(chunks_per_file)], args.concurrency)
+
+    await loop.run_in_executor(None, barrier.wait)
+    owner = (index + 1) % args.clients  # read someone else's files
+    report["download"] = await run_phase(
+        [(lambda f=f, c=c: download(owner, f, c), chunk_size)
+         for f in range(args.files) for c in range(chunks_per_file)], args.concurrency)
+
+    # Clients hold data too, so nobody leaves before every download is done.
+    await loop.run_in_executor(None, barrier.wait)
+    await node.stop()
+    results.put(report)
+
+
+def client_main(index, args, seeds, link, barrier, results):
+    # Node chatter goes to the log; the harness prints the report.
+    sys.stdout = sys.stderr = open(os.path.join(args.log_dir, f"client_{index}.log"), "w")
+    asyncio.run(client_workload(index, args, seeds, link, barrier, results))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(reports, phase):
+    latencies = [l for r in reports for l in r[phase]["latencies"]]
+    moved = sum(r[phase]["bytes"] for r in reports)
+    seconds = max(r[phase]["seconds"] for r in reports)
+    ops = len(latencies)
+    return {
+        "ops": ops,
+        "failures": sum(r[phase]["failures"] for r in reports),
+        "seconds": round(seconds, 3),
+        "throughput_mb_s": round(moved / seconds / 1e6, 3) if seconds else 0.0,
+        "ops_per_s": round(ops / seconds, 1) if seconds else 0.0,
+        **{f"p{pct}_ms": round(percentile(latencies, pct) * 1000, 1) for pct in (50, 95, 99)},
+    }
+
+
+async def run(args):
+    links = node_links(args.link, args.nodes)
+    client_link = parse_link(args.client_link) if args.client_link else None
+    # The probe node checks readiness. It stays up for the whole run, since
+    # every node has it in its routing table by then and a vanished contact
+    # costs each lookup an RPC timeout.
+    probe = P2PNode(args.base_port + args.nodes + args.clients, ksize=args.ksize)
+    await probe.start()
+    procs, seeds, ready = await start_network(args, links, args.log_dir, probe)
+    try:
+        ctx = mp.get_context("spawn")
+        barrier = ctx.Barrier(args.clients)
+        results = ctx.Queue()
+        clients = [ctx.Process(target=client_main, args=(i, args, seeds, client_link, barrier, results))
+                   for i in range(args.clients)]
+        for c in clients:
+            c.start()
+        loop = asyncio.get_running_loop()
+        reports = [await loop.run_in_executor(None, results.get) for _ in clients]
+        for c in clients:
+            c.join()
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        await probe.stop()
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json",)},
+        "ready_s": round(ready, 2),
+        "upload": summarize(reports, "upload"),
+        "download": summarize(reports, "download"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process DHT cluster benchmark on 127.0.0.1")
+    parser.add_argument("--nodes", type=int, default=30)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--ksize", type=int, default=5,
+                        help="replication factor; keep well below --nodes or every node stores everything")
+    parser.add_argument("--files", type=int, default=2, help="files uploaded per client")
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--chunk-kb", type=int, default=4, help="values must fit in one 8 KB RPC")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight requests per client")
+    parser.add_argument("--link", action="append", default=[],
+                        help="COUNT:LATENCY_MS[:LOSS[:KBPS[:JITTER_MS]]] for the next COUNT nodes")
+    parser.add_argument("--client-link", default=None, help="LATENCY_MS[:LOSS[:KBPS[:JITTER_MS]]] for clients")
+    parser.add_argument("--base-port", type=int, default=9400)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--log-dir", default=None)
+    parser.add_argument("--json", default=None, help="write the report here")
+    args = parser.parse_args()
+    args.log_dir = args.log_dir or tempfile.mkdtemp(prefix="dht_harness_")
+    os.makedirs(args.log_dir, exist_ok=True)
+
+    report = asyncio.run(run(args))
+    print(f"\n{'phase':<9} {'ops':>6} {'fail':>5} {'MB/s':>7} {'ops/s':>7} {'p50_ms':>7} {'p95_ms':>7} {'p99_ms':>7}")
+    for phase in ("upload", "download"):
+        r = report[phase]
+        print(f"{phase:<9} {r['ops']:>6} {r['failures']:>5} {r['throughput_mb_s']:>7} {r['ops_per_s']:>7} "
+              f"{r['p50_ms']:>7} {r['p95_ms']:>7} {r['p99_ms']:>7}")
+    print(f"\n📁 Node and client logs: {args.log_dir}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📊 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import deque
+
+
+class LatencyTracker:
+    """Latencies in seconds: a rolling window of single attempts, which sets
+    the hedge delay, and every end-to-end request for the summary."""
+
+    def __init__(self, window=1000, hedge_percentile=95, default_delay=0.1, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.requests = []
+        self.hedge_percentile = hedge_percentile
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def record_request(self, seconds):
+        self.requests.append(seconds)
+
+    def percentile(self, pct, samples=None):
+        values = sorted(self.samples if samples is None else samples)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    def hedge_delay(self):
+        # Until there is enough history, hedge after a fixed delay.
+        if len(self.samples) < self.min_samples:
+            return self.default_delay
+        return self.percentile(self.hedge_percentile)
+
+    def summary(self):
+        return {f"p{pct}": self.percentile(pct, self.requests) for pct in (50, 95, 99)}
+
+
+class HedgeBudget:
+    """Caps duplicate requests at `ratio` of primary requests (0.1 = 10% extra load)."""
+
+    def __init__(self, ratio=0.1):
+        self.ratio = ratio
+        self.primary = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def allow(self):
+        if self.hedges + 1 > self.ratio * max(self.primary, 1):
+            return False
+        self.hedges += 1
+        return True
+
+
+async def hedged(attempts, tracker, budget):
+    """Run `attempts` (zero-arg coroutine functions, best first) with hedging.
+
+    The first attempt starts at once. If it has not answered by the tracker's
+    p95 latency and the budget allows, the next attempt is started as well and
+    whichever returns a result first wins; the others are cancelled. An attempt
+    that returns None or raises counts as failed, and the next one is started
+    immediately. Returns None if every attempt fails.
+    """
+    attempts = iter(attempts)
+    started = {}
+
+    def launch():
+        attempt = next(attempts, None)
+        if attempt is None:
+            return False
+        started[asyncio.ensure_future(attempt())] = time.perf_counter()
+        return True
+
+    budget.primary += 1
+    begin = time.perf_counter()
+    launch()
+    try:
+        while started:
+            done, _ = await asyncio.wait(started, timeout=tracker.hedge_delay(),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                launched = started.pop(task)
+                result = None if task.cancelled() or task.exception() else task.result()
+                if result is not None:
+                    now = time.perf_counter()
+                    tracker.record(now - launched)
+                    tracker.record_request(now - begin)
+                    if launched != min([launched] + list(started.values())):
+                        budget.wins += 1  # a hedge beat an earlier attempt
+                    return result
+            if not done:
+                if budget.allow() and not launch():
+                    budget.hedges -= 1  # nobody left to hedge to
+            elif not started:
+                launch()
+    finally:
+        for task in started:
+            task.cancel()
+    return None
@@ -0,0 +1,47 @@
+import asyncio
+import random
+
+
+class ShapedTransport:
+    """Wraps a datagram transport to emulate a slower, lossy link on send.
+
+    Every outgoing datagram is dropped with probability `loss`, queued behind
+    earlier datagrams at `bandwidth` bytes/s (None for unlimited), and
+    delivered `latency` seconds later plus up to `jitter` seconds. Only the
+    sending side is shaped, so a round trip between two shaped nodes pays the
+    latency twice, as it would on a real link.
+    """
+
+    def __init__(self, transport, latency=0.0, jitter=0.0, loss=0.0, bandwidth=None):
+        self.transport = transport
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.bandwidth = bandwidth
+        self.loop = asyncio.get_event_loop()
+        self._link_free = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    def sendto(self, data, addr=None):
+        if self.loss and random.random() < self.loss:
+            self.dropped += 1
+            return
+        now = self.loop.time()
+        departure = now
+        if self.bandwidth:
+            departure = max(now, self._link_free) + len(data) / self.bandwidth
+            self._link_free = departure
+        delay = departure - now + self.latency + random.uniform(0, self.jitter)
+        self.sent += 1
+        if delay <= 0:
+            self.transport.sendto(data, addr)
+        else:
+            self.loop.call_later(delay, self._send, data, addr)
+
+    def _send(self, data, addr):
+        if not self.transport.is_closing():
+            self.transport.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
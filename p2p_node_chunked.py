@@ -1,24 +1,122 @@
 import asyncio
-from kademlia.network import Server
+import random
+import socket
+import time
+from kademlia.crawling import NodeSpiderCrawl
+from kademlia.node import Node
+from netem import ShapedTransport
+from repair import RepairServer
+from logging_utils import get_logger
+
+log = get_logger(__name__)
+
+RECV_BUFFER = 4 * 1024 * 1024  # capped by net.core.rmem_max
+
+
+async def lookup_probe(server, target_id):
+    """True if a lookup from `server` finds the node with id `target_id`."""
+    # Routing tables never return a node for a lookup of its own exact id,
+    # so look up the id with its last bit flipped: the target is then the
+    # closest node there is.
+    key = Node(target_id[:-1] + bytes([target_id[-1] ^ 1]))
+    nearest = server.protocol.router.find_neighbors(key, server.alpha)
+    if not nearest:
+        return False
+    found = await NodeSpiderCrawl(server.protocol, key, nearest, server.ksize, server.alpha).find()
+    return any(n.id == target_id for n in found)
+
 
 class P2PNode:
-    def __init__(self, port, bootstrap_node=None):
+    def __init__(self, port, bootstrap_node=None, ksize=20, link=None):
         self.port = port
+        # impair() arguments, applied as soon as the node listens.
+        self.link = link
+        # One (ip, port) seed or a list of them; all are contacted in parallel.
         self.bootstrap_node = bootstrap_node
-        self.node = Server()
+        # ksize is also the replication factor: each key goes to the ksize closest nodes.
+        # RepairServer is a kademlia Server that also answers has_value probes.
+        self.node = RepairServer(ksize=ksize)
 
     async def start(self):
         """Start the node and connect to the bootstrap node if provided."""
         await self.node.listen(self.port)
+        # rpcudp never retransmits, so a datagram dropped from a full socket
+        # buffer during a burst costs a whole 5 s RPC timeout.
+        sock = self.node.transport.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        if self.link:
+            self.impair(**self.link)
 
         if self.bootstrap_node:
+            seeds = self.bootstrap_node if isinstance(self.bootstrap_node, list) else [self.bootstrap_node]
             try:
-                print(f"🔗 Connecting to bootstrap node {self.bootstrap_node}")
-                await self.node.bootstrap([self.bootstrap_node])
+                log.info(f"🔗 Connecting to bootstrap node{'s' if len(seeds) > 1 else ''} {', '.join(map(str, seeds))}")
+                await self.node.bootstrap(seeds)
             except Exception as e:
-                print(f"⚠️ Failed to bootstrap: {e}")
-
-        print(f"✅ Node running on port {self.port}")
+                log.warning(f"⚠️ Failed to bootstrap: {e}")
+
+        log.info(f"✅ Node running on port {self.port}")
+
+    def impair(self, latency=0.0, jitter=0.0, loss=0.0, bandwidth=None):
+        """Shape this node's outgoing traffic (seconds, drop probability, bytes/s)."""
+        protocol = self.node.protocol
+        protocol.transport = ShapedTransport(protocol.transport, latency, jitter, loss, bandwidth)
+        return protocol.transport
+
+    @classmethod
+    async def start_cluster(cls, num_nodes, base_port=8468, host="127.0.0.1", seeds=3, ksize=20,
+                            probes=None, timeout=30.0):
+        """Start a local network of `num_nodes` nodes and wait until it is usable.
+
+        The first `seeds` nodes start and join each other. All other nodes then
+        start concurrently and bootstrap against every seed in parallel. The
+        network counts as converged once a round of lookup probes (a node
+        looking up another node's id must find that node) all succeed; by
+        default every node is the target of one probe, or pass `probes` to
+        sample fewer. Nodes that could not be found look themselves up again
+        from a few random peers.
+        Returns the nodes once converged, or after `timeout` seconds with a
+        warning.
+        """
+        start = time.perf_counter()
+        seeds = max(1, min(seeds, num_nodes))
+        seed_addrs = [(host, base_port + i) for i in range(seeds)]
+
+        nodes = [cls(base_port, ksize=ksize)]
+        await nodes[0].start()
+        nodes += [cls(base_port + i, seed_addrs[:i], ksize=ksize) for i in range(1, seeds)]
+        await asyncio.gather(*[node.start() for node in nodes[1:]])
+
+        others = [cls(base_port + i, list(seed_addrs), ksize=ksize) for i in range(seeds, num_nodes)]
+        await asyncio.gather(*[node.start() for node in others])
+        nodes += others
+
+        rounds = 0
+        while True:
+            rounds += 1
+            failed = await cls._probe_lookups(nodes, probes)
+            if not failed:
+                log.info(f"✅ Cluster of {num_nodes} nodes ready in {time.perf_counter() - start:.2f}s "
+                         f"({rounds} probe round{'s' if rounds > 1 else ''})")
+                return nodes
+            if time.perf_counter() - start > timeout:
+                log.warning(f"⚠️ Cluster not converged after {timeout:.0f}s: {len(failed)} nodes still not found by lookups")
+                return nodes
+            await asyncio.gather(*[node.node.bootstrap([(host, peer.port) for peer in random.sample(nodes, seeds)])
+                                   for node in failed])
+
+    @staticmethod
+    async def _probe_lookups(nodes, probes):
+        """Look up random nodes from random other nodes; returns the targets not found."""
+        if len(nodes) < 2:
+            return []
+        if probes is None:
+            pairs = [(random.choice([n for n in nodes if n is not target]), target) for target in nodes]
+        else:
+            pairs = [random.sample(nodes, 2) for _ in range(probes)]
+        results = await asyncio.gather(*[lookup_probe(source.node, target.node.node.id)
+                                         for source, target in pairs])
+        return list({id(target): target for (_, target), ok in zip(pairs, results) if not ok}.values())
 
     async def store_chunks(self, file_path, chunk_size=1024):
         """Reads a file, splits it into chunks, and stores each chunk in the DHT."""
@@ -28,38 +126,38 @@ class P2PNode:
 
             for i, chunk in enumerate(chunks):
                 chunk_key = f"chunk:{file_path.split('/')[-1]}:{i}"
-                print(f"📤 Storing chunk {i} under key '{chunk_key}'...")
+                log.debug(f"📤 Storing chunk {i} under key '{chunk_key}'...")
                 await self.node.set(chunk_key, chunk)
 
-            print("✅ File split into chunks and stored successfully!")
+            log.info("✅ File split into chunks and stored successfully!")
             return len(chunks)
 
         except Exception as e:
-            print(f"❌ Failed to store file: {e}")
+            log.error(f"❌ Failed to store file: {e}")
             return None
 
     async def retrieve_chunks(self, file_name, total_chunks, output_path):
         """Retrieves all chunks of a file from the DHT and reassembles it."""
-        print(f"🔍 Retrieving file '{file_name}' in {total_chunks} chunks...")
+        log.info(f"🔍 Retrieving file '{file_name}' in {total_chunks} chunks...")
         chunks = []
 
         for i in range(total_chunks):
             chunk_key = f"chunk:{file_name}:{i}"
-            print(f"⚡ Retrieving chunk {i}...")
+            log.debug(f"⚡ Retrieving chunk {i}...")
             chunk = await self.node.get(chunk_key)
 
             if chunk:
-                print(f"✅ Chunk {i} retrieved!")
+                log.debug(f"✅ Chunk {i} retrieved!")
                 chunks.append(chunk)
             else:
-                print(f"❌ Failed to retrieve chunk {i}!")
+                log.error(f"❌ Failed to retrieve chunk {i}!")
                 return False
 
         with open(output_path, "wb") as f:
             for chunk in chunks:
                 f.write(chunk)
 
-        print(f"✅ File reassembled and saved as '{output_path}'!")
+        log.info(f"✅ File reassembled and saved as '{output_path}'!")
         return True
 
     async def stop(self):
@@ -69,9 +167,33 @@ class P2PNode:
 
 # To run standalone
 if __name__ == "__main__":
-    import sys
-    port = int(sys.argv[1])
-    bootstrap = (sys.argv[2], int(sys.argv[3])) if len(sys.argv) == 4 else None
-    node = P2PNode(port, bootstrap)
-
-    asyncio.run(node.start())
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Run one DHT node until interrupted")
+    parser.add_argument("port", type=int)
+    parser.add_argument("bootstrap_ip", nargs="?")
+    parser.add_argument("bootstrap_port", nargs="?", type=int)
+    parser.add_argument("--seeds", default="", help="extra ip:port seeds, comma separated")
+    parser.add_argument("--ksize", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--bandwidth-kbps", type=float, default=0.0, help="0 for unlimited")
+    args = parser.parse_args()
+
+    seeds = [(args.bootstrap_ip, args.bootstrap_port)] if args.bootstrap_ip else []
+    seeds += [(addr.rsplit(":", 1)[0], int(addr.rsplit(":", 1)[1])) for addr in args.seeds.split(",") if addr]
+
+    link = None
+    if args.latency_ms or args.jitter_ms or args.loss or args.bandwidth_kbps:
+        link = {"latency": args.latency_ms / 1000, "jitter": args.jitter_ms / 1000, "loss": args.loss,
+                "bandwidth": args.bandwidth_kbps * 1000 / 8 if args.bandwidth_kbps else None}
+
+    async def serve():
+        node = P2PNode(args.port, seeds or None, ksize=args.ksize, link=link)
+        await node.start()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -1,10 +1,14 @@
+import logging
+
+log = logging.getLogger(__name__)
+
 class DHT:
     def __init__(self):
         self.storage = {}
 
     def store(self, key, value):
         self.storage[key] = value
-        print(f"Stored: {key}")
+        log.debug(f"Stored: {key}")
 
     def retrieve(self, key):
         return self.storage.get(key)
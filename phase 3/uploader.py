@@ -1,11 +1,102 @@
-import time, random
+import asyncio
+import random
+from hashlib import sha256
 from random import shuffle
 
-# Shuffle the order of chunks
-all_chunks = real_chunks + dummy_chunks
-shuffle(all_chunks)
 
-for chunk in all_chunks:
-    dht.store(chunk)
-    time.sleep(random.uniform(0.1, 0.7))  # Random delay
-    
\ No newline at end of file
+class TimerWheel:
+    """Hashed timer wheel driving many sleepers from a single asyncio task.
+
+    `sleep(delay)` parks the caller in the slot for its deadline; one ticker task
+    wakes every `tick` seconds and releases everything due, so thousands of shaped
+    streams cost one timer instead of one `asyncio.sleep` each.
+    """
+
+    def __init__(self, tick=0.005, slots=512):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = 0
+        self.pending = 0
+        self._ticker = None
+
+    def sleep(self, delay):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticks = max(1, round(delay / self.tick))
+        rounds = (ticks - 1) // len(self.slots)
+        self.slots[(self.current + ticks) % len(self.slots)].append([rounds, future])
+        self.pending += 1
+        if self._ticker is None or self._ticker.done():
+            self._ticker = loop.create_task(self._run())
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.pending:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            self.current = (self.current + 1) % len(self.slots)
+            slot = self.slots[self.current]
+            waiting = []
+            for entry in slot:
+                if entry[0] > 0:
+                    entry[0] -= 1
+                    waiting.append(entry)
+                else:
+                    self.pending -= 1
+                    if not entry[1].done():
+                        entry[1].set_result(None)
+            self.slots[self.current] = waiting
+
+
+class TrafficShaper:
+    """Spreads sends across `streams` concurrent streams at `rate` sends/second.
+
+    Each stream waits a random gap before every send, uniformly drawn within
+    +/- `jitter` of its mean gap, so send times stay unpredictable while the
+    total wall-clock time is set by the target rate.
+    """
+
+    def __init__(self, rate=50.0, streams=16, jitter=0.75):
+        self.rate = rate
+        self.streams = streams
+        self.jitter = jitter
+        self.wheel = TimerWheel()
+
+    def next_gap(self):
+        mean = self.streams / self.rate
+        return random.uniform(mean * (1 - self.jitter), mean * (1 + self.jitter))
+
+    async def run(self, items, send):
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        async def stream():
+            while not queue.empty():
+                item = queue.get_nowait()
+                await self.wheel.sleep(self.next_gap())
+                result = send(item)
+                if asyncio.iscoroutine(result):
+                    await result
+
+        await asyncio.gather(*(stream() for _ in range(self.streams)))
+
+
+async def shaped_upload(dht, real_chunks, dummy_chunks, rate=50.0, streams=16, jitter=0.75):
+    """Store real and dummy chunks in shuffled order with randomized timing.
+
+    Returns the keys of the real chunks, in their original order.
+    """
+    keyed = [(sha256(chunk).hexdigest(), chunk) for chunk in real_chunks]
+    all_chunks = keyed + [(sha256(chunk).hexdigest(), chunk) for chunk in dummy_chunks]
+    shuffle(all_chunks)
+
+    shaper = TrafficShaper(rate=rate, streams=streams, jitter=jitter)
+    await shaper.run(all_chunks, lambda item: dht.store(*item))
+    return [key for key, _ in keyed]
+
+
+def upload_chunks(dht, real_chunks, dummy_chunks, **shaping):
+    return asyncio.run(shaped_upload(dht, real_chunks, dummy_chunks, **shaping))
@@ -0,0 +1,240 @@
+import asyncio
+import random
+import time
+from kademlia.crawling import NodeSpiderCrawl
+from kademlia.network import Server
+from kademlia.node import Node
+from kademlia.protocol import KademliaProtocol
+from kademlia.utils import digest
+from logging_utils import get_logger
+
+log = get_logger(__name__)
+
+
+class RepairProtocol(KademliaProtocol):
+    """Kademlia protocol plus a has_value RPC, so checking a replica costs a
+    few bytes instead of sending the whole value back like find_value does."""
+
+    def rpc_has_value(self, sender, nodeid, key):
+        self.welcome_if_new(Node(nodeid, sender[0], sender[1]))
+        return self.storage.get(key) is not None
+
+    async def call_has_value(self, node_to_ask, key):
+        address = (node_to_ask.ip, node_to_ask.port)
+        result = await self.has_value(address, self.source_node.id, key)
+        return self.handle_call_response(result, node_to_ask)
+
+
+class RepairServer(Server):
+    protocol_class = RepairProtocol
+
+
+class ByteBucket:
+    """Async token bucket in bytes per second; a big request may run the bucket into debt."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def take(self, nbytes):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens > 0:
+                self.tokens -= nbytes
+                return
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class RepairService:
+    """Keeps pinned keys at `replicas` copies on the DHT.
+
+    Each round checks the next `sample` pinned keys (the pinned set is swept
+    in shuffled order, so every key is checked once per len(keys) / sample
+    rounds). A key belongs on its `replicas` closest live nodes, the same
+    placement Kademlia uses for set(); those nodes are asked whether they hold
+    it and the ones that do not get a copy. A probe is one has_value round
+    trip; the value is fetched once, and only when a copy is missing.
+    Fetches and stores draw from one byte bucket capped at `rate` bytes/s,
+    so repair never takes more than that from foreground transfers. Nodes
+    must run RepairProtocol, which P2PNode does.
+
+    Live nodes come from a membership view of up to `view_size` nodes,
+    refreshed by `crawls` random crawls per round rather than a crawl per
+    key: crawls keep running into dead nodes that other nodes still list,
+    and each costs an RPC timeout. Nodes that fail a probe stay out of the
+    view for `dead_ttl` seconds.
+    """
+
+    def __init__(self, p2p_node, replicas=None, interval=30.0, sample=64, rate=256 * 1024,
+                 concurrency=8, view_size=256, dead_ttl=300.0, crawls=8):
+        self.server = p2p_node.node
+        self.replicas = replicas or self.server.ksize
+        self.interval = interval
+        self.sample = sample
+        self.bucket = ByteBucket(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.view_size = view_size
+        self.dead_ttl = dead_ttl
+        self.crawls = crawls
+        self.view = {}            # node id -> Node, live as far as we know
+        self.dead = {}            # node id -> time it stopped answering
+        self.pinned = {}          # manifest name -> keys
+        self._queue = []
+        self._task = None
+        self._refresh = None
+        self.stats = {"rounds": 0, "checked": 0, "under_replicated": 0, "repaired": 0,
+                      "lost": 0, "repair_bytes": 0, "last_repair": None, "last_round": {}}
+
+    def pin(self, name, keys):
+        self.pinned[name] = list(keys)
+        self._queue = []  # restart the sweep so new keys are checked soon
+
+    def unpin(self, name):
+        self.pinned.pop(name, None)
+        self._queue = []
+
+    def _next_keys(self):
+        if not self._queue:
+            self._queue = [k for keys in self.pinned.values() for k in keys]
+            random.shuffle(self._queue)
+        batch, self._queue = self._queue[:self.sample], self._queue[self.sample:]
+        return batch
+
+    async def refresh_view(self):
+        now = time.monotonic()
+        self.dead = {nid: t for nid, t in self.dead.items() if now - t < self.dead_ttl}
+        me = self.server.node
+        # A crawl only reaches the nodes nearest its target, so crawl toward
+        # this node and a few random ids, like Kademlia's bucket refresh.
+        targets = [me] + [Node(digest(random.getrandbits(160))) for _ in range(self.crawls)]
+        crawls = []
+        for target in targets:
+            nearest = self.server.protocol.router.find_neighbors(target, k=self.view_size)
+            if nearest:
+                spider = NodeSpiderCrawl(self.server.protocol, target, nearest,
+                                         self.server.ksize, self.server.alpha)
+                crawls.append(spider.find())
+        for found in await asyncio.gather(*crawls):
+            for node in found:
+                if node.id != me.id and node.id not in self.dead and len(self.view) < self.view_size:
+                    self.view[node.id] = node
+
+    def mark_dead(self, node):
+        self.view.pop(node.id, None)
+        self.dead[node.id] = time.monotonic()
+
+    def closest(self, dkey):
+        target = Node(dkey)
+        nodes = list(self.view.values()) + [self.server.node]
+        nodes.sort(key=lambda n: n.distance_to(target))
+        return nodes[:self.replicas]
+
+    async def _probe(self, peer, dkey):
+        """True if `peer` holds the key, False if not, None if it did not answer."""
+        if peer.id == self.server.node.id:
+            return self.server.storage.get(dkey) is not None
+        ok, held = await self.server.protocol.call_has_value(peer, dkey)
+        if not ok:
+            self.mark_dead(peer)
+            return None
+        return bool(held)
+
+    async def _fetch(self, key, dkey, holders):
+        """Returns (value, True if it came over the network)."""
+        value = self.server.storage.get(dkey)
+        if value is not None:
+            return value, False
+        for peer in holders:
+            if value is not None:
+                break
+            ok, reply = await self.server.protocol.call_find_value(peer, Node(dkey))
+            if ok and isinstance(reply, dict):
+                value = reply.get("value")
+        if value is None:
+            value = await self.server.get(key)  # may still live outside the closest nodes
+        return value, True
+
+    async def _store(self, peer, dkey, value):
+        if peer.id == self.server.node.id:
+            self.server.storage[dkey] = value
+            return True
+        ok, _ = await self.server.protocol.call_store(peer, dkey, value)
+        if not ok:
+            self.mark_dead(peer)
+        return ok
+
+    async def check(self, key):
+        """Returns "ok", "repaired" or "lost" for one key."""
+        dkey = digest(key)
+        # Probe the closest nodes; a node that does not answer is replaced by
+        # the next closest one.
+        while True:
+            closest = self.closest(dkey)
+            replies = await asyncio.gather(*[self._probe(peer, dkey) for peer in closest])
+            if None not in replies:
+                break
+        self.stats["checked"] += 1
+        missing = [peer for peer, held in zip(closest, replies) if not held]
+        if not missing:
+            return "ok"
+
+        self.stats["under_replicated"] += 1
+        holders = [peer for peer, held in zip(closest, replies) if held]
+        value, remote = await self._fetch(key, dkey, holders)
+        if value is None:
+            self.stats["lost"] += 1
+            log.error(f"❌ No live copy of '{key}' left to repair from")
+            return "lost"
+        # Only bytes that cross the network are charged to the bucket.
+        size = len(value)
+        if remote:
+            await self.bucket.take(size)
+        for peer in missing:
+            if peer.id != self.server.node.id:
+                await self.bucket.take(size)
+            if await self._store(peer, dkey, value):
+                self.stats["repaired"] += 1
+                self.stats["repair_bytes"] += size
+                self.stats["last_repair"] = time.monotonic()
+        return "repaired"
+
+    async def run_once(self):
+        async def guarded(key):
+            async with self.semaphore:
+                return await self.check(key)
+
+        # The first round waits for a view; later ones refresh it in the
+        # background so a crawl stuck on dead nodes does not hold up checks.
+        if not self.view:
+            await self.refresh_view()
+        elif self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self.refresh_view())
+        results = await asyncio.gather(*[guarded(k) for k in self._next_keys()])
+        self.stats["rounds"] += 1
+        self.stats["last_round"] = {status: results.count(status) for status in ("ok", "repaired", "lost")}
+        return self.stats["last_round"]
+
+    async def run_forever(self):
+        while True:
+            try:
+                result = await self.run_once()
+                if result["repaired"] or result["lost"]:
+                    log.info(f"🩹 Repair round: {result['repaired']} keys re-replicated, {result['lost']} lost")
+            except Exception as e:
+                log.warning(f"⚠️ Repair round failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run_forever())
+        return self
+
+    def stop(self):
+        for task in (self._task, self._refresh):
+            if task is not None:
+                task.cancel()
+        self._task = self._refresh = None
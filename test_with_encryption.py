@@ -6,24 +6,18 @@ import zlib
 import random
 import encryption
 from p2p_node_chunked import P2PNode
+from hedging import LatencyTracker, HedgeBudget, hedged
+from logging_utils import get_logger, Progress
+
+log = get_logger(__name__)
 
 CHUNK_SIZE = 16 * 1024  # Reduced chunk size to 16KB
 SUB_CHUNK_SIZE = 8 * 1024  # Sub-chunk size to stay within 8KB limit
 
 async def setup_nodes(num_nodes=5, base_port=8468):
     """Initialize nodes and connect them into a network."""
-    nodes = []
-    bootstrap_node = P2PNode(base_port)
-    await bootstrap_node.start()
-    nodes.append(bootstrap_node)
-
-    for i in range(1, num_nodes):
-        node = P2PNode(base_port + i, ("127.0.0.1", base_port))
-        await node.start()
-        nodes.append(node)
-
-    time.sleep(3)  # Ensure nodes have enough time to join the DHT
-    return nodes
+    # Returns once lookups show every node can be found.
+    return await P2PNode.start_cluster(num_nodes, base_port)
 
 async def store_sub_chunk_with_retry(node, key, sub_chunk, retries=3):
     """Try to store a sub-chunk with retries on different nodes."""
@@ -32,7 +26,7 @@ async def store_sub_chunk_with_retry(node, key, sub_chunk, retries=3):
             await node.node.set(key, sub_chunk)
             return True
         except Exception as e:
-            print(f"⚠️ Retry {attempt + 1}/{retries} failed to store {key}: {e}")
+            log.warning(f"⚠️ Retry {attempt + 1}/{retries} failed to store {key}: {e}")
     return False
 
 async def distribute_file(nodes, file_path, cipher):
@@ -41,7 +35,8 @@ async def distribute_file(nodes, file_path, cipher):
         file_data = file.read()
 
     num_chunks = (len(file_data) + CHUNK_SIZE - 1) // CHUNK_SIZE
-    print(f"📦 File split into {num_chunks} chunks!")
+    log.info(f"📦 File split into {num_chunks} chunks!")
+    progress = Progress(len(file_data), "📤 Storing")
 
     # Split, encrypt, compress, encode, and further split into sub-chunks
     for i in range(num_chunks):
@@ -65,64 +60,80 @@ async def distribute_file(nodes, file_path, cipher):
             sub_key = f"chunk:{file_path}:{i}:{sub_idx}"
             node = random.choice(nodes)
             if await store_sub_chunk_with_retry(node, sub_key, sub_chunk):
-                print(f"✅ Stored sub-chunk {i}-{sub_idx} on Node {nodes.index(node) + 1}")
+                log.debug(f"✅ Stored sub-chunk {i}-{sub_idx} on Node {nodes.index(node) + 1}")
             else:
-                print(f"❌ Failed to store sub-chunk {i}-{sub_idx} on Node {nodes.index(node) + 1}")
+                log.error(f"❌ Failed to store sub-chunk {i}-{sub_idx} on Node {nodes.index(node) + 1}")
+        progress.update(len(chunk_data))
 
+    progress.close()
     return num_chunks
 
-async def download_file_from_peers(nodes, file_name, total_chunks, output_path, cipher):
+async def download_file_from_peers(nodes, file_name, total_chunks, output_path, cipher, hedge_ratio=0.1):
     """Retrieve chunks from multiple nodes in parallel and reconstruct the file."""
-    print(f"⚡ Downloading file in parallel from multiple nodes...")
+    log.info(f"⚡ Downloading file in parallel from multiple nodes...")
     chunks = [None] * total_chunks
+    tracker = LatencyTracker()
+    budget = HedgeBudget(ratio=hedge_ratio)
+    progress = Progress(total_chunks * CHUNK_SIZE, "📥 Fetching")
 
-    async def fetch_chunk(i):
+    async def fetch_from(node, i):
         chunk_key = f"chunk:{file_name}:{i}"
-        print(f"🛠️ Retrieving chunk key: {chunk_key}")
+        encoded_chunk = await node.node.get(chunk_key)
+
+        # If chunk retrieval fails, try sub-chunks
+        if not encoded_chunk:
+            sub_chunks = []
+            sub_idx = 0
+            while True:
+                sub_key = f"chunk:{file_name}:{i}:{sub_idx}"
+                sub_chunk = await node.node.get(sub_key)
+                if sub_chunk:
+                    sub_chunks.append(sub_chunk)
+                    sub_idx += 1
+                else:
+                    break
+
+            if sub_chunks:
+                encoded_chunk = ''.join(sub_chunks)
+        return encoded_chunk or None
+
+    async def fetch_chunk(i):
+        log.debug(f"🛠️ Retrieving chunk key: chunk:{file_name}:{i}")
 
         for attempt in range(3):
-            random.shuffle(nodes)
-            for node in nodes:
-                encoded_chunk = await node.node.get(chunk_key)
-
-                # If chunk retrieval fails, try sub-chunks
-                if not encoded_chunk:
-                    sub_chunks = []
-                    sub_idx = 0
-                    while True:
-                        sub_key = f"chunk:{file_name}:{i}:{sub_idx}"
-                        sub_chunk = await node.node.get(sub_key)
-                        if sub_chunk:
-                            sub_chunks.append(sub_chunk)
-                            sub_idx += 1
-                        else:
-                            break
-
-                    if sub_chunks:
-                        encoded_chunk = ''.join(sub_chunks)
-
-                if encoded_chunk:
-                    compressed_chunk = base64.b64decode(encoded_chunk)
-                    encrypted_chunk = zlib.decompress(compressed_chunk)
-                    chunk_data = encryption.decrypt_chunk(cipher, encrypted_chunk)
-                    print(f"✅ Chunk {i} retrieved from Node {nodes.index(node) + 1} on attempt {attempt + 1}")
-                    chunks[i] = chunk_data
-                    return
-        print(f"❌ Failed to retrieve chunk {i} after retries.")
+            # Each node is one attempt; a slow node gets hedged to the next one.
+            order = random.sample(nodes, len(nodes))
+            encoded_chunk = await hedged([lambda n=n: fetch_from(n, i) for n in order], tracker, budget)
+            if encoded_chunk:
+                compressed_chunk = base64.b64decode(encoded_chunk)
+                encrypted_chunk = zlib.decompress(compressed_chunk)
+                chunk_data = encryption.decrypt_chunk(cipher, encrypted_chunk)
+                log.debug(f"✅ Chunk {i} retrieved on attempt {attempt + 1}")
+                chunks[i] = chunk_data
+                progress.update(len(chunk_data))
+                return
+        log.error(f"❌ Failed to retrieve chunk {i} after retries.")
 
     # Fetch all chunks in parallel
+    start = time.perf_counter()
     await asyncio.gather(*[fetch_chunk(i) for i in range(total_chunks)])
+    total = time.perf_counter() - start
+    progress.close()
+    latency = tracker.summary()
+    log.info(f"⏱️ Chunk latency p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms, "
+             f"p99 {latency['p99'] * 1000:.1f} ms; total {total:.2f}s")
+    log.info(f"🪁 Hedged requests: {budget.hedges} extra of {budget.primary} ({budget.wins} won)")
 
     # Check if all chunks were retrieved
     if None in chunks:
-        print("❌ Not all chunks were retrieved.")
+        log.error("❌ Not all chunks were retrieved.")
         return False
 
     with open(output_path, "wb") as f:
         for chunk in chunks:
             f.write(chunk)
 
-    print(f"✅ File reassembled and saved as '{output_path}'!")
+    log.info(f"✅ File reassembled and saved as '{output_path}'!")
     return True
 
 async def run_chunked_file_sharing_test():
@@ -161,9 +172,9 @@ distributed across nodes, and then retrieved, reassembled, and decrypted.
         # Verify file integrity
         with open(file_path, "rb") as original, open(output_path, "rb") as downloaded:
             assert original.read() == downloaded.read(), "❌ File content mismatch!"
-        print("✅ Test passed: File retrieved successfully and content matches!")
+        log.info("✅ Test passed: File retrieved successfully and content matches!")
     else:
-        print("❌ Test failed: Not all chunks were retrieved.")
+        log.error("❌ Test failed: Not all chunks were retrieved.")
 
     # Shut down nodes
     for node in nodes: